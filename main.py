@@ -3,6 +3,7 @@ import logging
 import os
 import multiprocessing
 import subprocess
+import sys
 from monitor.schedule_runner import run_schedule, run_once
 
 
@@ -32,8 +33,9 @@ def run_strategy(cfg):
 def run_web(cfg):
     """启动 Web 服务"""
     if cfg["web"].get("enabled", False):
+        # 以模块方式运行，web 进程可直接 import monitor（消息总线）
         subprocess.run([
-            "python", "web/server.py"
+            sys.executable, "-m", "web.server"
         ])
 
 
@@ -0,0 +1,478 @@
+# monitor/backtest.py
+"""
+历史回测：把存量K线按时间回放，走与实盘相同的投票、多周期确认、冷却与风控逻辑。
+  - 每个时间点的窗口与实盘一致（最近 kline_num 根，2h/4h 同样按交易时段合并、丢弃窗口首个不完整的组）
+  - 指标信号对所有时间点的窗口一次性批量计算（滑动窗口 + 批量引擎），不逐点调用实盘函数
+  - 信号与权重/阈值无关，prepare 一次后可用不同 cfg 反复 run（参数扫描）
+日线在 60m 时间轴上只使用上一个交易日及之前已收盘的日K，避免用到未来数据。
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from futu import *
+
+from .bar_archive import BarArchive
+from .batch import batch_indicator_signals
+from .kline_fetch import PERIOD_KLTYPE
+from .resample import PERIOD_MINUTES, bucket_keys, group_starts
+from .risk import RiskManager
+from .trend import VOTE_ORDER, _tally_votes, score_period, aggregate_multiperiod, decide_priority
+
+# 预计算时打开全部指标，run 时再按 cfg["indicators"] 取舍
+_ALL_INDICATORS = {key: True for key, _ in VOTE_ORDER}
+_CHUNK = 1024          # 批量引擎每批窗口数，控制内存
+_MIN_SERIES = 50       # 与 period_series 里 _series_ok 的 min_len 一致
+_LABELS = {1: "买入", -1: "卖出"}
+
+# ---------- 数据准备 ----------
+
+def _frame_arrays(df):
+    """
+    K线 DataFrame → (times[ns], close, turnover 或 None)，按时间排序
+    也接受 BarArchive.read 的列 dict（已按时间排序，直接取数组，不解析时间字符串）
+    """
+    if isinstance(df, dict):
+        times = np.asarray(df["time"], dtype=np.int64).astype("datetime64[ns]")
+        turnover = np.array(df["turnover"], dtype=float) if "turnover" in df else None
+        return times, np.array(df["close"], dtype=float), turnover
+    df = df.sort_values("time_key").reset_index(drop=True)
+    times = pd.to_datetime(df["time_key"]).to_numpy(dtype="datetime64[ns]")
+    close = df["close"].to_numpy(dtype=float, copy=True)
+    turnover = df["turnover"].to_numpy(dtype=float, copy=True) if "turnover" in df.columns else None
+    return times, close, turnover
+
+def _encode(labels):
+    codes = np.zeros(len(labels), dtype=np.int8)
+    codes[labels == "买入"] = 1
+    codes[labels == "卖出"] = -1
+    return codes
+
+def _window_groups(times, close, turnover, code, minutes, kline_num):
+    """
+    每个窗口（以第 j 根结尾的 kline_num 根）合并后的序列，与 resample_frame(..., drop_first=True) 相同：
+      窗口内第一组丢弃，中间为完整的组，最后一组截到第 j 根（形成中）
+    返回 [(窗口下标数组, close 矩阵, turnover 矩阵或 None), ...]，按合并后长度分组
+    """
+    n = len(close)
+    starts = group_starts(bucket_keys(times, code, minutes))
+    gid = np.zeros(n, dtype=np.int64)
+    gid[starts[1:]] = 1
+    gid = np.cumsum(gid)
+    ends = np.append(starts[1:], n) - 1
+    gclose = close[ends]
+    gturn = partial = None
+    if turnover is not None:
+        padded = np.append(turnover, 0.0)
+        gturn = np.add.reduceat(padded, starts)
+        # 每根K线所在组从组首到该根的成交额：(组首, 该根+1) 成对交给 reduceat，与实盘对切片求和同一路径
+        pairs = np.empty(2 * n, dtype=np.int64)
+        pairs[0::2] = starts[gid]
+        pairs[1::2] = np.arange(1, n + 1)
+        partial = np.add.reduceat(padded, pairs)[0::2]
+
+    j = np.arange(kline_num - 1, n)
+    first = gid[j - kline_num + 1] + 1
+    last = gid[j]
+    lengths = last - first + 1
+    out = []
+    for length in np.unique(lengths):
+        if length <= 0:
+            continue
+        sel = np.flatnonzero(lengths == length)
+        idx = first[sel][:, None] + np.arange(length)
+        C = gclose[idx]
+        C[:, -1] = close[j[sel]]
+        T = None
+        if turnover is not None:
+            T = gturn[idx]
+            T[:, -1] = partial[j[sel]]
+        out.append((sel, C, T))
+    return out
+
+def _volume_factors(T):
+    """批量 _volume_factor：最后一列 / 前 19 列均值（NaN 不计）"""
+    factor = np.full(len(T), np.nan)
+    if T.shape[1] >= 20:
+        prev = T[:, -20:-1]
+        counts = (~np.isnan(prev)).sum(axis=1)
+        sums = np.nansum(prev, axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            base = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+            ok = base > 0
+            factor[ok] = T[ok, -1] / base[ok]
+    return factor
+
+class PreparedPeriod:
+    """
+    一个 (code, period) 在每根基础K线（窗口满 kline_num 根之后）上的预计算结果，
+    第 i 项对应基础K线下标 i + kline_num - 1
+    times/code: 2h/4h 按交易时段合并时需要（K线结束时间、所属市场）
+    """
+
+    def __init__(self, close, turnover, period_label, kline_num, times=None, code=None):
+        self.period = period_label
+        W = sliding_window_view(close, kline_num)
+        self.valid = (~np.isnan(W).any(axis=1)) & (kline_num >= _MIN_SERIES)
+        nw = len(W)
+
+        minutes = PERIOD_MINUTES.get(period_label)
+        if minutes is None:
+            groups = [(np.arange(nw), W, sliding_window_view(turnover, kline_num) if turnover is not None else None)]
+        else:
+            if times is None:
+                raise ValueError(f"{period_label} 需要K线时间才能按交易时段合并")
+            groups = _window_groups(times, close, turnover, code, minutes, kline_num)
+            covered = np.zeros(nw, dtype=bool)
+            for sel, _, _ in groups:
+                covered[sel] = True
+            self.valid &= covered
+
+        self.last_close = np.full(nw, np.nan)
+        self.last_turnover = None
+        self.factor = None
+        if turnover is not None:
+            self.last_turnover = np.full(nw, np.nan)
+            self.factor = np.full(nw, np.nan)
+
+        # 信号按 1=买入 / -1=卖出 / 0=其他 编成 int8（FFT 的 dict 在 _tally_votes 里本就不计票，记 0）
+        self.names = []
+        self.codes = np.zeros((0, nw), dtype=np.int8)
+        for sel, C, T in groups:
+            self.last_close[sel] = C[:, -1]
+            if T is not None:
+                self.last_turnover[sel] = T[:, -1]
+                self.factor[sel] = _volume_factors(T)
+            for start in range(0, len(C), _CHUNK):
+                part = batch_indicator_signals(C[start:start + _CHUNK], _ALL_INDICATORS)
+                if not self.names:
+                    self.names = list(part)
+                    self.codes = np.zeros((len(self.names), nw), dtype=np.int8)
+                self.codes[:, sel[start:start + _CHUNK]] = np.stack([_encode(part[name]) for name in self.names])
+
+    def __len__(self):
+        return len(self.valid)
+
+    # ---------- 导出为纯数组（参数扫描放进共享内存） ----------
+
+    def arrays(self):
+        out = {"valid": self.valid, "last_close": self.last_close, "codes": self.codes}
+        if self.last_turnover is not None:
+            out["last_turnover"] = self.last_turnover
+            out["factor"] = self.factor
+        return out
+
+    def meta(self):
+        return {"period": self.period, "names": self.names}
+
+    @classmethod
+    def from_arrays(cls, meta, arrays):
+        obj = cls.__new__(cls)
+        obj.period, obj.names = meta["period"], list(meta["names"])
+        obj.valid, obj.last_close, obj.codes = arrays["valid"], arrays["last_close"], arrays["codes"]
+        obj.last_turnover = arrays.get("last_turnover")
+        obj.factor = arrays.get("factor")
+        return obj
+
+    def results(self, cfg):
+        """按 cfg 计票/过滤/计分，返回 object 数组（单周期结果或 None）"""
+        out = np.full(len(self), None, dtype=object)
+        mask = self.valid & (self.last_close >= cfg["filters"]["min_price"])
+        if self.last_turnover is not None:
+            # 与 evaluate_period 一致：NaN 成交额不被过滤
+            mask &= ~(self.last_turnover < cfg["filters"]["min_turnover"])
+        # 一票都没有时买卖票数相等，score_period 必然返回 None，直接跳过
+        mask &= (self.codes != 0).any(axis=0)
+        ind, weights = cfg["indicators"], cfg["weights"]
+        for i in np.flatnonzero(mask):
+            signals = {name: _LABELS.get(int(c)) for name, c in zip(self.names, self.codes[:, i])}
+            votes = _tally_votes(signals, ind, weights)
+            factor = None
+            if self.factor is not None and not np.isnan(self.factor[i]):
+                factor = float(self.factor[i])
+            out[i] = score_period(votes, factor, self.period, cfg)
+        return out
+
+class PreparedCode:
+    """单个标的：驱动时间轴（最细的K线类型）+ 各周期的预计算结果"""
+
+    def __init__(self, code, frames, periods, kline_num):
+        self.code = code
+        self.kline_num = kline_num
+        self.periods = list(periods)
+        kl_types = {PERIOD_KLTYPE[p] for p in periods}
+        self.driver = KLType.K_60M if KLType.K_60M in kl_types else KLType.K_DAY
+
+        arrays = {kl: _frame_arrays(frames[kl]) for kl in kl_types if kl in frames}
+        if self.driver not in arrays:
+            raise ValueError(f"{code} 缺少 {self.driver} K线")
+        self.times, self.close, _ = arrays[self.driver]
+        self.prepared = {}
+        self.kl_times = {}
+        for p in periods:
+            kl = PERIOD_KLTYPE[p]
+            if kl not in arrays or len(arrays[kl][1]) < kline_num:
+                continue
+            times, close, turnover = arrays[kl]
+            self.kl_times[kl] = times
+            self.prepared[p] = PreparedPeriod(close, turnover, p, kline_num, times=times, code=code)
+
+    def arrays(self):
+        """所有 numpy 数组（键形如 "times"、"1h/codes"），与 meta() 一起可还原对象"""
+        out = {"times": self.times, "close": self.close}
+        for kl, times in self.kl_times.items():
+            out[f"kl_times/{kl}"] = times
+        for p, pp in self.prepared.items():
+            for key, arr in pp.arrays().items():
+                out[f"{p}/{key}"] = arr
+        return out
+
+    def meta(self):
+        return {
+            "code": self.code, "kline_num": self.kline_num, "periods": self.periods,
+            "driver": self.driver, "prepared": {p: pp.meta() for p, pp in self.prepared.items()},
+        }
+
+    @classmethod
+    def from_arrays(cls, meta, arrays):
+        obj = cls.__new__(cls)
+        obj.code, obj.kline_num, obj.driver = meta["code"], meta["kline_num"], meta["driver"]
+        obj.periods = list(meta["periods"])
+        obj.times, obj.close = arrays["times"], arrays["close"]
+        obj.kl_times = {key.split("/", 1)[1]: arr for key, arr in arrays.items() if key.startswith("kl_times/")}
+        obj.prepared = {}
+        for p, pmeta in meta["prepared"].items():
+            sub = {key.split("/", 1)[1]: arr for key, arr in arrays.items() if key.startswith(f"{p}/")}
+            obj.prepared[p] = PreparedPeriod.from_arrays(pmeta, sub)
+        return obj
+
+    def step_index(self, p):
+        """
+        驱动K线每一根 → 该周期预计算数组的下标（-1 表示尚无结果）
+        同类型：直接对应；日线挂到 60m 上：取上一个交易日（含）之前的最后一根日K
+        """
+        n = len(self.times)
+        if p not in self.prepared:
+            return np.full(n, -1)
+        kl = PERIOD_KLTYPE[p]
+        if kl == self.driver:
+            idx = np.arange(n) - (self.kline_num - 1)
+        else:
+            days = self.kl_times[kl].astype("datetime64[D]")
+            pos = np.searchsorted(days, self.times.astype("datetime64[D]"), side="left") - 1
+            idx = pos - (self.kline_num - 1)
+        idx[idx < 0] = -1
+        return idx
+
+def prepare(bars, cfg):
+    """
+    bars: { code: { KLType: DataFrame(time_key, close, turnover, ...) } }
+    返回 { code: PreparedCode }，与权重/阈值无关，可供多次 run
+    """
+    prepared = {}
+    for code, frames in bars.items():
+        try:
+            prepared[code] = PreparedCode(code, frames, cfg["periods"], cfg["kline_num"])
+        except ValueError as e:
+            logging.warning(f"[回测] 跳过 {e}")
+    return prepared
+
+# ---------- 回放 ----------
+
+class BacktestResult:
+    def __init__(self, signals, trades, stats):
+        self.signals = signals   # DataFrame：每条信号
+        self.trades = trades     # DataFrame：买入→卖出的完整交易
+        self.stats = stats       # dict：命中率/收益统计
+
+    def summary(self):
+        st = self.stats
+        lines = [f"信号 {st['signals']} 条，交易 {st['trades']} 笔，胜率 {st['win_rate']:.2%}，"
+                 f"平均收益 {st['avg_pnl']:.2%}，累计收益 {st['total_return']:.2%}"]
+        for action, by_h in st["hit_rate"].items():
+            parts = [f"{h}根 {v['hit_rate']:.2%}/{v['mean_return']:.2%}" for h, v in by_h.items()]
+            lines.append(f"  {action} 命中率/平均收益: " + "，".join(parts))
+        return "\n".join(lines)
+
+def run(prepared, cfg, horizons=(1, 5, 20), trade_priorities=("高",)):
+    """
+    按时间顺序回放所有标的：多周期汇总 → 持仓方向过滤 → 风控 → 冷却 → 优先级
+    trade_priorities: 哪些优先级的信号实际开平仓（实盘只推送“高”）
+    """
+    confirm = cfg["indicators"].get("confirm_level", 2)
+    cool_ns = int(cfg["signal"]["cooldown_minutes"] * 60 * 1e9)
+    risk = RiskManager(cfg)
+
+    # 每个标的每个周期的结果，以及在驱动时间轴上的下标
+    per_code = {}
+    events = []
+    for code, pc in prepared.items():
+        results = {p: pp.results(cfg) for p, pp in pc.prepared.items()}
+        index = {p: pc.step_index(p) for p in pc.periods}
+        per_code[code] = (pc, results, index)
+        events.append(pd.DataFrame({"t": pc.times.astype("int64"), "code": code, "s": np.arange(len(pc.times))}))
+    if not events:
+        return BacktestResult(pd.DataFrame(), pd.DataFrame(), _stats(pd.DataFrame(), pd.DataFrame(), horizons))
+    timeline = pd.concat(events, ignore_index=True).sort_values(["t", "code"], kind="stable")
+
+    last_signal = {}     # (code, action) -> t，冷却用
+    entries = {}         # code -> (t, price)
+    signal_rows, trade_rows = [], []
+
+    for t, code, s in zip(timeline["t"].to_numpy(), timeline["code"].to_numpy(), timeline["s"].to_numpy()):
+        pc, results, index = per_code[code]
+        period_results = []
+        for p in pc.periods:
+            i = index[p][s]
+            if i >= 0 and results[p][i]:
+                period_results.append(results[p][i])
+
+        price = float(pc.close[s])
+        holding = code in entries
+        if holding:
+            risk.update_position(code, entries[code][1], 1, price)
+
+        final, score, used, sources, _ = aggregate_multiperiod(period_results, confirm)
+        # 持仓方向过滤：无仓只做买入，有仓只做卖出
+        if final and ((holding and final != "卖出") or ((not holding) and final != "买入")):
+            final = None
+
+        forced = False
+        if holding:
+            checked = risk.check_risk(code, final)
+            forced = (checked == "卖出" and final != "卖出")
+            final = checked
+        elif final:
+            final = risk.check_risk(code, final)
+        if not final:
+            continue
+
+        if forced:
+            priority, score, used, sources = "风控", 0, set(), ["RISK"]
+        else:
+            last = last_signal.get((code, final))
+            if last is not None and t - last < cool_ns:
+                continue
+            last_signal[(code, final)] = t
+            priority = decide_priority(score, used, cfg)
+
+        row = {
+            "time": pd.Timestamp(t), "code": code, "action": final, "score": score,
+            "priority": priority, "periods": ",".join(sorted(used)), "sources": sorted(sources),
+            "price": price,
+        }
+        for h in horizons:
+            row[f"ret_{h}"] = (float(pc.close[s + h]) / price - 1.0) if s + h < len(pc.close) else np.nan
+        signal_rows.append(row)
+
+        if not (forced or priority in trade_priorities):
+            continue
+        if final == "买入":
+            entries[code] = (t, price)
+        else:
+            t0, entry = entries.pop(code)
+            risk.positions.pop(code, None)
+            trade_rows.append({"code": code, "entry_time": pd.Timestamp(t0), "exit_time": pd.Timestamp(t),
+                               "entry": entry, "exit": price, "pnl": price / entry - 1.0,
+                               "exit_reason": "风控" if forced else "信号"})
+
+    # 期末未平仓按最后价格计
+    for code, (t0, entry) in entries.items():
+        pc = per_code[code][0]
+        last = float(pc.close[-1])
+        trade_rows.append({"code": code, "entry_time": pd.Timestamp(t0), "exit_time": pd.Timestamp(pc.times[-1]),
+                           "entry": entry, "exit": last, "pnl": last / entry - 1.0, "exit_reason": "期末"})
+
+    signals = pd.DataFrame(signal_rows)
+    trades = pd.DataFrame(trade_rows)
+    return BacktestResult(signals, trades, _stats(signals, trades, horizons))
+
+# ---------- 统计 ----------
+
+def _hit_table(df, horizons):
+    out = {}
+    for action, sign in (("买入", 1.0), ("卖出", -1.0)):
+        sub = df[df["action"] == action] if len(df) else df
+        by_h = {}
+        for h in horizons:
+            rets = sub[f"ret_{h}"].dropna() if len(sub) else pd.Series(dtype=float)
+            by_h[h] = {
+                "count": int(len(rets)),
+                "hit_rate": float((np.sign(rets) == sign).mean()) if len(rets) else 0.0,
+                "mean_return": float(rets.mean()) if len(rets) else 0.0,
+            }
+        out[action] = by_h
+    return out
+
+def _stats(signals, trades, horizons):
+    stats = {
+        "signals": int(len(signals)),
+        "trades": int(len(trades)),
+        "win_rate": float((trades["pnl"] > 0).mean()) if len(trades) else 0.0,
+        "avg_pnl": float(trades["pnl"].mean()) if len(trades) else 0.0,
+        "total_return": float(np.prod(1.0 + trades["pnl"].to_numpy()) - 1.0) if len(trades) else 0.0,
+        "hit_rate": _hit_table(signals, horizons),
+        "by_source": {},
+    }
+    if len(signals):
+        exploded = signals.explode("sources")
+        for src, sub in exploded.groupby("sources"):
+            stats["by_source"][src] = _hit_table(sub, horizons)
+    return stats
+
+# ---------- 命令行 ----------
+
+def load_bars_dir(path):
+    """目录下的 <code>.<KLType>.csv，如 HK.00700.K_60M.csv"""
+    bars = {}
+    for f in sorted(glob.glob(os.path.join(path, "*.csv"))):
+        name = os.path.basename(f)[:-4]
+        code, kl = name.rsplit(".", 1)
+        bars.setdefault(code, {})[kl] = pd.read_csv(f)
+    return bars
+
+def load_bars_archive(archive, codes=None, kl_types=(KLType.K_60M, KLType.K_DAY), start=None, end=None):
+    """从 BarArchive 取（memmap 切片，不整文件读入）；codes 为 None 时取归档里的全部标的"""
+    bars = {}
+    for code in (codes if codes is not None else archive.codes()):
+        for kl in kl_types:
+            cols = archive.read(code, kl, start, end, columns=("close", "turnover"))
+            if cols is not None and len(cols["time"]):
+                bars.setdefault(code, {})[kl] = cols
+    return bars
+
+def add_data_args(ap):
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--data", help="K线 CSV 目录（<code>.<KLType>.csv）")
+    src.add_argument("--archive", help="BarArchive 根目录（如 data/bars）")
+    ap.add_argument("--start", default=None, help="只用该时间之后的K线（仅 --archive）")
+    ap.add_argument("--end", default=None, help="只用该时间之前的K线（仅 --archive）")
+
+def load_bars_args(args):
+    if args.archive:
+        return load_bars_archive(BarArchive(args.archive), start=args.start, end=args.end)
+    return load_bars_dir(args.data)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="用历史K线回放实盘信号逻辑")
+    add_data_args(ap)
+    ap.add_argument("--config", default="config.json")
+    ap.add_argument("--out", default="data/backtest")
+    args = ap.parse_args(argv)
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    result = run(prepare(load_bars_args(args), cfg), cfg)
+    os.makedirs(args.out, exist_ok=True)
+    result.signals.to_csv(os.path.join(args.out, "signals.csv"), index=False)
+    result.trades.to_csv(os.path.join(args.out, "trades.csv"), index=False)
+    print(result.summary())
+
+if __name__ == "__main__":
+    main()
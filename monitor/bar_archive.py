@@ -0,0 +1,170 @@
+# monitor/bar_archive.py
+"""
+本地K线归档：按 (code, KLType) 分目录，每列一个定长二进制文件
+  <root>/<code>/<KLType>/time.i8      int64，time_key 的纳秒时间戳（升序，即时间索引）
+  <root>/<code>/<KLType>/close.f8 ... float64，open/high/low/close/volume/turnover
+  - 追加写：只写比已有最后一根更新的K线；与最后一根同一时间的（形成中的K线）原地覆盖
+  - 读：np.memmap 映射 + 时间列二分查找，切片不解析、不整文件读入
+  - 各列文件长度以最短的为准，写一半中断的尾巴下次追加前截掉
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ("open", "high", "low", "close", "volume", "turnover")
+TIME_FILE = "time.i8"
+
+
+def _col_file(col):
+    return f"{col}.f8"
+
+
+def to_ns(time_keys):
+    """time_key 字符串 → int64 纳秒"""
+    return pd.to_datetime(pd.Series(time_keys)).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+
+
+def from_ns(ns):
+    return pd.to_datetime(np.asarray(ns, dtype=np.int64)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class BarArchive:
+    def __init__(self, root):
+        self.root = root
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self.appended = 0      # 累计新增的K线数
+        self.overwritten = 0   # 累计覆盖（形成中K线更新）的次数
+
+    def _dir(self, code, kl_type):
+        return os.path.join(self.root, code, str(kl_type))
+
+    def _lock(self, code, kl_type):
+        key = (code, str(kl_type))
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _paths(self, d):
+        return [os.path.join(d, TIME_FILE)] + [os.path.join(d, _col_file(c)) for c in COLUMNS]
+
+    def _count(self, d):
+        sizes = [os.path.getsize(p) if os.path.exists(p) else 0 for p in self._paths(d)]
+        return min(sizes) // 8
+
+    def count(self, code, kl_type):
+        return self._count(self._dir(code, kl_type))
+
+    def codes(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(c for c in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, c)))
+
+    # ---------- 写 ----------
+
+    def _last_time(self, d, n):
+        if n == 0:
+            return None
+        tmap = np.memmap(os.path.join(d, TIME_FILE), dtype=np.int64, mode="r", shape=(n,))
+        last = int(tmap[-1])
+        del tmap
+        return last
+
+    def append(self, code, kl_type, df):
+        """df: 至少含 time_key、close；返回新增的K线数（覆盖最后一根不计）"""
+        if df is None or df.empty:
+            return 0
+        d = self._dir(code, kl_type)
+        with self._lock(code, kl_type):
+            os.makedirs(d, exist_ok=True)
+            n = self._count(d)
+            for p in self._paths(d):
+                if os.path.exists(p) and os.path.getsize(p) > n * 8:
+                    os.truncate(p, n * 8)
+            last = self._last_time(d, n)
+            if last is not None:
+                # 每轮拉到的 400 根大多已归档：先按字符串比较筛掉，只解析最后一根及之后的时间
+                df = df[df["time_key"].astype(str) >= from_ns([last])[0]]
+                if df.empty:
+                    return 0
+
+            times = to_ns(df["time_key"])
+            order = np.argsort(times, kind="stable")
+            times = times[order]
+            values = {
+                c: (df[c].to_numpy(dtype=float)[order] if c in df.columns else np.full(len(df), np.nan))
+                for c in COLUMNS
+            }
+
+            new = np.ones(len(times), dtype=bool)
+            if last is not None:
+                same = np.flatnonzero(times == last)
+                if len(same):
+                    i = same[-1]
+                    for c in COLUMNS:
+                        m = np.memmap(os.path.join(d, _col_file(c)), dtype=np.float64, mode="r+", shape=(n,))
+                        m[-1] = values[c][i]
+                        m.flush()
+                        del m
+                    self.overwritten += 1
+                new = times > last
+            added = int(new.sum())
+            if added:
+                # 先写数据列，最后写时间列：中断时时间列最短，按最短长度读不会读到半行
+                for c in COLUMNS:
+                    with open(os.path.join(d, _col_file(c)), "ab") as f:
+                        f.write(values[c][new].astype("<f8").tobytes())
+                with open(os.path.join(d, TIME_FILE), "ab") as f:
+                    f.write(times[new].astype("<i8").tobytes())
+                self.appended += added
+        return added
+
+    # ---------- 读 ----------
+
+    def read(self, code, kl_type, start=None, end=None, columns=COLUMNS, count=None):
+        """
+        返回 {"time": int64 数组, 列名: float64 数组}，均为 memmap 切片（只读、零拷贝）
+        start/end: time_key 字符串或 pandas 可解析的时间，闭区间；count: 只取区间内最近的 count 根；无数据返回 None
+        """
+        d = self._dir(code, kl_type)
+        n = self._count(d)
+        if n == 0:
+            return None
+        tmap = np.memmap(os.path.join(d, TIME_FILE), dtype=np.int64, mode="r", shape=(n,))
+        lo = int(np.searchsorted(tmap, to_ns([start])[0], side="left")) if start is not None else 0
+        hi = int(np.searchsorted(tmap, to_ns([end])[0], side="right")) if end is not None else n
+        if count is not None:
+            lo = max(lo, hi - count)
+        out = {"time": tmap[lo:hi]}
+        for c in columns:
+            out[c] = np.memmap(os.path.join(d, _col_file(c)), dtype=np.float64, mode="r", shape=(n,))[lo:hi]
+        return out
+
+    def tail(self, code, kl_type, num, columns=COLUMNS):
+        """最近 num 根"""
+        d = self._dir(code, kl_type)
+        n = self._count(d)
+        if n == 0:
+            return None
+        lo = max(n - num, 0)
+        out = {"time": np.memmap(os.path.join(d, TIME_FILE), dtype=np.int64, mode="r", shape=(n,))[lo:]}
+        for c in columns:
+            out[c] = np.memmap(os.path.join(d, _col_file(c)), dtype=np.float64, mode="r", shape=(n,))[lo:]
+        return out
+
+    def first_time(self, code, kl_type):
+        """归档里最早一根的 time_key；没有数据返回 None"""
+        cols = self.read(code, kl_type, columns=())
+        return None if cols is None else from_ns(cols["time"][:1])[0]
+
+    def frame(self, code, kl_type, start=None, end=None, count=None):
+        """区间切片转成与 get_cur_kline 同列名的 DataFrame（只拷贝切片部分）"""
+        cols = self.read(code, kl_type, start, end, count=count)
+        if cols is None:
+            return pd.DataFrame(columns=["code", "time_key", *COLUMNS])
+        df = pd.DataFrame({c: np.array(cols[c]) for c in COLUMNS})
+        df.insert(0, "time_key", from_ns(cols["time"]))
+        df.insert(0, "code", code)
+        return df
@@ -0,0 +1,244 @@
+# monitor/batch.py
+"""
+批量指标引擎：对 (标的 × K线) 的收盘价矩阵一次性计算全部指标与投票。
+每行结果与 trend._indicator_votes 对单个序列的结果一致（talib 的 EMA/Wilder 初值口径相同）。
+SMA 按 talib 的滑动和逐根递推（加新减旧），不能用窗口 .mean()：
+价格按最小变动价位取整时均线常常正好相等，两种求和顺序舍入不同会让交叉判断翻转。
+BBANDS 的标准差口径随 talib 版本不同，向量化结果只用于明确的行，贴着轨道的行逐行交给 talib。
+"""
+
+import numpy as np
+import talib
+from scipy.signal import lfilter
+
+from .trend import _tally_votes, evaluate_period
+from .trend_math import fft_lowpass, rolling_slope, wavelet_lowpass
+
+# ---------- 递推均线（按行向量化） ----------
+
+def _ema_rows(X, period, start=0):
+    """
+    talib 口径的 EMA：在 start+period-1 处以 SMA 为初值，之后 a*x + (1-a)*prev
+    X: (n, m)，返回 (n, m)，初值之前为 NaN
+    """
+    n, m = X.shape
+    out = np.full((n, m), np.nan)
+    seed_idx = start + period - 1
+    if m <= seed_idx:
+        return out
+    a = 2.0 / (period + 1)
+    seed = X[:, start:seed_idx + 1].mean(axis=1)
+    out[:, seed_idx] = seed
+    if m > seed_idx + 1:
+        out[:, seed_idx + 1:], _ = lfilter([a], [1.0, -(1.0 - a)], X[:, seed_idx + 1:], axis=1,
+                                           zi=((1.0 - a) * seed)[:, None])
+    return out
+
+def _wilder_rows(G, period):
+    """Wilder 平滑：前 period 个求均值为初值，之后 (prev*(p-1) + g)/p"""
+    n, m = G.shape
+    out = np.full((n, m), np.nan)
+    if m < period:
+        return out
+    seed = G[:, :period].mean(axis=1)
+    out[:, period - 1] = seed
+    if m > period:
+        k = (period - 1.0) / period
+        out[:, period:], _ = lfilter([1.0 / period], [1.0, -k], G[:, period:], axis=1, zi=(k * seed)[:, None])
+    return out
+
+def _running_sum_last2(X, period):
+    """talib 滑动和口径：先累加前 period-1 根，之后每根 加新 → 取值 → 减旧；返回最后两根的窗口和 (n, 2)"""
+    n, m = X.shape
+    total = np.zeros(n)
+    sums = []
+    for k in range(m):
+        total += X[:, k]
+        if k >= period - 1:
+            if k >= m - 2:
+                sums.append(total.copy())
+            total -= X[:, k - period + 1]
+    return np.stack(sums, axis=1)
+
+# ---------- 各指标的最后两根 ----------
+
+def _cross_rows(fast, slow):
+    """fast/slow: (n, 2)，返回 (buy_mask, sell_mask)"""
+    buy = (fast[:, 1] > slow[:, 1]) & (fast[:, 0] <= slow[:, 0])
+    sell = (fast[:, 1] < slow[:, 1]) & (fast[:, 0] >= slow[:, 0])
+    return buy, sell
+
+def _sma_last2(X, period):
+    return _running_sum_last2(X, period) / period
+
+def _ma_rows(X):
+    return _cross_rows(_sma_last2(X, 5), _sma_last2(X, 20))
+
+def _macd_rows(X):
+    fast = _ema_rows(X, 12, start=26 - 12)      # talib: 快线与慢线同一处开始
+    slow = _ema_rows(X, 26)
+    macd = fast - slow
+    sig = _ema_rows(np.nan_to_num(macd[:, 25:]), 9)
+    return _cross_rows(macd[:, -2:], sig[:, -2:])
+
+def _rsi_rows(X):
+    d = np.diff(X, axis=1)
+    gain = _wilder_rows(np.maximum(d, 0.0), 14)[:, -2:]
+    loss = _wilder_rows(np.maximum(-d, 0.0), 14)[:, -2:]
+    total = gain + loss
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rsi = np.where(total > 0, 100.0 * gain / total, 0.0)
+    buy = (rsi[:, 1] < 30) & (30 <= rsi[:, 0])
+    sell = (rsi[:, 1] > 70) & (70 >= rsi[:, 0])
+    return buy, sell
+
+def _boll_rows(X):
+    m = X.shape[1]
+    mid = _sma_last2(X, 20)
+    std = np.stack([X[:, m - 21:m - 1].std(axis=1), X[:, m - 20:].std(axis=1)], axis=1)
+    up, low = mid + 2 * std, mid - 2 * std
+    c = X[:, -2:]
+    # 收盘价与轨道之差在舍入误差内的行，按 talib 本身的结果判断
+    tol = 1e-9 * np.abs(c)
+    near = ((np.abs(c - up) <= tol) | (np.abs(c - low) <= tol)).any(axis=1)
+    for i in np.flatnonzero(near):
+        up_i, _, low_i = talib.BBANDS(X[i], timeperiod=20, nbdevup=2, nbdevdn=2)
+        up[i], low[i] = up_i[-2:], low_i[-2:]
+    buy = (c[:, 1] > low[:, 1]) & (c[:, 0] <= low[:, 0])
+    sell = (c[:, 1] < up[:, 1]) & (c[:, 0] >= up[:, 0])
+    return buy, sell
+
+def _smooth_cross_rows(X, smooth):
+    c, s = X[:, -2:], smooth[:, -2:]
+    return _cross_rows(c, s)
+
+def _fft_smooth_rows(X, keep):
+    return fft_lowpass(X, keep, axis=1)
+
+def _wavelet_smooth_rows(X, wavelet, level):
+    return wavelet_lowpass(X, wavelet, level, axis=1)
+
+def _derivative_rows(X):
+    d1 = np.gradient(X, axis=1)
+    d2 = np.gradient(d1, axis=1)
+    buy = (d1[:, -2] < 0) & (d1[:, -1] > 0) & (d2[:, -1] > 0)
+    sell = (d1[:, -2] > 0) & (d1[:, -1] < 0) & (d2[:, -1] < 0)
+    return buy, sell
+
+def _regression_rows(X, window=20):
+    """最后两个窗口的最小二乘斜率：与 rolling_regression_signal 同一个 rolling_slope，逐位一致"""
+    slopes = rolling_slope(X[:, -window - 1:], window)
+    slope_prev, slope_now = slopes[:, -2], slopes[:, -1]
+    buy = (slope_prev <= 0) & (slope_now > 0)
+    sell = (slope_prev >= 0) & (slope_now < 0)
+    return buy, sell
+
+# ---------- 批量投票 ----------
+
+def _labels(n, buy, sell, valid):
+    out = np.full(n, None, dtype=object)
+    out[valid & buy] = "买入"
+    out[valid & sell] = "卖出"
+    return out
+
+def batch_indicator_signals(close_matrix, indicators_cfg, keep=5, wavelet="db4", level=2):
+    """
+    close_matrix: (n_symbols, n_bars) 对齐后的收盘价
+    返回 { 来源名: 长度为 n_symbols 的 object 数组 }，取值口径同 trend._indicator_signals
+    """
+    X = np.ascontiguousarray(close_matrix, dtype=float)
+    if X.ndim != 2:
+        raise ValueError("close_matrix 必须是二维 (标的 × K线)")
+    n, m = X.shape
+    finite = ~np.isnan(X).any(axis=1)
+    signals = {}
+
+    def classic(name, min_len, fn):
+        if m >= min_len:
+            buy, sell = fn(X)
+            signals[name] = _labels(n, buy, sell, finite)
+        else:
+            signals[name] = np.full(n, None, dtype=object)
+
+    # ---- 传统指标（与 _series_ok 的长度/NaN 门槛一致）----
+    if indicators_cfg.get("ma", True):
+        classic("MA", 25, _ma_rows)
+    if indicators_cfg.get("macd", True):
+        classic("MACD", 35, _macd_rows)
+    if indicators_cfg.get("rsi", True):
+        classic("RSI", 20, _rsi_rows)
+    if indicators_cfg.get("boll", True):
+        classic("BOLL", 25, _boll_rows)
+
+    # ---- 数学方法（单序列版本不查 NaN，含 NaN 的行比较结果为 False，自然无信号）----
+    everyone = np.ones(n, dtype=bool)
+    fft_smooth = None
+    if indicators_cfg.get("fft", True) or indicators_cfg.get("hybrid", True):
+        if m >= keep * 4:
+            fft_smooth = _fft_smooth_rows(X, keep)
+
+    if indicators_cfg.get("fft", True):
+        out = np.full(n, None, dtype=object)
+        if fft_smooth is not None:
+            buy, sell = _smooth_cross_rows(X, fft_smooth)
+            # fft_signal 返回 {"signal", "method"}，保持同样的返回值
+            for i in np.flatnonzero(buy):
+                out[i] = {"signal": "买入", "method": "fft"}
+            for i in np.flatnonzero(sell):
+                out[i] = {"signal": "卖出", "method": "fft"}
+        signals["FFT"] = out
+
+    if indicators_cfg.get("derivative", True):
+        if m >= 5:
+            signals["DERIV"] = _labels(n, *_derivative_rows(X), everyone)
+        else:
+            signals["DERIV"] = np.full(n, None, dtype=object)
+
+    if indicators_cfg.get("wavelet", True):
+        if m >= 32:
+            smooth = _wavelet_smooth_rows(X, wavelet, level)
+            signals["WAVELET"] = _labels(n, *_smooth_cross_rows(X, smooth), everyone)
+        else:
+            signals["WAVELET"] = np.full(n, None, dtype=object)
+
+    if indicators_cfg.get("hybrid", True):
+        if m >= max(32, keep * 4):
+            smooth = _wavelet_smooth_rows(fft_smooth, wavelet, level)
+            signals["HYBRID"] = _labels(n, *_smooth_cross_rows(X, smooth), everyone)
+        else:
+            signals["HYBRID"] = np.full(n, None, dtype=object)
+
+    if indicators_cfg.get("regression", True):
+        if m >= 21:
+            signals["REG"] = _labels(n, *_regression_rows(X), everyone)
+        else:
+            signals["REG"] = np.full(n, None, dtype=object)
+
+    return signals
+
+def batch_indicator_votes(close_matrix, indicators_cfg, weights):
+    """
+    返回列表，每行一个 (votes_buy, votes_sell, sources, detail)，与 _indicator_votes 相同
+    """
+    signals = batch_indicator_signals(close_matrix, indicators_cfg)
+    n = len(close_matrix)
+    return [
+        _tally_votes({name: arr[i] for name, arr in signals.items()}, indicators_cfg, weights)
+        for i in range(n)
+    ]
+
+def batch_evaluate(series_list, period_label, cfg):
+    """
+    series_list: [(close, turnover), ...]，长度可以不同（按长度分组各自成批）
+    返回与 evaluate_period 逐个调用一致的结果列表
+    """
+    results = [None] * len(series_list)
+    by_len = {}
+    for i, (close, _) in enumerate(series_list):
+        by_len.setdefault(len(close), []).append(i)
+    for idx in by_len.values():
+        votes = batch_indicator_votes(np.stack([series_list[i][0] for i in idx]), cfg["indicators"], cfg["weights"])
+        for i, v in zip(idx, votes):
+            close, turnover = series_list[i]
+            results[i] = evaluate_period(close, turnover, period_label, cfg, votes=v)
+    return results
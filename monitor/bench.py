@@ -0,0 +1,264 @@
+# monitor/bench.py
+"""
+信号管线基准测试：不连 OpenD，用确定性的合成K线衡量改动前后的快慢。
+  - 合成 OHLCV：trend（带漂移）/ mean_revert（围绕均值回归）/ gappy（跳空 + 零成交）/ nan（夹杂 NaN）
+  - BenchQuoteContext：FakeQuoteContext 的子类，按代码轮流分配上述四种形态
+  - 三层计时：
+      indicator.<名>   单个指标在各形态序列上的耗时
+      symbol           单标的全流程（各周期拉取 + 合并 + 投票 + 多周期汇总 + 冷却）
+      scan.<N>         N 只标的的一轮 _scan_once（首轮冷启动单列为 scan.<N>.cold）
+  - 报告 p50 / p99 / 均值（毫秒）与吞吐（个/秒），可存为基线，下次与基线比较 p50
+用法：
+  python -m monitor.bench --sizes 50 200 500 --save-baseline data/bench_baseline.json
+  python -m monitor.bench --baseline data/bench_baseline.json --tolerance 1.2
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+from futu import KLType
+
+from .fake_opend import FakeQuoteContext, session_times
+from .kline_fetch import KlineFetcher
+from .trend import VOTE_ORDER, _indicator_signals, check_trend_single_period
+
+KINDS = ("trend", "mean_revert", "gappy", "nan")
+
+
+# ---------- 合成K线 ----------
+
+def _close_path(kind, n, rng, base):
+    if kind == "trend":
+        return base * np.exp(np.cumsum(rng.normal(0.0008, 0.008, n)))
+    if kind == "mean_revert":
+        # 离散 OU 过程，对数价格围绕 log(base) 回归
+        x = np.empty(n)
+        x[0] = 0.0
+        shocks = rng.normal(0.0, 0.01, n)
+        for i in range(1, n):
+            x[i] = 0.9 * x[i - 1] + shocks[i]
+        return base * np.exp(x)
+    if kind in ("gappy", "nan"):
+        ret = rng.normal(0.0, 0.01, n)
+        if kind == "gappy":
+            jumps = rng.random(n) < 0.02
+            ret[jumps] += rng.choice([-1.0, 1.0], jumps.sum()) * rng.uniform(0.05, 0.12, jumps.sum())
+        return base * np.exp(np.cumsum(ret))
+    raise ValueError(f"未知形态: {kind}")
+
+
+def synthetic_ohlcv(kind, n, code="HK.00700", kl_type=KLType.K_60M, seed=0,
+                    start="2024-01-02 10:30:00", base=100.0):
+    """确定性合成K线，列与 make_kline_frame / get_cur_kline 一致"""
+    rng = np.random.default_rng(zlib.crc32(f"{kind}|{code}|{kl_type}|{seed}".encode()))
+    close = _close_path(kind, n, rng, base)
+    open_ = np.concatenate([[base], close[:-1]])
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0.0, 0.003, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0.0, 0.003, n)))
+    volume = rng.integers(100_000, 1_000_000, n).astype(float)
+    if kind == "gappy":
+        volume[rng.random(n) < 0.05] = 0.0
+    if kind == "nan":
+        holes = rng.random(n) < 0.02
+        close[holes] = np.nan
+        volume[rng.random(n) < 0.02] = np.nan
+    return pd.DataFrame({
+        "code": code,
+        "time_key": session_times(code, n, kl_type, start).strftime("%Y-%m-%d %H:%M:%S"),
+        "open": open_,
+        "close": close,
+        "high": high,
+        "low": low,
+        "volume": volume,
+        "turnover": volume * close,
+    })
+
+
+def kind_of(code):
+    return KINDS[zlib.crc32(code.encode()) % len(KINDS)]
+
+
+def bench_codes(n):
+    """HK / US 各半的合成代码"""
+    return [f"HK.{i:05d}" if i % 2 == 0 else f"US.B{i:04d}" for i in range(n)]
+
+
+class BenchQuoteContext(FakeQuoteContext):
+    """按代码确定形态的合成K线（kind_of），其余行为同 FakeQuoteContext"""
+
+    def _frame(self, code, kl_type):
+        key = (code, kl_type)
+        if key not in self.frames:
+            self.frames[key] = synthetic_ohlcv(kind_of(code), self.history, code, kl_type, seed=self.seed)
+        return self.frames[key]
+
+
+# ---------- 计时 ----------
+
+def summarize(samples, items=1):
+    """samples: 秒；items: 每个样本处理的个数（算吞吐）"""
+    arr = np.asarray(samples, dtype=float)
+    return {
+        "n": int(len(arr)),
+        "p50_ms": float(np.percentile(arr, 50) * 1000),
+        "p99_ms": float(np.percentile(arr, 99) * 1000),
+        "mean_ms": float(arr.mean() * 1000),
+        "throughput": float(items * len(arr) / arr.sum()) if arr.sum() > 0 else float("inf"),
+    }
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+def bench_indicators(bars=400, repeat=20, seed=0):
+    """每个指标单独开启，在四种形态的序列上各算 repeat 次"""
+    series = [synthetic_ohlcv(kind, bars, seed=seed)["close"].to_numpy(dtype=float, copy=True) for kind in KINDS]
+    out = {}
+    for key, name in VOTE_ORDER:
+        only = {k: k == key for k, _ in VOTE_ORDER}
+        samples = [_timed(_indicator_signals, close, only) for _ in range(repeat) for close in series]
+        out[f"indicator.{name}"] = summarize(samples)
+    return out
+
+
+def _bench_cfg(cfg, workdir):
+    """关掉通知/总线/归档，信号库写到临时目录，避免基准测试产生副作用"""
+    cfg = copy.deepcopy(cfg)
+    cfg["notify"]["enabled"] = False
+    cfg.setdefault("bus", {})["enabled"] = False
+    cfg.setdefault("archive", {})["enabled"] = False
+    cfg["paths"]["signal_csv"] = os.path.join(workdir, "signals.csv")
+    cfg["mode"] = "WATCHLIST"
+    return cfg
+
+
+def bench_symbol(cfg, symbols=50, seed=0):
+    """单标的全流程，每个标的一个样本"""
+    from .schedule_runner import _build_message
+
+    ctx = BenchQuoteContext(history=max(cfg["kline_num"], 200), seed=seed)
+    samples = []
+    for code in bench_codes(symbols):
+        t0 = time.perf_counter()
+        fetcher = KlineFetcher(ctx, cfg["kline_num"])
+        results = [r for p in cfg["periods"]
+                   if (r := check_trend_single_period(ctx, code, p, cfg, fetcher=fetcher)) is not None]
+        _build_message(code, results, set(), cfg)
+        samples.append(time.perf_counter() - t0)
+    return {"symbol": summarize(samples)}
+
+
+def bench_scan(cfg, sizes=(50, 200, 500), repeat=3, seed=0):
+    """每个规模：首轮（空缓存）单独计，之后 repeat 轮沿用同一 ScanRuntime"""
+    from .schedule_runner import ScanRuntime, _scan_once
+
+    out = {}
+    for size in sizes:
+        run_cfg = copy.deepcopy(cfg)
+        run_cfg["watchlist"] = bench_codes(size)
+        ctx = BenchQuoteContext(history=max(cfg["kline_num"], 200), seed=seed)
+        runtime = ScanRuntime(run_cfg)
+        try:
+            cold = _timed(_scan_once, ctx, run_cfg, runtime)
+            warm = [_timed(_scan_once, ctx, run_cfg, runtime) for _ in range(repeat)]
+        finally:
+            runtime.close()
+        out[f"scan.{size}.cold"] = summarize([cold], items=size)
+        out[f"scan.{size}"] = summarize(warm, items=size)
+    return out
+
+
+def run_benchmarks(cfg, sizes=(50, 200, 500), symbols=50, repeat=3, indicator_repeat=20, seed=0):
+    """返回 {名称: summarize 结果}"""
+    level = logging.getLogger().level
+    logging.getLogger().setLevel(logging.WARNING)   # 扫描日志不计入耗时
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            cfg = _bench_cfg(cfg, workdir)
+            report = bench_indicators(cfg["kline_num"], indicator_repeat, seed)
+            report.update(bench_symbol(cfg, symbols, seed))
+            report.update(bench_scan(cfg, sizes, repeat, seed))
+    finally:
+        logging.getLogger().setLevel(level)
+    return report
+
+
+# ---------- 基线 ----------
+
+def save_baseline(report, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def load_baseline(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(report, baseline, tolerance=1.2):
+    """
+    按 p50 比较：ratio = 本次 / 基线，超过 tolerance 记为变慢
+    返回 [(名称, 基线 p50, 本次 p50, ratio, 是否变慢)]，只含两边都有的项
+    """
+    rows = []
+    for name, cur in report.items():
+        base = baseline.get(name)
+        if base is None or base["p50_ms"] <= 0:
+            continue
+        ratio = cur["p50_ms"] / base["p50_ms"]
+        rows.append((name, base["p50_ms"], cur["p50_ms"], ratio, ratio > tolerance))
+    return rows
+
+
+def format_report(report, comparison=None):
+    lines = [f"{'项目':<22}{'p50(ms)':>10}{'p99(ms)':>10}{'均值(ms)':>10}{'吞吐(/s)':>12}"]
+    for name, st in report.items():
+        lines.append(f"{name:<24}{st['p50_ms']:>10.3f}{st['p99_ms']:>10.3f}"
+                     f"{st['mean_ms']:>10.3f}{st['throughput']:>12.1f}")
+    if comparison:
+        lines.append("")
+        lines.append(f"{'与基线比较':<20}{'基线':>10}{'本次':>10}{'倍数':>8}")
+        for name, base, cur, ratio, slower in comparison:
+            flag = "  变慢" if slower else ""
+            lines.append(f"{name:<24}{base:>10.3f}{cur:>10.3f}{ratio:>8.2f}{flag}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="信号管线基准测试（合成K线，不连 OpenD）")
+    ap.add_argument("--config", default="config.json")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 500], help="_scan_once 的标的数")
+    ap.add_argument("--symbols", type=int, default=50, help="单标的全流程的样本数")
+    ap.add_argument("--repeat", type=int, default=3, help="每个规模的热轮次数")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--baseline", default=None, help="与该基线比较")
+    ap.add_argument("--save-baseline", default=None, help="把本次结果存为基线")
+    ap.add_argument("--tolerance", type=float, default=1.2, help="p50 超过基线的倍数视为变慢")
+    args = ap.parse_args(argv)
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    report = run_benchmarks(cfg, args.sizes, args.symbols, args.repeat, seed=args.seed)
+    comparison = compare(report, load_baseline(args.baseline), args.tolerance) if args.baseline else None
+    print(format_report(report, comparison))
+    if args.save_baseline:
+        save_baseline(report, args.save_baseline)
+    if comparison and any(row[-1] for row in comparison):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# monitor/bus.py
+"""
+扫描进程 → Web 进程的本机消息总线（UDP 127.0.0.1）
+  - 发布端非阻塞：发送缓冲满或对端不在时直接丢弃并计数，绝不拖慢扫描
+  - 订阅端一次取走所有已到达的数据报，整批回调（每秒数千条也只需少量回调）
+  - 一条消息一个数据报，JSON：{"topic", "ts", "data"}
+主题：
+  price  {code, time_key, close}
+  votes  {code, periods: {period: 单周期结果或 None}}
+  signal {code, action, score, priority, periods, sources, msg}
+  metrics monitor.metrics 的累计耗时快照（每轮一条，不带 code）
+"""
+
+import json
+import logging
+import socket
+import threading
+import time
+
+import numpy as np
+
+# 单个 UDP 数据报的上限（IPv4 理论值 65507，留点余量）
+MAX_DATAGRAM = 60000
+
+
+def _json_default(o):
+    if isinstance(o, np.integer):
+        return int(o)
+    if isinstance(o, np.floating):
+        return float(o)
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, (set, tuple)):
+        return list(o)
+    return str(o)
+
+
+def encode(topic, data):
+    return json.dumps({"topic": topic, "ts": time.time(), "data": data},
+                      ensure_ascii=False, default=_json_default).encode("utf-8")
+
+
+class BusPublisher:
+    def __init__(self, host="127.0.0.1", port=8765):
+        self.addr = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.sent = 0
+        self.dropped = 0
+
+    def publish(self, topic, data):
+        """发送成功返回 True；过大、缓冲满或出错时丢弃返回 False"""
+        payload = encode(topic, data)
+        if len(payload) > MAX_DATAGRAM:
+            self.dropped += 1
+            logging.warning(f"[总线] {topic} 消息 {len(payload)} 字节超过上限，已丢弃")
+            return False
+        try:
+            self.sock.sendto(payload, self.addr)
+        except OSError:
+            # BlockingIOError / ENOBUFS / ECONNREFUSED：订阅端跟不上或未启动
+            self.dropped += 1
+            return False
+        self.sent += 1
+        return True
+
+    def close(self):
+        self.sock.close()
+
+
+class BusSubscriber:
+    """
+    绑定端口接收；poll() 同步取，start(callback) 起后台线程，callback 收到的是一批消息列表
+    topics: 只保留这些主题（None 表示全部）
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, topics=None, rcvbuf=4 * 1024 * 1024):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        except OSError:
+            pass
+        self.sock.bind((host, port))
+        self.address = self.sock.getsockname()
+        self.topics = set(topics) if topics else None
+        self.received = 0
+        self.bad = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _decode(self, raw):
+        try:
+            msg = json.loads(raw.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            self.bad += 1
+            return None
+        if self.topics is not None and msg.get("topic") not in self.topics:
+            return None
+        return msg
+
+    def poll(self, timeout=None, max_messages=4096):
+        """等待第一条（timeout 秒，None 表示一直等），然后取走已到达的全部，最多 max_messages 条"""
+        out = []
+        self.sock.settimeout(timeout)
+        try:
+            raw = self.sock.recv(MAX_DATAGRAM + 1024)
+        except (socket.timeout, BlockingIOError):
+            return out
+        except OSError:
+            # close() 之后
+            return out
+        self.sock.setblocking(False)
+        while True:
+            msg = self._decode(raw)
+            if msg is not None:
+                out.append(msg)
+            if len(out) >= max_messages:
+                break
+            try:
+                raw = self.sock.recv(MAX_DATAGRAM + 1024)
+            except (BlockingIOError, OSError):
+                break
+        self.received += len(out)
+        return out
+
+    def start(self, callback, poll_seconds=0.5):
+        def loop():
+            while not self._stop.is_set():
+                batch = self.poll(timeout=poll_seconds)
+                if batch:
+                    try:
+                        callback(batch)
+                    except Exception as e:
+                        logging.error(f"[总线] 订阅回调异常: {e}")
+
+        self._thread = threading.Thread(target=loop, name="bus-subscriber", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self.sock.close()
+
+
+# ---------- 扫描端便捷入口 ----------
+
+_PUBLISHERS = {}
+_PUBLISHERS_LOCK = threading.Lock()
+
+
+def get_publisher(cfg):
+    """cfg["bus"] 未开启时返回 None；同一地址在进程内复用一个发布端"""
+    bus_cfg = cfg.get("bus", {})
+    if not bus_cfg.get("enabled", False):
+        return None
+    addr = (bus_cfg.get("host", "127.0.0.1"), int(bus_cfg.get("port", 8765)))
+    with _PUBLISHERS_LOCK:
+        pub = _PUBLISHERS.get(addr)
+        if pub is None:
+            pub = _PUBLISHERS[addr] = BusPublisher(*addr)
+    return pub
+
+
+def publish(cfg, topic, data):
+    pub = get_publisher(cfg)
+    if pub is None:
+        return False
+    return pub.publish(topic, data)
+
+
+def publish_code(cfg, code, period_results, df=None):
+    """
+    一个标的本轮的结果：最新价（df 为最细周期K线）+ 各周期投票
+    period_results: {period: 单周期结果或 None}
+    """
+    pub = get_publisher(cfg)
+    if pub is None:
+        return
+    if df is not None and not df.empty:
+        last = df.iloc[-1]
+        pub.publish("price", {"code": code, "time_key": str(last["time_key"]), "close": float(last["close"])})
+    periods = {p: period_results.get(p) for p in cfg["periods"]}
+    pub.publish("votes", {"code": code, "periods": periods})
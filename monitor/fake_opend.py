@@ -0,0 +1,241 @@
+# monitor/fake_opend.py
+"""
+本地 OpenD 替身：不连 FutuOpenD 也能跑扫描/测试。
+K 线为确定性随机游走，按 (code, KLType) 独立生成，时间落在该市场的交易时段内
+（60m 取每个时段内整点结束的K线 + 收盘那一根，日K取工作日）；
+push_forming / push_new_bar 充当本地K线推送源。
+"""
+
+import time
+import zlib
+import numpy as np
+import pandas as pd
+from futu import *
+
+from .utils import MARKET_SESSIONS, RateLimiter, bar_ends
+
+_KL_MINUTES = {
+    KLType.K_60M: 60,
+}
+
+
+def session_times(code, n, kl_type=KLType.K_60M, start="2024-01-02 10:30:00"):
+    """从 start（含）起的 n 个K线结束时间；未知市场按连续时间"""
+    start = pd.Timestamp(start)
+    if kl_type == KLType.K_DAY:
+        return pd.bdate_range(start=start.normalize(), periods=n)
+    minutes = _KL_MINUTES.get(kl_type, 60)
+    if code.split(".", 1)[0] not in MARKET_SESSIONS:
+        return pd.date_range(start=start, periods=n, freq=f"{minutes}min")
+    ends = np.array(bar_ends(code, minutes))
+    days = pd.bdate_range(start=start.normalize(), periods=n // len(ends) + 2)
+    times = (days.to_numpy()[:, None] + (ends * 60_000_000_000).astype("timedelta64[ns]")[None, :]).ravel()
+    times = times[times >= start.to_datetime64()]
+    return pd.DatetimeIndex(times[:n])
+
+
+def make_kline_frame(code, n, kl_type=KLType.K_60M, seed=0, start="2024-01-02 10:30:00", base=100.0):
+    """生成 n 根确定性 K 线（列与 get_cur_kline 返回一致的子集）"""
+    rng = np.random.default_rng(zlib.crc32(f"{code}|{kl_type}|{seed}".encode()))
+    ret = rng.normal(0.0, 0.01, n)
+    close = base * np.exp(np.cumsum(ret))
+    open_ = np.concatenate([[base], close[:-1]])
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0.0, 0.003, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0.0, 0.003, n)))
+    volume = rng.integers(100_000, 1_000_000, n).astype(float)
+    times = session_times(code, n, kl_type, start)
+    return pd.DataFrame({
+        "code": code,
+        "time_key": times.strftime("%Y-%m-%d %H:%M:%S"),
+        "open": open_,
+        "close": close,
+        "high": high,
+        "low": low,
+        "volume": volume,
+        "turnover": volume * close,
+    })
+
+
+class FakeQuoteContext:
+    """
+    OpenQuoteContext 的最小替身：
+      - get_cur_kline 返回预置/自动生成的K线，request_history_kline 按区间分页返回
+      - calls 记录每次请求，便于断言请求次数
+      - rate_limits={接口名: (次数, 秒)} 时按滑动窗口模拟 OpenD 限频，超出返回“请求频率太高”；
+        sub_quota 模拟订阅额度；disconnect() 之后所有请求返回连接断开
+    """
+
+    def __init__(self, history=1000, seed=0, fail_codes=(), universe=None, rate_limits=None, sub_quota=None,
+                 clock=time.monotonic):
+        self.history = history
+        self.seed = seed
+        self.fail_codes = set(fail_codes)
+        # 全市场列表：{"HK": [code, ...], ...}；未给出的市场生成 200 个代码
+        self.universe = dict(universe or {})
+        self.frames = {}   # (code, kl_type) -> DataFrame
+        self.calls = []    # [(code, num, kl_type), ...]
+        self.subscriptions = []
+        self.handler = None
+        self.closed = False
+        self.rate_limits = {api: RateLimiter(count, seconds) for api, (count, seconds) in (rate_limits or {}).items()}
+        self.sub_quota = sub_quota
+        self.clock = clock
+        self.connected = True
+        self.rejected = 0  # 被模拟限频拒绝的次数
+
+    def disconnect(self):
+        self.connected = False
+
+    def _gate(self, api):
+        """模拟 OpenD 的连接/限频检查，放行返回 None"""
+        if not self.connected or self.closed:
+            return "连接断开"
+        limiter = self.rate_limits.get(api)
+        if limiter is not None:
+            now = self.clock()
+            if limiter.delay(now) > 0:
+                self.rejected += 1
+                return "请求频率太高，请稍后再试"
+            limiter.hit(now)
+        return None
+
+    def _frame(self, code, kl_type):
+        key = (code, kl_type)
+        if key not in self.frames:
+            self.frames[key] = make_kline_frame(code, self.history, kl_type, seed=self.seed)
+        return self.frames[key]
+
+    def set_frame(self, code, kl_type, df):
+        self.frames[(code, kl_type)] = df.reset_index(drop=True)
+
+    def get_cur_kline(self, code, num, ktype=KLType.K_DAY, autype=AuType.QFQ):
+        self.calls.append((code, num, ktype))
+        err = self._gate("get_cur_kline")
+        if err:
+            return RET_ERROR, err
+        if code in self.fail_codes:
+            return RET_ERROR, "fake error"
+        df = self._frame(code, ktype)
+        return RET_OK, df.tail(num).reset_index(drop=True).copy()
+
+    def request_history_kline(self, code, start=None, end=None, ktype=KLType.K_DAY, autype=AuType.QFQ,
+                              fields=None, max_count=1000, page_req_key=None, **kwargs):
+        """按日期区间分页返回；page_req_key 为下一页起始行号，最后一页返回 None"""
+        self.calls.append((code, max_count, ktype))
+        err = self._gate("request_history_kline")
+        if err:
+            return RET_ERROR, err, None
+        if code in self.fail_codes:
+            return RET_ERROR, "fake error", None
+        df = self._frame(code, ktype)
+        day = df["time_key"].str[:10]
+        mask = np.ones(len(df), dtype=bool)
+        if start:
+            mask &= (day >= start[:10]).to_numpy()
+        if end:
+            mask &= (day <= end[:10]).to_numpy()
+        rows = df[mask].reset_index(drop=True)
+        offset = page_req_key or 0
+        page = rows.iloc[offset:offset + max_count].reset_index(drop=True).copy()
+        nxt = offset + max_count if offset + max_count < len(rows) else None
+        return RET_OK, page, nxt
+
+    def get_stock_basicinfo(self, market, stock_type=SecurityType.STOCK, code_list=None):
+        self.calls.append(("basicinfo", market, stock_type))
+        err = self._gate("get_stock_basicinfo")
+        if err:
+            return RET_ERROR, err
+        codes = self.universe.get(market)
+        if codes is None:
+            prefix = "HK.0" if market == Market.HK else f"{market}.S"
+            codes = self.universe[market] = [f"{prefix}{i:04d}" for i in range(1, 201)]
+        return RET_OK, pd.DataFrame({"code": codes, "name": codes, "lot_size": 100,
+                                     "stock_type": stock_type, "delisting": False})
+
+    def get_market_snapshot(self, code_list):
+        """每只标的的最新价/成交额由代码确定性生成（约一半成交额过 2000 万）；单次最多 400 只"""
+        code_list = list(code_list)
+        self.calls.append(("snapshot", len(code_list)))
+        err = self._gate("get_market_snapshot")
+        if err:
+            return RET_ERROR, err
+        if len(code_list) > 400:
+            return RET_ERROR, "too many codes"
+        rows = []
+        for code in code_list:
+            rng = np.random.default_rng(zlib.crc32(f"{code}|snapshot|{self.seed}".encode()))
+            price = float(np.exp(rng.normal(2.5, 1.5)))
+            rows.append({
+                "code": code,
+                "last_price": price,
+                "turnover": float(np.exp(rng.normal(np.log(2e7), 2.0))),
+                "volume": int(rng.integers(1_000, 10_000_000)),
+                "suspension": bool(rng.random() < 0.05),
+            })
+        return RET_OK, pd.DataFrame(rows)
+
+    def set_handler(self, handler):
+        self.handler = handler
+        return RET_OK
+
+    def subscribe(self, code_list, subtype_list, is_first_push=True, subscribe_push=True, **kwargs):
+        err = self._gate("subscribe")
+        if err:
+            return RET_ERROR, err
+        slots = {(c, s) for codes, subs in self.subscriptions for c in codes for s in subs}
+        slots |= {(c, s) for c in code_list for s in subtype_list}
+        if self.sub_quota is not None and len(slots) > self.sub_quota:
+            return RET_ERROR, "订阅额度不足"
+        self.subscriptions.append((list(code_list), list(subtype_list)))
+        return RET_OK, None
+
+    def unsubscribe(self, code_list, subtype_list):
+        drop = {(c, s) for c in code_list for s in subtype_list}
+        kept = []
+        for codes, subs in self.subscriptions:
+            for s in subs:
+                left = [c for c in codes if (c, s) not in drop]
+                if left:
+                    kept.append((left, [s]))
+        self.subscriptions = kept
+        return RET_OK, None
+
+    # ---------- 本地假推送源 ----------
+
+    def _push(self, code, kl_type, rows):
+        rows = rows.copy()
+        rows["k_type"] = kl_type
+        if self.handler is not None:
+            self.handler.handle_frame(rows)
+
+    def push_forming(self, code, kl_type, close):
+        """更新当前未收盘K线的收盘价并推送"""
+        df = self._frame(code, kl_type).copy()
+        last = df.index[-1]
+        df.loc[last, "close"] = close
+        df.loc[last, "high"] = max(df.loc[last, "high"], close)
+        df.loc[last, "low"] = min(df.loc[last, "low"], close)
+        self.frames[(code, kl_type)] = df
+        self._push(code, kl_type, df.iloc[[-1]])
+
+    def push_new_bar(self, code, kl_type, close=None):
+        """开一根新K线（上一根随之收盘）并推送"""
+        df = self._frame(code, kl_type)
+        prev = df.iloc[-1]
+        close = float(prev["close"]) if close is None else close
+        row = {
+            "code": code,
+            "time_key": session_times(code, 2, kl_type, prev["time_key"])[1].strftime("%Y-%m-%d %H:%M:%S"),
+            "open": float(prev["close"]),
+            "close": close,
+            "high": max(float(prev["close"]), close),
+            "low": min(float(prev["close"]), close),
+            "volume": float(prev["volume"]),
+            "turnover": float(prev["volume"]) * close,
+        }
+        df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
+        self.frames[(code, kl_type)] = df
+        self._push(code, kl_type, df.iloc[[-1]])
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,394 @@
+# monitor/incremental.py
+"""
+增量（流式）传统指标：每来一根K线 O(1) 更新，口径与 talib 一致
+  - RollingSMA:   滑动窗口 + 累计和
+  - EMA:          talib 初值（前 period 根的 SMA）+ 递推
+  - MACD:         快线与慢线同一处起算（talib 口径），信号线为 MACD 的 EMA
+  - WilderRSI:    Wilder 平滑
+  - RollingBBands:滑动窗口累计和 / 平方和求总体方差
+状态可 to_dict()/from_dict() 存盘；IndicatorBank 组合四个指标并给出与 _indicator_signals 一致的信号。
+推送模式（StreamRunner）每个 (code, period) 持有一个 IndicatorBank，停止时存盘、启动时恢复。
+"""
+
+import json
+import math
+import os
+from collections import deque
+
+NAN = float("nan")
+
+# 累计和每隔多少次更新重新求和一次，防止浮点漂移
+_RESUM_EVERY = 1000
+
+
+class RollingSMA:
+    def __init__(self, period):
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+        self._since_resum = 0
+
+    def update(self, x):
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+        self.window.append(x)
+        self.total += x
+        self._since_resum += 1
+        if self._since_resum >= _RESUM_EVERY:
+            self.total = math.fsum(self.window)
+            self._since_resum = 0
+        return self.value
+
+    @property
+    def value(self):
+        if len(self.window) < self.period:
+            return NAN
+        return self.total / self.period
+
+    def to_dict(self):
+        return {"period": self.period, "window": list(self.window), "total": self.total,
+                "since_resum": self._since_resum}
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls(d["period"])
+        obj.window.extend(d["window"])
+        obj.total = d["total"]
+        obj._since_resum = d["since_resum"]
+        return obj
+
+
+class EMA:
+    def __init__(self, period):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self.count = 0
+        self.seed_sum = 0.0
+        self.value = NAN
+
+    def update(self, x):
+        self.count += 1
+        if self.count < self.period:
+            self.seed_sum += x
+        elif self.count == self.period:
+            self.value = (self.seed_sum + x) / self.period
+        else:
+            self.value = self.k * x + (1.0 - self.k) * self.value
+        return self.value
+
+    def to_dict(self):
+        return {"period": self.period, "count": self.count, "seed_sum": self.seed_sum, "value": self.value}
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls(d["period"])
+        obj.count, obj.seed_sum, obj.value = d["count"], d["seed_sum"], d["value"]
+        return obj
+
+
+class MACD:
+    """talib.MACD(close, fast, slow, signal) 的增量版本，返回 (macd, signal)"""
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast, self.slow, self.signal_period = fast, slow, signal
+        self.count = 0
+        self.fast_ema = EMA(fast)
+        self.slow_ema = EMA(slow)
+        self.signal_ema = EMA(signal)
+        self.macd = NAN
+        self.signal = NAN
+
+    def update(self, x):
+        self.count += 1
+        self.slow_ema.update(x)
+        # talib：快线从第 slow-fast 根开始计，使两条线同时可用
+        if self.count > self.slow - self.fast:
+            self.fast_ema.update(x)
+        if self.count >= self.slow:
+            self.macd = self.fast_ema.value - self.slow_ema.value
+            self.signal_ema.update(self.macd)
+            self.signal = self.signal_ema.value
+        return self.macd, self.signal
+
+    @property
+    def ready(self):
+        return not math.isnan(self.signal)
+
+    def to_dict(self):
+        return {
+            "fast": self.fast, "slow": self.slow, "signal_period": self.signal_period,
+            "count": self.count, "macd": self.macd, "signal": self.signal,
+            "fast_ema": self.fast_ema.to_dict(), "slow_ema": self.slow_ema.to_dict(),
+            "signal_ema": self.signal_ema.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls(d["fast"], d["slow"], d["signal_period"])
+        obj.count, obj.macd, obj.signal = d["count"], d["macd"], d["signal"]
+        obj.fast_ema = EMA.from_dict(d["fast_ema"])
+        obj.slow_ema = EMA.from_dict(d["slow_ema"])
+        obj.signal_ema = EMA.from_dict(d["signal_ema"])
+        return obj
+
+
+class WilderRSI:
+    def __init__(self, period=14):
+        self.period = period
+        self.prev = None
+        self.count = 0          # 已有的涨跌幅个数
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+        self.value = NAN
+
+    def update(self, x):
+        if self.prev is None:
+            self.prev = x
+            return self.value
+        d = x - self.prev
+        self.prev = x
+        gain, loss = max(d, 0.0), max(-d, 0.0)
+        self.count += 1
+        p = self.period
+        if self.count <= p:
+            self.avg_gain += gain / p
+            self.avg_loss += loss / p
+            if self.count < p:
+                return self.value
+        else:
+            self.avg_gain = (self.avg_gain * (p - 1) + gain) / p
+            self.avg_loss = (self.avg_loss * (p - 1) + loss) / p
+        total = self.avg_gain + self.avg_loss
+        self.value = 100.0 * self.avg_gain / total if total > 0 else 0.0
+        return self.value
+
+    def to_dict(self):
+        return {"period": self.period, "prev": self.prev, "count": self.count,
+                "avg_gain": self.avg_gain, "avg_loss": self.avg_loss, "value": self.value}
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls(d["period"])
+        obj.prev, obj.count, obj.value = d["prev"], d["count"], d["value"]
+        obj.avg_gain, obj.avg_loss = d["avg_gain"], d["avg_loss"]
+        return obj
+
+
+class RollingBBands:
+    """talib.BBANDS(close, period, nbdev, nbdev) 的增量版本，返回 (upper, middle, lower)"""
+
+    def __init__(self, period=20, nbdev=2.0):
+        self.period = period
+        self.nbdev = nbdev
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+        self.total_sq = 0.0
+        self._since_resum = 0
+
+    def update(self, x):
+        if len(self.window) == self.period:
+            old = self.window[0]
+            self.total -= old
+            self.total_sq -= old * old
+        self.window.append(x)
+        self.total += x
+        self.total_sq += x * x
+        self._since_resum += 1
+        if self._since_resum >= _RESUM_EVERY:
+            self.total = math.fsum(self.window)
+            self.total_sq = math.fsum(v * v for v in self.window)
+            self._since_resum = 0
+        return self.value
+
+    @property
+    def value(self):
+        if len(self.window) < self.period:
+            return NAN, NAN, NAN
+        mean = self.total / self.period
+        var = max(self.total_sq / self.period - mean * mean, 0.0)
+        band = self.nbdev * math.sqrt(var)
+        return mean + band, mean, mean - band
+
+    def to_dict(self):
+        return {"period": self.period, "nbdev": self.nbdev, "window": list(self.window),
+                "total": self.total, "total_sq": self.total_sq, "since_resum": self._since_resum}
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls(d["period"], d["nbdev"])
+        obj.window.extend(d["window"])
+        obj.total, obj.total_sq = d["total"], d["total_sq"]
+        obj._since_resum = d["since_resum"]
+        return obj
+
+
+class IndicatorBank:
+    """
+    一个 (code, period) 序列上的 MA5/MA20、MACD(12,26,9)、RSI(14)、BOLL(20,2)
+      - update(close): 新收盘的一根
+      - update(close, replace_last=True): 替换仍在形成中的最后一根
+      - sync(keys, closes): 按 time_key 与K线序列对齐，只喂上次之后的新K线
+      - signals(indicators_cfg): 与 trend._indicator_signals 传统指标部分同口径
+    遇到 NaN 时整体重置（单序列版本对含 NaN 的窗口同样不出信号）。
+    从第一根起一直累积：EMA 类指标与 talib 在滑动窗口上的结果只差起点不同带来的、随长度指数衰减的误差。
+    """
+
+    # 与 _series_ok 的 min_len 保持一致
+    MIN_LEN = {"MA": 25, "MACD": 35, "RSI": 20, "BOLL": 25}
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.ma5 = RollingSMA(5)
+        self.ma20 = RollingSMA(20)
+        self.macd = MACD(12, 26, 9)
+        self.rsi = WilderRSI(14)
+        self.boll = RollingBBands(20, 2.0)
+        self.prev = None     # 上一根收盘后的指标快照，用于交叉判断
+        self.last = None     # 当前指标快照
+        self.last_key = None # sync 喂入的最后一根K线的 time_key
+        self._undo = None    # 最后一根更新前的完整状态，供 replace_last 回滚
+
+    def _snapshot(self, close):
+        up, _, low = self.boll.value
+        return {
+            "close": close,
+            "ma5": self.ma5.value, "ma20": self.ma20.value,
+            "macd": self.macd.macd, "signal": self.macd.signal,
+            "rsi": self.rsi.value,
+            "up": up, "low": low,
+        }
+
+    def update(self, close, replace_last=False):
+        if replace_last and self._undo is not None:
+            self._restore(self._undo)
+        if close is None or math.isnan(close):
+            self.reset()
+            return
+        self._undo = self._state()
+        self.count += 1
+        self.ma5.update(close)
+        self.ma20.update(close)
+        self.macd.update(close)
+        self.rsi.update(close)
+        self.boll.update(close)
+        self.prev, self.last = self.last, self._snapshot(close)
+
+    def sync(self, keys, closes):
+        """
+        keys: 升序的 time_key（pandas Series），closes: 对应收盘价
+        上次喂到的最后一根先回滚再按最新值重喂（当时可能还在形成，如 2h/4h 的未完成组），之后的逐根喂入；
+        找不到上次的那根（首次、间隔太久已滑出窗口、或无法回滚）时整段重喂
+        """
+        n = len(keys)
+        if n == 0:
+            return
+        idx = -1
+        if self.last_key is not None and self._undo is not None:
+            i = int(keys.searchsorted(self.last_key))
+            if i < n and keys.iloc[i] == self.last_key:
+                idx = i
+        if idx < 0:
+            self.reset()
+            for c in closes:
+                self.update(float(c))
+        else:
+            self.update(float(closes[idx]), replace_last=True)
+            for c in closes[idx + 1:]:
+                self.update(float(c))
+        self.last_key = str(keys.iloc[-1])
+
+    def _cross(self, fast, slow):
+        p, c = self.prev, self.last
+        values = (p[fast], p[slow], c[fast], c[slow])
+        if any(math.isnan(v) for v in values):
+            return None
+        if c[fast] > c[slow] and p[fast] <= p[slow]:
+            return "买入"
+        if c[fast] < c[slow] and p[fast] >= p[slow]:
+            return "卖出"
+        return None
+
+    def signals(self, indicators_cfg):
+        out = {}
+        ready = self.prev is not None
+        if indicators_cfg.get("ma", True):
+            out["MA"] = self._cross("ma5", "ma20") if ready and self.count >= self.MIN_LEN["MA"] else None
+        if indicators_cfg.get("macd", True):
+            out["MACD"] = self._cross("macd", "signal") if ready and self.count >= self.MIN_LEN["MACD"] else None
+        if indicators_cfg.get("rsi", True):
+            out["RSI"] = None
+            if ready and self.count >= self.MIN_LEN["RSI"]:
+                r0, r1 = self.prev["rsi"], self.last["rsi"]
+                if not (math.isnan(r0) or math.isnan(r1)):
+                    if r1 < 30 <= r0:
+                        out["RSI"] = "买入"
+                    elif r1 > 70 >= r0:
+                        out["RSI"] = "卖出"
+        if indicators_cfg.get("boll", True):
+            out["BOLL"] = None
+            if ready and self.count >= self.MIN_LEN["BOLL"]:
+                # 下轨跌破→反弹（买）、上轨突破→回落（卖）
+                if self._cross("close", "low") == "买入":
+                    out["BOLL"] = "买入"
+                elif self._cross("close", "up") == "卖出":
+                    out["BOLL"] = "卖出"
+        return out
+
+    # ---------- 存盘 ----------
+
+    def _state(self):
+        return {
+            "count": self.count,
+            "ma5": self.ma5.to_dict(), "ma20": self.ma20.to_dict(),
+            "macd": self.macd.to_dict(), "rsi": self.rsi.to_dict(), "boll": self.boll.to_dict(),
+            "prev": self.prev, "last": self.last, "last_key": self.last_key,
+        }
+
+    def to_dict(self):
+        """含回滚用的上一状态，恢复后仍能替换最后一根"""
+        return {**self._state(), "undo": self._undo}
+
+    def _restore(self, d):
+        self.count = d["count"]
+        self.ma5 = RollingSMA.from_dict(d["ma5"])
+        self.ma20 = RollingSMA.from_dict(d["ma20"])
+        self.macd = MACD.from_dict(d["macd"])
+        self.rsi = WilderRSI.from_dict(d["rsi"])
+        self.boll = RollingBBands.from_dict(d["boll"])
+        self.prev, self.last = d["prev"], d["last"]
+        self.last_key = d.get("last_key")
+        self._undo = None
+
+    @classmethod
+    def from_dict(cls, d):
+        obj = cls()
+        obj._restore(d)
+        obj._undo = d.get("undo")
+        return obj
+
+
+def save_checkpoint(path, banks):
+    """banks: {(code, period): IndicatorBank}；先写临时文件再替换，避免写一半"""
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    payload = {f"{code}|{period}": bank.to_dict() for (code, period), bank in banks.items()}
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        payload = json.load(f)
+    banks = {}
+    for key, d in payload.items():
+        code, period = key.rsplit("|", 1)
+        banks[(code, period)] = IndicatorBank.from_dict(d)
+    return banks
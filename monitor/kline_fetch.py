@@ -0,0 +1,243 @@
+# monitor/kline_fetch.py
+
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from futu import *
+
+from .memo import config_hash
+from .utils import local_now
+
+# 周期 → 基础K线类型（2h/4h 由 60m 按交易时段合并，见 resample）
+PERIOD_KLTYPE = {
+    "1h": KLType.K_60M,
+    "2h": KLType.K_60M,
+    "4h": KLType.K_60M,
+    "1d": KLType.K_DAY,
+}
+
+
+class KlineFetcher:
+    """
+    单轮扫描的K线拉取阶段：
+      - 同一 (code, KLType) 在一轮内只向 OpenD 请求一次
+      - 1h/2h/4h 共用同一份 60m 数据
+      - 统计请求次数 / 实际拉取次数 / 节省次数
+    memo / closed_only 供 check_trend_single_period 使用（见 monitor/memo.py）
+    """
+
+    def __init__(self, quote_ctx, kline_num, cache=None, archive=None, resampler=None, memo=None,
+                 closed_only=False):
+        self.quote_ctx = quote_ctx
+        self.kline_num = kline_num
+        self.cache = cache     # 可选 KlineCache：跨轮次增量拉取
+        self.archive = archive # 可选 BarArchive：拉到的K线顺手落盘
+        self.resampler = resampler  # 可选 Resampler：跨轮次缓存已完成的 2h/4h K线
+        self.memo = memo       # 可选 PeriodMemo：已收盘前缀与配置没变的周期只按末根重算
+        self.closed_only = closed_only  # 只用已收盘的K线计算（以本轮开始时间为准）
+        self.now = local_now()
+        self._cfg_keys = {}    # id(cfg) -> 配置哈希，本轮内只算一次
+        self._frames = {}      # (code, kl_type) -> (ret, df)
+        self.requested = 0     # 周期层面的取数次数
+        self.fetched = 0       # 实际发往 OpenD 的次数
+        self._lock = threading.Lock()   # 计算阶段各线程会并发 get
+
+    def _load(self, code, kl_type):
+        if self.cache is not None:
+            res = self.cache.fetch(self.quote_ctx, code, kl_type)
+        else:
+            res = self.quote_ctx.get_cur_kline(code, self.kline_num, ktype=kl_type)
+        if self.archive is not None:
+            self._archive(code, kl_type, res)
+        return res
+
+    def get(self, code, kl_type):
+        """返回 (ret, df)，与 get_cur_kline 一致；失败结果同样缓存，本轮不再重试"""
+        key = (code, kl_type)
+        with self._lock:
+            self.requested += 1
+            if key in self._frames:
+                return self._frames[key]
+            self.fetched += 1
+        res = self._load(code, kl_type)
+        with self._lock:
+            return self._frames.setdefault(key, res)
+
+    def _archive(self, code, kl_type, res):
+        ret, df = res
+        if ret != RET_OK or df is None or df.empty:
+            return
+        try:
+            self.archive.append(code, kl_type, df)
+        except (OSError, ValueError) as e:
+            logging.warning(f"[K线归档] {code} {kl_type} 写入失败: {e}")
+
+    def peek(self, code, kl_type):
+        """本轮已取到的 DataFrame（未取到或失败为 None），不触发拉取、不计数"""
+        ret, df = self._frames.get((code, kl_type), (None, None))
+        return df if ret == RET_OK else None
+
+    def put(self, code, kl_type, df):
+        """预置本轮数据（如推送模式下已在本地合并好的缓冲），不计入拉取"""
+        self._frames[(code, kl_type)] = (RET_OK, df)
+
+    def config_key(self, cfg):
+        key = self._cfg_keys.get(id(cfg))
+        if key is None:
+            key = self._cfg_keys[id(cfg)] = config_hash(cfg)
+        return key
+
+    def get_period(self, code, period_label):
+        return self.get(code, PERIOD_KLTYPE[period_label])
+
+    def prefetch(self, codes, periods, executor=None):
+        """
+        按 (code, KLType) 去重后批量拉取，返回实际拉取的组合数
+        executor: 可选线程池，网络请求并发发出（结果仍按 codes 顺序落表）
+        """
+        kl_types = []
+        for p in periods:
+            kl = PERIOD_KLTYPE[p]
+            if kl not in kl_types:
+                kl_types.append(kl)
+        keys = [(code, kl) for code in codes for kl in kl_types if (code, kl) not in self._frames]
+        if executor is None:
+            results = [self._load(code, kl) for code, kl in keys]
+        else:
+            results = list(executor.map(lambda k: self._load(*k), keys))
+        for key, res in zip(keys, results):
+            self._frames[key] = res
+        self.fetched += len(keys)
+        return len(keys)
+
+    @property
+    def saved(self):
+        return max(self.requested - self.fetched, 0)
+
+    def stats(self):
+        return {"requested": self.requested, "fetched": self.fetched, "saved": self.saved}
+
+    def log_stats(self):
+        logging.info(
+            f"[K线拉取] 周期取数 {self.requested} 次，实际请求 {self.fetched} 次，节省 {self.saved} 次"
+        )
+        if self.cache is not None:
+            st = self.cache.stats()
+            logging.info(
+                f"[K线缓存] 全量 {st['full']} 次，增量 {st['incremental']} 次，"
+                f"作废 {st['invalidations']} 次，累计接收 {st['bars_received']} 根"
+            )
+
+
+class KlineCache:
+    """
+    跨轮次的增量K线缓存：每个 (code, KLType) 保留最近 kline_num 根
+      - 首次：全量拉取 kline_num 根作为种子
+      - 之后：只拉最近 tail_num 根，按 time_key 合并；与缓存重叠的K线（含未收盘的末根）直接覆盖
+      - 作废重拉：
+          * 断档：新数据最早一根不在缓存里（两轮之间收盘的K线超过 tail_num-1 根）
+          * 复权/除权跳变：重叠的已收盘K线收盘价相对偏差 > jump_tolerance
+    """
+
+    def __init__(self, kline_num, tail_num=5, jump_tolerance=0.001):
+        self.kline_num = kline_num
+        self.tail_num = max(int(tail_num), 2)
+        self.jump_tolerance = jump_tolerance
+        self._buffers = {}          # (code, kl_type) -> DataFrame
+        self.full_fetches = 0
+        self.incremental_fetches = 0
+        self.invalidations = 0
+        self.bars_received = 0      # 从 OpenD 收到的K线根数
+        self._lock = threading.Lock()   # 仅保护计数；不同 key 的缓冲互不干扰，可并发 fetch
+
+    def _count(self, field, n=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    def _full(self, quote_ctx, code, kl_type):
+        ret, df = quote_ctx.get_cur_kline(code, self.kline_num, ktype=kl_type)
+        self._count("full_fetches")
+        if ret != RET_OK or df is None or df.empty:
+            self._buffers.pop((code, kl_type), None)
+            return ret, df
+        self._count("bars_received", len(df))
+        df = df.reset_index(drop=True)
+        self._buffers[(code, kl_type)] = df
+        return ret, df
+
+    def _merge(self, cached, tail):
+        """合并失败（需作废）返回 None"""
+        first_key = tail["time_key"].iloc[0]
+        pos = cached.index[cached["time_key"] == first_key]
+        if len(pos) == 0:
+            return None  # 断档
+
+        # 重叠部分里除缓存末根（可能未收盘）外都应已定格，收盘价变化说明复权口径变了
+        overlap = cached.iloc[pos[0]:-1]
+        if len(overlap):
+            new_close = tail.set_index("time_key")["close"].reindex(overlap["time_key"]).to_numpy(dtype=float)
+            old_close = overlap["close"].to_numpy(dtype=float)
+            diff = np.abs(new_close - old_close) / np.maximum(np.abs(old_close), 1e-12)
+            if np.isnan(diff).any() or (diff > self.jump_tolerance).any():
+                return None
+
+        merged = pd.concat([cached.iloc[:pos[0]], tail], ignore_index=True)
+        return merged.tail(self.kline_num).reset_index(drop=True)
+
+    def fetch(self, quote_ctx, code, kl_type):
+        """返回 (ret, df)，与 get_cur_kline 一致"""
+        key = (code, kl_type)
+        cached = self._buffers.get(key)
+        if cached is None:
+            return self._full(quote_ctx, code, kl_type)
+
+        ret, tail = quote_ctx.get_cur_kline(code, self.tail_num, ktype=kl_type)
+        self._count("incremental_fetches")
+        if ret != RET_OK or tail is None or tail.empty:
+            return ret, tail
+        self._count("bars_received", len(tail))
+
+        merged = self._merge(cached, tail.reset_index(drop=True))
+        if merged is None:
+            self._count("invalidations")
+            logging.info(f"[K线缓存] {code} {kl_type} 断档或复权跳变，全量重拉")
+            return self._full(quote_ctx, code, kl_type)
+        self._buffers[key] = merged
+        return ret, merged
+
+    def peek(self, code, kl_type):
+        """当前缓冲（不发请求），无则 None"""
+        return self._buffers.get((code, kl_type))
+
+    def apply_push(self, code, kl_type, rows):
+        """
+        合并推送来的K线（要求推送连续，重连后应 invalidate）：
+          - time_key 已在缓冲中 → 覆盖该根
+          - time_key 更新 → 追加，并截断到 kline_num
+        缓冲尚未建立时返回 False，由调用方走 fetch 补种子
+        """
+        cached = self._buffers.get((code, kl_type))
+        if cached is None:
+            return False
+        rows = rows[[c for c in cached.columns if c in rows.columns]]
+        rows = rows[rows["time_key"] >= cached["time_key"].iloc[0]]
+        keep = cached[~cached["time_key"].isin(rows["time_key"])]
+        merged = pd.concat([keep, rows], ignore_index=True).sort_values("time_key", kind="stable")
+        self._buffers[(code, kl_type)] = merged.tail(self.kline_num).reset_index(drop=True)
+        return True
+
+    def invalidate(self, code=None):
+        if code is None:
+            self._buffers.clear()
+            return
+        for key in [k for k in self._buffers if k[0] == code]:
+            del self._buffers[key]
+
+    def stats(self):
+        return {
+            "full": self.full_fetches,
+            "incremental": self.incremental_fetches,
+            "invalidations": self.invalidations,
+            "bars_received": self.bars_received,
+        }
@@ -0,0 +1,117 @@
+# monitor/memo.py
+"""
+单周期缓存：按周期合并后的K线去掉末根（已收盘的前缀）没变、配置没变时，复用该前缀上算好的状态，只重算末根
+  - 键：(code, period, 前缀指纹, 配置哈希)
+      前缀指纹 = 前缀最后一根K线的 (time_key, 收盘, 成交额) + 根数 + 首根收盘
+      配置哈希 = 影响单周期结果的配置（kline_num / filters / indicators / weights / signal）
+      盘中末根是形成中的K线，每个 tick 都在变；前缀只在新K线收盘时变，所以两次收盘之间一直命中
+  - 值：PrefixEntry —— 数学方法平滑曲线的前缀部分（线性算子，末根变化后 O(1) 得到最后两点）
+        + 上次的末根与结果（末根没变时直接复用）；传统指标仍由 talib 对整段算，与不开缓存时逐位一致
+  - LRU：超过 max_entries 淘汰最久未用的；统计命中 / 未命中 / 淘汰
+  - closed_bars：去掉尚未收盘的K线（60m 的 time_key 是结束时间；日K当日收盘前算形成中），
+    轮询模式打开 memo.closed_bars_only 后末根也不再变，但不再出盘中信号（默认关闭）
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from dateutil import tz
+from futu import *
+
+from . import metrics
+from .trend_math import PrefixSmoothing
+from .utils import MARKET_TZ, local_now, market_of, session_minutes
+
+_CONFIG_KEYS = ("kline_num", "filters", "indicators", "weights", "signal")
+
+
+def config_hash(cfg):
+    """影响单周期结果的配置 → 短哈希"""
+    part = {k: cfg.get(k) for k in _CONFIG_KEYS}
+    return hashlib.sha1(json.dumps(part, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def bar_fingerprint(df):
+    """根数 + 最后一根 (time_key, 收盘, 成交额) + 第一根收盘（复权调整会改动历史价格）"""
+    last = df.iloc[-1]
+    turnover = float(last["turnover"]) if "turnover" in df.columns else None
+    return len(df), str(last["time_key"]), float(last["close"]), turnover, float(df["close"].iloc[0])
+
+
+def closed_bars(df, kl_type, code, now=None):
+    """只保留 now 时已收盘的K线（time_key 已排序）；没有形成中的K线时原样返回"""
+    if df is None or df.empty:
+        return df
+    local = (now or local_now()).astimezone(tz.gettz(MARKET_TZ.get(market_of(code), "Asia/Shanghai")))
+    if kl_type == KLType.K_DAY:
+        # 日K的 time_key 是当日 00:00:00，收盘前当日这根仍在形成
+        today = local.strftime("%Y-%m-%d 00:00:00")
+        done = local.hour * 60 + local.minute >= session_minutes(code)[-1][1]
+        idx = df["time_key"].searchsorted(today, side="right" if done else "left")
+    else:
+        idx = df["time_key"].searchsorted(local.strftime("%Y-%m-%d %H:%M:%S"), side="right")
+    return df if idx >= len(df) else df.iloc[:idx]
+
+
+class PrefixEntry:
+    """一段已收盘前缀上的缓存：平滑曲线的前缀部分 + 上次的末根指纹与结果"""
+
+    def __init__(self, prefix_close):
+        self.smoothing = PrefixSmoothing(prefix_close)
+        self.tail = None
+        self.result = None
+
+
+class PeriodMemo:
+    def __init__(self, max_entries=4096):
+        self.max_entries = int(max_entries)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._logged = (0, 0)
+
+    def get(self, key):
+        """返回 (是否命中, 结果)"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                hit, value = True, self._data[key]
+            else:
+                self.misses += 1
+                hit, value = False, None
+        metrics.inc("monitor_memo_hits_total" if hit else "monitor_memo_misses_total")
+        return hit, value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "hit_rate": self.hits / total if total else 0.0}
+
+    def log_stats(self):
+        """本轮（距上次记录）与累计的命中率"""
+        st = self.stats()
+        hits, misses = st["hits"] - self._logged[0], st["misses"] - self._logged[1]
+        self._logged = (st["hits"], st["misses"])
+        rate = hits / (hits + misses) if hits + misses else 0.0
+        logging.info(
+            f"[结果缓存] 本轮命中 {hits}/{hits + misses}（{rate:.0%}），累计命中率 {st['hit_rate']:.0%}，"
+            f"{st['entries']} 条，淘汰 {st['evictions']} 次"
+        )
@@ -0,0 +1,179 @@
+# monitor/metrics.py
+"""
+扫描热路径的耗时统计（常开）：
+  - stage(name)：各阶段耗时进直方图 monitor_stage_seconds{stage=...}
+    fetch / resample / indicator.<名> / smooth.<fft|wavelet|hybrid> / aggregate / cooldown / notify / tick
+  - observe_symbol(seconds)：单标的全流程耗时进 monitor_symbol_seconds
+  - 直方图用固定桶（bisect + 计数），一次记录约 1µs；metrics.enabled=false 时 stage 是空操作
+  - 每轮结束 publish_snapshot 把累计值经消息总线发给 Web 进程，/metrics 以 Prometheus 文本格式输出
+  - 可选：metrics.profile.enabled 时每 every 轮用 cProfile 跑一轮，.prof 写到 dir（只保留最近 keep 个）
+进程池里算的指标（schedule.concurrency.process_workers > 0）记在子进程，不进统计。
+"""
+
+import bisect
+import cProfile
+import glob
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# 桶上界（秒），覆盖 50µs 指标计算到 60s 的整轮扫描
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE = "monitor_stage_seconds"
+SYMBOL = "monitor_symbol_seconds"
+
+_HELP = {
+    STAGE: "扫描各阶段耗时",
+    SYMBOL: "单标的全流程耗时",
+    "monitor_ticks_total": "扫描轮次",
+    "monitor_symbols_total": "累计计算的标的数",
+    "monitor_memo_hits_total": "单周期结果缓存命中",
+    "monitor_memo_misses_total": "单周期结果缓存未命中",
+}
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)   # 最后一格为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._hists = {}      # (name, label 值) -> Histogram
+        self._counters = {}   # name -> 值
+
+    def observe(self, name, value, label=""):
+        if not self.enabled:
+            return
+        key = (name, label)
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = Histogram()
+            h.observe(value)
+
+    def inc(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def _timed(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(STAGE, time.perf_counter() - t0, name)
+
+    def stage(self, name):
+        """with stage("fetch"): ...；关闭时返回空上下文"""
+        return self._timed(name) if self.enabled else nullcontext()
+
+    def snapshot(self):
+        """可 JSON 序列化的累计值：{"h": [[name, label, counts, sum, count], ...], "c": {name: 值}}"""
+        with self._lock:
+            return {
+                "h": [[name, label, list(h.counts), h.sum, h.count] for (name, label), h in self._hists.items()],
+                "c": dict(self._counters),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._hists.clear()
+            self._counters.clear()
+
+
+REGISTRY = Registry()
+stage = REGISTRY.stage
+observe = REGISTRY.observe
+inc = REGISTRY.inc
+
+
+def observe_symbol(seconds):
+    REGISTRY.observe(SYMBOL, seconds)
+
+
+def configure(cfg):
+    REGISTRY.enabled = cfg.get("metrics", {}).get("enabled", True)
+
+
+def publish_snapshot(cfg):
+    """每轮结束调用：累计值经总线发给 Web 进程（总线关闭时不发）"""
+    if not REGISTRY.enabled or not cfg.get("metrics", {}).get("publish", True):
+        return
+    from .bus import publish
+    publish(cfg, "metrics", REGISTRY.snapshot())
+
+
+# ---------- Prometheus 文本格式 ----------
+
+def _fmt(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def render(snapshot):
+    """snapshot（Registry.snapshot 的结果）→ Prometheus text exposition format 0.0.4"""
+    lines = []
+    by_name = {}
+    for name, label, counts, total, count in (snapshot or {}).get("h", []):
+        by_name.setdefault(name, []).append((label, counts, total, count))
+    for name in sorted(by_name):
+        lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+        for label, counts, total, count in sorted(by_name[name]):
+            base = f'stage="{label}",' if label else ""
+            cum = 0
+            for bound, c in zip(list(BUCKETS) + ["+Inf"], counts):
+                cum += c
+                le = bound if bound == "+Inf" else _fmt(bound)
+                lines.append(f'{name}_bucket{{{base}le="{le}"}} {cum}')
+            tag = f"{{{base[:-1]}}}" if base else ""
+            lines.append(f"{name}_sum{tag} {_fmt(total)}")
+            lines.append(f"{name}_count{tag} {count}")
+    for name, value in sorted((snapshot or {}).get("c", {}).items()):
+        lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- 单轮 profile ----------
+
+@contextmanager
+def profiled(cfg, tick):
+    """metrics.profile.enabled 且 tick 是 every 的倍数时，用 cProfile 包住这一轮并落盘"""
+    pcfg = cfg.get("metrics", {}).get("profile", {})
+    every = max(int(pcfg.get("every", 1)), 1)
+    if not pcfg.get("enabled", False) or tick % every:
+        yield None
+        return
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield prof
+    finally:
+        prof.disable()
+        out_dir = pcfg.get("dir", "data/profiles")
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"tick-{time.strftime('%Y%m%d-%H%M%S')}-{tick}.prof")
+        prof.dump_stats(path)
+        keep = int(pcfg.get("keep", 20))
+        for old in sorted(glob.glob(os.path.join(out_dir, "tick-*.prof")), key=os.path.getmtime)[:-keep]:
+            os.remove(old)
+        logging.info(f"[性能] 第 {tick} 轮 profile 已写入 {path}（python -m pstats {path}）")
@@ -1,36 +1,605 @@
+# monitor/notify.py
+"""
+通知发送
+  - 通知目标（sink）在 notify.sinks 里按名字配置：企业微信 / Server酱 / 通用 webhook / 文件 / 日志
+  - 路由表 notify.routes 按优先级、市场、标的把一轮的消息分发到多个 sink（一条消息可去多个 sink）
+    未配置 sinks/routes 时沿用旧的单通道配置：高优先级 → notify.channel，中优先级 → 日志
+  - NotifyDispatcher：后台投递，notify_signals() 只入队，扫描线程不等网络
+      * 合并：coalesce_seconds 内到达的多批消息按 sink 去重后合成一条，超过 max_chars 再切分
+      * 每个 sink 一个投递线程，慢的 sink 不拖累其他 sink；各 sink 统计发送数、失败数与耗时
+      * 限流：每 sink 滑动窗口（企业微信机器人 20 条/分钟），超限的消息顺延，不算失败
+      * 重试：失败按指数退避重试，超过 max_attempts 记为 dead
+      * 发件箱：待发消息先落 SQLite，进程重启后继续投递
+  日志类 sink 不走网络，始终在当前线程直接输出（通知总开关关闭时也输出）。
+"""
+
+import atexit
 import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 
-def notify(messages, config):
-    if not config["notify"].get("enabled", False):
-        logging.info("[通知] 已关闭")
-        return
+from .metrics import stage
+from .utils import RateLimiter, market_of
 
-    channel = config["notify"].get("channel", "log")
-    text = "\n".join(messages)
+SERVERCHAN_URL = "https://sctapi.ftqq.com/{key}.send"
+LOCAL_TYPES = ("log",)
 
-    if channel == "wecom":
-        webhook = config["notify"]["wecom"].get("webhook", "")
-        if not webhook:
-            logging.warning("[通知] 企业微信 webhook 未配置")
-            return
-        try:
-            r = requests.post(webhook, json={"msgtype":"text", "text":{"content": text}}, timeout=8)
-            logging.info(f"[通知-企业微信] {r.status_code}")
-        except Exception as e:
-            logging.error(f"[通知失败-企业微信] {e}")
-
-    elif channel == "serverchan":
-        key = config["notify"]["serverchan"].get("key", "")
-        if not key:
-            logging.warning("[通知] Server酱 key 未配置")
-            return
-        url = f"https://sctapi.ftqq.com/{key}.send"
-        try:
-            r = requests.post(url, data={"title":"趋势提醒", "desp": text}, timeout=8)
-            logging.info(f"[通知-Server酱] {r.status_code}")
-        except Exception as e:
-            logging.error(f"[通知失败-Server酱] {e}")
 
+class NotifyError(Exception):
+    """sink 返回失败（HTTP 状态码或业务错误码），可重试"""
+
+
+# ---------- sink 与路由 ----------
+
+def resolve_sinks(notify_cfg):
+    """{sink 名: sink 配置（含 type、name）}；旧配置的 channel 转成同名 sink，另加一个 log"""
+    sinks = notify_cfg.get("sinks")
+    if not sinks:
+        channel = notify_cfg.get("channel", "log")
+        sinks = {"log": {"type": "log"}}
+        if channel != "log":
+            sinks[channel] = {"type": channel, **notify_cfg.get(channel, {})}
+    return {name: {**spec, "name": name} for name, spec in sinks.items()}
+
+
+def resolve_routes(notify_cfg):
+    routes = notify_cfg.get("routes")
+    if routes:
+        return routes
+    return [
+        {"priority": ["高"], "sinks": [notify_cfg.get("channel", "log")]},
+        {"priority": ["中"], "sinks": ["log"]},
+    ]
+
+
+def _matches(rule, code, priority):
+    if "priority" in rule and priority not in rule["priority"]:
+        return False
+    if "market" in rule and market_of(code or "") not in rule["market"]:
+        return False
+    if "codes" in rule and code not in rule["codes"]:
+        return False
+    return True
+
+
+def route(signals, routes):
+    """
+    signals: [(code, priority, msg), ...] → {sink 名: [msg, ...]}
+    命中的所有规则都生效；同一条消息在同一 sink 只出现一次，顺序与 signals 一致
+    """
+    out = {}
+    for code, priority, msg in signals:
+        targets = []
+        for rule in routes:
+            if _matches(rule, code, priority):
+                targets.extend(t for t in rule.get("sinks", []) if t not in targets)
+        for name in targets:
+            out.setdefault(name, []).append(msg)
+    return out
+
+
+def sink_ready(sink):
+    """配置是否齐全；缺 webhook/key/url/path 时记警告并返回 False"""
+    need = {"wecom": "webhook", "serverchan": "key", "webhook": "url", "file": "path"}.get(sink["type"])
+    if need and not sink.get(need, ""):
+        logging.warning(f"[通知] {sink['name']} 的 {need} 未配置")
+        return False
+    return True
+
+
+# ---------- 发送 ----------
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+_FILE_LOCK = threading.Lock()
+
+
+def make_session(pool_size=4):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _shared_session():
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = make_session()
+        return _SESSION
+
+
+def send(session, sink, text, timeout=8):
+    """发一条；失败抛 NotifyError 或 requests / OSError 的异常"""
+    kind = sink["type"]
+    if kind == "wecom":
+        r = session.post(sink["webhook"], json={"msgtype": "text", "text": {"content": text}}, timeout=timeout)
+        r.raise_for_status()
+        body = r.json()
+        # 限频 45009 等业务错误也是 HTTP 200
+        if body.get("errcode", 0) != 0:
+            raise NotifyError(f"errcode={body.get('errcode')} {body.get('errmsg', '')}")
+        logging.info(f"[通知-企业微信] {sink['name']} {r.status_code}")
+    elif kind == "serverchan":
+        r = session.post(SERVERCHAN_URL.format(key=sink["key"]),
+                         data={"title": sink.get("title", "趋势提醒"), "desp": text}, timeout=timeout)
+        r.raise_for_status()
+        body = r.json()
+        if body.get("code", 0) != 0:
+            raise NotifyError(f"code={body.get('code')} {body.get('message', '')}")
+        logging.info(f"[通知-Server酱] {sink['name']} {r.status_code}")
+    elif kind == "webhook":
+        r = session.post(sink["url"], json={"text": text}, timeout=timeout)
+        r.raise_for_status()
+    elif kind == "file":
+        d = os.path.dirname(sink["path"])
+        if d:
+            os.makedirs(d, exist_ok=True)
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        with _FILE_LOCK, open(sink["path"], "a", encoding="utf-8") as f:
+            f.write(f"[{stamp}]\n{text}\n\n")
     else:
-        logging.info(f"[通知-日志]\n{text}")
+        logging.info(f"[通知-{sink['name']}]\n{text}")
+
+
+class SinkStats:
+    """单个 sink 的发送计数与最近 window 次发送耗时"""
+
+    def __init__(self, window=256):
+        self.sent = 0
+        self.failed = 0
+        self.dead = 0
+        self.last_error = None
+        self._latency = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, error=None):
+        with self._lock:
+            self._latency.append(seconds)
+            if error is None:
+                self.sent += 1
+            else:
+                self.failed += 1
+                self.last_error = str(error)
+
+    def snapshot(self):
+        with self._lock:
+            lat = np.array(self._latency, dtype=float) * 1000
+            return {
+                "sent": self.sent, "failed": self.failed, "dead": self.dead, "last_error": self.last_error,
+                "p50_ms": float(np.percentile(lat, 50)) if len(lat) else 0.0,
+                "p99_ms": float(np.percentile(lat, 99)) if len(lat) else 0.0,
+                "max_ms": float(lat.max()) if len(lat) else 0.0,
+            }
+
+
+# ---------- 合并 ----------
+
+def coalesce(messages, max_chars=2000):
+    """去重（保持先后），按换行拼接，每段不超过 max_chars；单条超长的按长度硬切"""
+    lines = list(dict.fromkeys(m for m in messages if m))
+    chunks, cur = [], ""
+    for line in lines:
+        while len(line) > max_chars:
+            if cur:
+                chunks.append(cur)
+                cur = ""
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        if not line:
+            continue
+        if cur and len(cur) + 1 + len(line) > max_chars:
+            chunks.append(cur)
+            cur = ""
+        cur = f"{cur}\n{line}" if cur else line
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+
+# ---------- 发件箱 ----------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel  TEXT    NOT NULL,
+    text     TEXT    NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_try REAL    NOT NULL,
+    created  REAL    NOT NULL,
+    status   TEXT    NOT NULL DEFAULT 'pending',
+    error    TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_sink_due ON outbox (status, channel, next_try);
+"""
+
+
+class Outbox:
+    """待发消息表：发成功即删除；超过重试次数的标记 dead 留档"""
+
+    def __init__(self, path=":memory:"):
+        if path != ":memory:":
+            d = os.path.dirname(path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def add(self, channel, text, now):
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO outbox (channel, text, next_try, created) VALUES (?, ?, ?, ?)",
+                (channel, text, now, now),
+            )
+            self._conn.commit()
+            return cur.lastrowid
+
+    def due(self, now, channel, limit=100):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, channel, text, attempts FROM outbox "
+                "WHERE status = 'pending' AND channel = ? AND next_try <= ? ORDER BY id LIMIT ?",
+                (channel, now, limit),
+            ).fetchall()
+
+    def next_try(self, channel):
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(next_try) FROM outbox WHERE status = 'pending' AND channel = ?",
+                                     (channel,)).fetchone()
+        return row[0]
+
+    def done(self, row_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+            self._conn.commit()
+
+    def reschedule(self, row_id, next_try, attempts=None, error=None):
+        with self._lock:
+            if attempts is None:
+                self._conn.execute("UPDATE outbox SET next_try = ? WHERE id = ?", (next_try, row_id))
+            else:
+                self._conn.execute("UPDATE outbox SET next_try = ?, attempts = ?, error = ? WHERE id = ?",
+                                   (next_try, attempts, error, row_id))
+            self._conn.commit()
+
+    def dead(self, row_id, attempts, error):
+        with self._lock:
+            self._conn.execute("UPDATE outbox SET status = 'dead', attempts = ?, error = ? WHERE id = ?",
+                               (attempts, error, row_id))
+            self._conn.commit()
+
+    def count(self, status="pending"):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE status = ?", (status,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ---------- 后台投递 ----------
+
+_STOP = object()
+
+
+class NotifyDispatcher:
+    """
+    notify_cfg: config["notify"]；投递参数在 notify_cfg["dispatch"]
+    一个合并线程（队列 → 发件箱）+ 每个 sink 一个投递线程（发件箱里该 sink 的消息）
+    """
+
+    def __init__(self, notify_cfg, session=None):
+        d = notify_cfg.get("dispatch", {})
+        self.notify_cfg = notify_cfg
+        self.sinks = resolve_sinks(notify_cfg)
+        self.default_sink = notify_cfg.get("channel", "log")
+        self.coalesce_seconds = float(d.get("coalesce_seconds", 2.0))
+        self.max_chars = int(d.get("max_chars", 2000))
+        self.timeout = float(d.get("timeout", 8))
+        self.max_attempts = int(d.get("max_attempts", 8))
+        self.backoff_base = float(d.get("backoff_base", 2.0))
+        self.backoff_max = float(d.get("backoff_max", 300.0))
+        # sink 自己的 rate_limit 优先，否则按类型取 dispatch.rate_limit
+        self.limiters = {}
+        for name, sink in self.sinks.items():
+            spec = sink.get("rate_limit") or d.get("rate_limit", {}).get(sink["type"])
+            if spec:
+                self.limiters[name] = RateLimiter(spec["count"], spec["seconds"])
+        self.session = session or make_session(int(d.get("pool_size", 4)))
+        self.outbox = Outbox(d.get("outbox") or ":memory:")
+        self.sink_stats = {name: SinkStats() for name in self.sinks}
+        self._queue = queue.Queue()
+        self._wake = {name: threading.Event() for name in self.sinks}
+        self._stop = threading.Event()
+        self._threads = []
+        self._busy = threading.Lock()
+        self._pending = None   # close() 后记下发件箱剩余条数
+        self.submitted = 0     # 入队的消息条数
+        self.enqueued = 0      # 合并后写入发件箱的条数
+
+    # ---------- 对外 ----------
+
+    def start(self):
+        if not self._threads:
+            self._threads.append(threading.Thread(target=self._collect_loop, name="notify-collect", daemon=True))
+            for name in self.sinks:
+                self._threads.append(threading.Thread(target=self._sink_loop, args=(name,),
+                                                      name=f"notify-{name}", daemon=True))
+            for t in self._threads:
+                t.start()
+        return self
+
+    def submit(self, messages, sink=None):
+        messages = list(messages)
+        if not messages:
+            return
+        self.submitted += len(messages)
+        self._queue.put((sink or self.default_sink, messages))
+
+    def submit_routed(self, by_sink):
+        """route() 的结果：{sink 名: [msg, ...]}"""
+        for name, messages in by_sink.items():
+            self.submit(messages, name)
+
+    def flush(self, timeout=10.0):
+        """等到队列清空、发件箱里没有待发消息；超时返回 False（测试 / 退出前用）"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._busy:
+                idle = self._queue.empty() and self.outbox.count() == 0
+            if idle:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def close(self, timeout=5.0):
+        """停止后台线程；未发出的消息留在发件箱，下次启动继续"""
+        if self._threads:
+            self._stop.set()
+            self._queue.put(_STOP)
+            for ev in self._wake.values():
+                ev.set()
+            for t in self._threads:
+                t.join(timeout=timeout)
+            self._threads = []
+        self._store(self._drain())
+        self._pending = self.outbox.count()
+        self.outbox.close()
+
+    def stats(self):
+        sinks = {name: st.snapshot() for name, st in self.sink_stats.items()}
+        return {
+            "submitted": self.submitted, "enqueued": self.enqueued,
+            "sent": sum(v["sent"] for v in sinks.values()),
+            "failed": sum(v["failed"] for v in sinks.values()),
+            "dead": sum(v["dead"] for v in sinks.values()),
+            "pending": self.outbox.count() if self._pending is None else self._pending,
+            "sinks": sinks,
+        }
+
+    # ---------- 合并线程 ----------
+
+    def _drain(self):
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+            if item is not _STOP:
+                items.append(item)
+
+    def _store(self, items):
+        """按 sink 合并后写入发件箱；未配置或配置不全的 sink 丢弃并记警告"""
+        by_sink = {}
+        for name, messages in items:
+            by_sink.setdefault(name, []).extend(messages)
+        now = time.time()
+        for name, messages in by_sink.items():
+            sink = self.sinks.get(name)
+            if sink is None:
+                logging.warning(f"[通知] 路由到未配置的 sink: {name}")
+                continue
+            if not sink_ready(sink):
+                continue
+            for text in coalesce(messages, self.max_chars):
+                self.outbox.add(name, text, now)
+                self.enqueued += 1
+            self._wake[name].set()
+
+    def _collect_loop(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            with self._busy:
+                items, stop = [first], False
+                deadline = time.monotonic() + self.coalesce_seconds
+                while (remaining := deadline - time.monotonic()) > 0:
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stop = True
+                        break
+                    items.append(item)
+                self._store(items)
+            if stop:
+                return
+
+    # ---------- 投递线程（每 sink 一个） ----------
+
+    def _wait_seconds(self, name):
+        nxt = self.outbox.next_try(name)
+        if nxt is None:
+            return 1.0
+        return min(max(nxt - time.time(), 0.0), 1.0)
+
+    def _sink_loop(self, name):
+        wake = self._wake[name]
+        while not self._stop.is_set():
+            wake.wait(self._wait_seconds(name))
+            wake.clear()
+            if self._stop.is_set():
+                return
+            self._deliver_due(name)
+
+    def _deliver_due(self, name):
+        sink, stats = self.sinks[name], self.sink_stats[name]
+        limiter = self.limiters.get(name)
+        now = time.time()
+        for row_id, _, text, attempts in self.outbox.due(now, name):
+            if self._stop.is_set():
+                return
+            if limiter is not None:
+                wait = limiter.delay(now)
+                if wait > 0:
+                    self.outbox.reschedule(row_id, now + wait)
+                    continue
+                limiter.hit(now)
+            t0 = time.perf_counter()
+            try:
+                send(self.session, sink, text, self.timeout)
+            except Exception as e:
+                stats.record(time.perf_counter() - t0, e)
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    self.outbox.dead(row_id, attempts, str(e))
+                    stats.dead += 1
+                    logging.error(f"[通知失败-{name}] 已重试 {attempts} 次，放弃: {e}")
+                else:
+                    backoff = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+                    self.outbox.reschedule(row_id, time.time() + backoff, attempts, str(e))
+                    logging.warning(f"[通知失败-{name}] 第 {attempts} 次，{backoff:.1f}s 后重试: {e}")
+                continue
+            stats.record(time.perf_counter() - t0)
+            self.outbox.done(row_id)
+            now = time.time()
+
+
+_DISPATCHERS = {}
+_DISPATCHERS_LOCK = threading.Lock()
+
+
+def get_dispatcher(config):
+    """同一发件箱在进程内复用一组已启动的投递线程"""
+    ncfg = config["notify"]
+    key = ncfg.get("dispatch", {}).get("outbox") or ":memory:"
+    with _DISPATCHERS_LOCK:
+        disp = _DISPATCHERS.get(key)
+        if disp is None:
+            disp = _DISPATCHERS[key] = NotifyDispatcher(ncfg).start()
+            atexit.register(_shutdown, disp, float(ncfg.get("dispatch", {}).get("exit_flush_seconds", 10)))
+    return disp
+
+
+def _shutdown(disp, flush_seconds):
+    """进程退出前尽量发完（如单次运行），发不完的留在发件箱"""
+    disp.flush(timeout=flush_seconds)
+    disp.close()
+
+
+# ---------- 同步发送（关闭后台投递时） ----------
+
+_SYNC_STATS = {}
+_SYNC_POOL = None
+
+
+def _send_sync(by_sink, sinks, ncfg):
+    """各 sink 并发发送、互不等待对方的重试；失败只记日志"""
+    global _SYNC_POOL
+    d = ncfg.get("dispatch", {})
+    timeout = float(d.get("timeout", 8))
+    max_chars = int(d.get("max_chars", 2000))
+
+    def one(name, messages):
+        stats = _SYNC_STATS.setdefault(name, SinkStats())
+        for text in coalesce(messages, max_chars):
+            t0 = time.perf_counter()
+            try:
+                send(_shared_session(), sinks[name], text, timeout)
+                stats.record(time.perf_counter() - t0)
+            except Exception as e:
+                stats.record(time.perf_counter() - t0, e)
+                logging.error(f"[通知失败-{name}] {e}")
+
+    with _SESSION_LOCK:
+        if _SYNC_POOL is None:
+            _SYNC_POOL = ThreadPoolExecutor(max_workers=int(d.get("pool_size", 4)), thread_name_prefix="notify")
+    futures = [_SYNC_POOL.submit(one, name, msgs) for name, msgs in by_sink.items()]
+    for f in futures:
+        f.result()
+
+
+def notify_signals(signals, config):
+    """
+    signals: [(code, priority, msg), ...]，按 notify.routes 分发到各 sink
+    返回 {sink 名: 条数}（路由结果，不代表已送达）
+    """
+    with stage("notify"):
+        return _notify_signals(signals, config)
+
+
+def _notify_signals(signals, config):
+    ncfg = config["notify"]
+    sinks = resolve_sinks(ncfg)
+    by_sink = route(signals, resolve_routes(ncfg))
+
+    local = {n: m for n, m in by_sink.items() if sinks.get(n, {}).get("type") in LOCAL_TYPES}
+    remote = {n: m for n, m in by_sink.items() if n not in local}
+    for name, messages in local.items():
+        send(None, sinks[name], "\n".join(messages))
+
+    if remote and not ncfg.get("enabled", False):
+        logging.info("[通知] 已关闭")
+        remote = {}
+    if remote:
+        if ncfg.get("dispatch", {}).get("enabled", True):
+            get_dispatcher(config).submit_routed(remote)
+        else:
+            ready = {}
+            for name, messages in remote.items():
+                if name not in sinks:
+                    logging.warning(f"[通知] 路由到未配置的 sink: {name}")
+                elif sink_ready(sinks[name]):
+                    ready[name] = messages
+            _send_sync(ready, sinks, ncfg)
+    return {name: len(m) for name, m in {**local, **remote}.items()}
+
+
+def notify(messages, config):
+    """不带标的信息的消息，按高优先级路由"""
+    return notify_signals([(None, "高", m) for m in messages], config)
+
+
+def sink_stats(config):
+    """各 sink 的发送统计：后台投递时取投递器的，同步发送时取进程内累计的"""
+    ncfg = config["notify"]
+    if ncfg.get("dispatch", {}).get("enabled", True):
+        key = ncfg.get("dispatch", {}).get("outbox") or ":memory:"
+        disp = _DISPATCHERS.get(key)
+        return disp.stats()["sinks"] if disp is not None else {}
+    return {name: st.snapshot() for name, st in _SYNC_STATS.items()}
+
+
+def log_sink_stats(config):
+    for name, st in sink_stats(config).items():
+        if st["sent"] or st["failed"]:
+            logging.info(
+                f"[通知统计] {name}: 成功 {st['sent']}，失败 {st['failed']}，放弃 {st['dead']}，"
+                f"耗时 p50 {st['p50_ms']:.0f}ms / p99 {st['p99_ms']:.0f}ms"
+            )
@@ -0,0 +1,323 @@
+# monitor/quote_manager.py
+"""
+长连接的行情上下文：扫描各轮共用一个 OpenQuoteContext，不再每轮新建/关闭
+  - 配额：每个接口一个令牌桶，burst + rate × 窗口 ≤ OpenD 的“每 30 秒 N 次”，任意窗口都不超限
+  - 优先级：等令牌的请求按优先级排队，持仓标的（set_priority_codes）先发
+  - 限频/断线：OpenD 返回“频率太高”时退避重试；连接断开（异常或断线错误）时重建上下文，
+    恢复推送回调与已有订阅后重试
+  - 订阅额度：按 (code, SubType) 计数，超出 sub_quota 的部分不订阅并记警告
+  - 统计：各接口请求数、排队等待秒数、被限频/重试/重连次数、订阅占用
+ManagedQuoteContext 与 OpenQuoteContext 接口相同，KlineFetcher / StreamRunner / Universe 直接使用。
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from futu import *
+
+# OpenD 默认频率限制（每 30 秒次数）；get_cur_kline 等读本地订阅数据的接口也按此节流，避免瞬时打满
+DEFAULT_LIMITS = {
+    "get_cur_kline": {"count": 60, "seconds": 30},
+    "request_history_kline": {"count": 60, "seconds": 30},
+    "get_market_snapshot": {"count": 60, "seconds": 30},
+    "get_stock_basicinfo": {"count": 10, "seconds": 30},
+    "subscribe": {"count": 60, "seconds": 30},
+}
+_THROTTLE_MARKERS = ("频率", "too frequent", "frequency")
+_DISCONNECT_MARKERS = ("连接", "断开", "disconnect", "not connected", "connection")
+
+HIGH, NORMAL = 0, 1
+
+
+class TokenBucket:
+    """容量 burst，每秒补 rate 个；count/seconds 的窗口限制下取 burst = count // 2"""
+
+    def __init__(self, count, seconds, burst=None, clock=time.monotonic):
+        self.burst = max(int(burst if burst is not None else count // 2), 1)
+        self.rate = max(count - self.burst, 1) / float(seconds)
+        self.tokens = float(self.burst)
+        self.clock = clock
+        self._t = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._t) * self.rate)
+        self._t = now
+
+    def try_take(self):
+        """取到返回 0，否则返回还需等待的秒数"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class QuotaScheduler:
+    """每个接口一个令牌桶 + 优先级队列（数值小的先发，同级先到先发）"""
+
+    def __init__(self, limits=None, clock=time.monotonic):
+        limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.buckets = {api: TokenBucket(spec["count"], spec["seconds"], spec.get("burst"), clock)
+                        for api, spec in limits.items()}
+        self._cond = threading.Condition()
+        self._waiters = {api: [] for api in self.buckets}
+        self._seq = itertools.count()
+        self.waited = 0.0
+
+    def waiting(self, api=None):
+        with self._cond:
+            if api is not None:
+                return len(self._waiters.get(api, ()))
+            return sum(len(w) for w in self._waiters.values())
+
+    def acquire(self, api, priority=NORMAL):
+        """阻塞到轮到自己且有令牌；未配置限额的接口直接放行。返回排队秒数"""
+        bucket = self.buckets.get(api)
+        if bucket is None:
+            return 0.0
+        t0 = time.monotonic()
+        with self._cond:
+            entry = (priority, next(self._seq))
+            heap = self._waiters[api]
+            heapq.heappush(heap, entry)
+            while True:
+                if heap[0] == entry:
+                    wait = bucket.try_take()
+                    if wait <= 0:
+                        heapq.heappop(heap)
+                        self._cond.notify_all()
+                        break
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+        waited = time.monotonic() - t0
+        with self._cond:
+            self.waited += waited
+        return waited
+
+
+def _message(data):
+    return str(data).lower()
+
+
+class ManagedQuoteContext:
+    """
+    factory: 无参可调用，返回新的 OpenQuoteContext（或测试用 FakeQuoteContext）
+    所有带 code 的请求按 priority_codes 决定优先级
+    """
+
+    def __init__(self, factory, limits=None, sub_quota=100, max_retries=3, backoff=1.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.factory = factory
+        self.scheduler = QuotaScheduler(limits, clock)
+        self.sub_quota = int(sub_quota)
+        self.max_retries = int(max_retries)
+        self.backoff = float(backoff)
+        self.sleep = sleep
+        self.priority_codes = set()
+        self._ctx = None
+        self._ctx_lock = threading.Lock()
+        self._reconnect_lock = threading.Lock()
+        self._handler = None
+        self.subscribed = {}           # (code, SubType) -> 订阅顺序（重连后按原顺序恢复）
+        self._stats_lock = threading.Lock()
+        self.calls = {}                # api -> 次数
+        self.throttled = 0
+        self.retried = 0
+        self.reconnects = 0
+        self.errors = 0
+
+    # ---------- 连接 ----------
+
+    def ctx(self):
+        with self._ctx_lock:
+            if self._ctx is None:
+                self._ctx = self.factory()
+            return self._ctx
+
+    def reconnect(self, failed=None):
+        """
+        新建连接、恢复推送回调与订阅后再替换旧连接并关闭它
+        failed 为调用方出错时用的连接：同一时刻只重连一次，failed 已被别的线程换掉时直接返回
+        """
+        with self._reconnect_lock:
+            with self._ctx_lock:
+                old = self._ctx
+            if failed is not None and old is not failed:
+                return
+            ctx = self.factory()
+            if self._handler is not None:
+                ctx.set_handler(self._handler)
+            if self.subscribed:
+                by_type = {}
+                for code, sub in sorted(self.subscribed, key=self.subscribed.get):
+                    by_type.setdefault(sub, []).append(code)
+                for sub, codes in by_type.items():
+                    ret, err = ctx.subscribe(codes, [sub])
+                    if ret != RET_OK:
+                        logging.error(f"[OpenD] 重连后恢复订阅失败: {err}")
+            with self._ctx_lock:
+                self._ctx = ctx
+                self.reconnects += 1
+            if old is not None:
+                try:
+                    old.close()
+                except Exception as e:
+                    logging.warning(f"[OpenD] 关闭旧连接出错: {e}")
+            logging.info(f"[OpenD] 已重连（第 {self.reconnects} 次），恢复订阅 {len(self.subscribed)} 项")
+
+    def close(self):
+        with self._ctx_lock:
+            if self._ctx is not None:
+                self._ctx.close()
+                self._ctx = None
+
+    # ---------- 调度 ----------
+
+    def set_priority_codes(self, codes):
+        """持仓等需要优先拉取的标的"""
+        self.priority_codes = set(codes)
+
+    def _priority(self, code):
+        if isinstance(code, str):
+            return HIGH if code in self.priority_codes else NORMAL
+        return HIGH if self.priority_codes.intersection(code or ()) else NORMAL
+
+    def _count(self, field, api=None):
+        with self._stats_lock:
+            if api is not None:
+                self.calls[api] = self.calls.get(api, 0) + 1
+            else:
+                setattr(self, field, getattr(self, field) + 1)
+
+    def _call(self, api, code, *args, **kwargs):
+        """配额排队 → 调用；限频退避重试，断线重连重试；返回值与原接口一致"""
+        priority = self._priority(code)
+        res = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._count("retried")
+            self.scheduler.acquire(api, priority)
+            self._count(None, api)
+            ctx = self.ctx()
+            try:
+                res = getattr(ctx, api)(*args, **kwargs)
+            except OSError as e:
+                # 只有连接/网络类异常才重连；其余异常是调用错误，照常抛出
+                self._count("errors")
+                logging.warning(f"[OpenD] {api} 连接异常，重连后重试: {e}")
+                self.reconnect(ctx)
+                continue
+            if res[0] == RET_OK:
+                return res
+            msg = _message(res[1])
+            if any(m in msg for m in _THROTTLE_MARKERS):
+                self._count("throttled")
+                delay = self.backoff * 2 ** attempt
+                logging.warning(f"[OpenD] {api} 被限频，{delay:.1f}s 后重试")
+                self.sleep(delay)
+                continue
+            if any(m in msg for m in _DISCONNECT_MARKERS):
+                self._count("errors")
+                logging.warning(f"[OpenD] {api} 连接异常，重连后重试: {res[1]}")
+                self.reconnect(ctx)
+                continue
+            self._count("errors")
+            return res
+        if res is None:
+            return RET_ERROR, f"{api} 重试 {self.max_retries} 次仍失败"
+        return res
+
+    # ---------- OpenQuoteContext 接口 ----------
+
+    def get_cur_kline(self, code, num, ktype=KLType.K_DAY, autype=AuType.QFQ):
+        return self._call("get_cur_kline", code, code, num, ktype=ktype, autype=autype)
+
+    def request_history_kline(self, code, start=None, end=None, ktype=KLType.K_DAY, autype=AuType.QFQ,
+                              fields=None, max_count=1000, page_req_key=None, **kwargs):
+        return self._call("request_history_kline", code, code, start=start, end=end, ktype=ktype,
+                          autype=autype, fields=fields, max_count=max_count, page_req_key=page_req_key, **kwargs)
+
+    def get_market_snapshot(self, code_list):
+        return self._call("get_market_snapshot", code_list, code_list)
+
+    def get_stock_basicinfo(self, market, stock_type=SecurityType.STOCK, code_list=None):
+        return self._call("get_stock_basicinfo", None, market, stock_type, code_list=code_list)
+
+    def set_handler(self, handler):
+        self._handler = handler
+        return self.ctx().set_handler(handler)
+
+    def subscribe(self, code_list, subtype_list, is_first_push=True, subscribe_push=True, **kwargs):
+        """
+        按额度订阅：已订阅的不重复占用；额度不够时优先级高的标的先订，其余不订并记警告
+        返回 (ret, err)；部分订阅成功也返回 RET_OK
+        """
+        codes = sorted(code_list, key=lambda c: self._priority(c))
+        want = [(c, s) for c in codes for s in subtype_list if (c, s) not in self.subscribed]
+        room = self.sub_quota - len(self.subscribed)
+        if len(want) > room:
+            logging.warning(f"[OpenD] 订阅额度不足：需 {len(want)} 项，剩余 {max(room, 0)} 项，其余不订阅")
+            want = want[:max(room, 0)]
+        if not want:
+            return RET_OK, None
+        by_type = {}
+        for c, s in want:
+            by_type.setdefault(s, []).append(c)
+        for sub, sub_codes in by_type.items():
+            ret, err = self._call("subscribe", sub_codes, sub_codes, [sub],
+                                  is_first_push=is_first_push, subscribe_push=subscribe_push, **kwargs)
+            if ret != RET_OK:
+                return ret, err
+            for c in sub_codes:
+                self.subscribed[(c, sub)] = len(self.subscribed)
+        return RET_OK, None
+
+    def unsubscribe(self, code_list, subtype_list):
+        """释放额度（OpenD 要求订阅满 1 分钟后才能退订）"""
+        ret, err = self.ctx().unsubscribe(code_list, subtype_list)
+        if ret == RET_OK:
+            for c in code_list:
+                for s in subtype_list:
+                    self.subscribed.pop((c, s), None)
+        return ret, err
+
+    # ---------- 统计 ----------
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "calls": dict(self.calls), "waited": round(self.scheduler.waited, 3),
+                "throttled": self.throttled, "retried": self.retried, "reconnects": self.reconnects,
+                "errors": self.errors, "subscribed": len(self.subscribed), "sub_quota": self.sub_quota,
+            }
+
+    def log_stats(self):
+        st = self.stats()
+        logging.info(
+            f"[OpenD] 请求 {sum(st['calls'].values())} 次，配额排队 {st['waited']:.1f}s，"
+            f"限频 {st['throttled']} 次，重试 {st['retried']} 次，重连 {st['reconnects']} 次，"
+            f"订阅 {st['subscribed']}/{st['sub_quota']}"
+        )
+
+
+def quote_manager(cfg, factory=None):
+    """按 config["opend"] 建 ManagedQuoteContext；factory 默认连 config["futu"] 的 OpenD"""
+    ocfg = cfg.get("opend", {})
+    if factory is None:
+        futu_cfg = cfg.get("futu", {})
+        host, port = futu_cfg.get("host", "127.0.0.1"), futu_cfg.get("port", 11111)
+
+        def factory():
+            return OpenQuoteContext(host=host, port=port)
+    return ManagedQuoteContext(
+        factory,
+        limits=ocfg.get("limits"),
+        sub_quota=ocfg.get("sub_quota", 100),
+        max_retries=ocfg.get("max_retries", 3),
+        backoff=ocfg.get("backoff_seconds", 1.0),
+    )
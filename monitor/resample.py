@@ -0,0 +1,154 @@
+# monitor/resample.py
+"""
+K线重采样：把 60m（或更细）K线按交易时段对齐合并成 2h/4h/任意分钟数的K线
+  - 分桶：每根K线按 time_key（K线结束时间）算出当日已交易分钟数（午休不计），
+    除以目标分钟数得到桶号；同一交易日同一桶合成一根，不跨日、不跨午休错位
+  - 聚合：开=首根开、高=最高、低=最低、收=末根收、量/额=求和；time_key 取末根（与 futu 一致为结束时间）
+  - 向量化：桶号相邻不同处即分组边界，np.*.reduceat 一次聚合
+  - Resampler 跨轮次缓存已完成的高周期K线，每次只重算缓存之后的尾部（通常只有形成中的一根）
+窗口口径：窗口内第一组可能只截到一部分，丢弃；最后一组是形成中的K线，保留。
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .utils import session_minutes
+
+# 由 60m 合成的周期 → 目标分钟数
+PERIOD_MINUTES = {"2h": 120, "4h": 240}
+OHLC = ("open", "high", "low", "close", "volume", "turnover")
+
+
+def _times(df):
+    return pd.to_datetime(df["time_key"]).to_numpy(dtype="datetime64[ns]")
+
+def bucket_keys(times, code, minutes):
+    """
+    times: datetime64 数组（K线结束时间，交易所当地时间）→ int64 桶键，同一交易日同一桶相同
+    盘前的K线并入第一桶，盘后的并入最后一桶
+    """
+    t = np.asarray(times).astype("datetime64[m]")
+    day = t.astype("datetime64[D]")
+    minute = (t - day).astype(np.int64)
+    elapsed = np.zeros(len(t), dtype=np.int64)
+    for start, end in session_minutes(code):
+        elapsed += np.clip(minute - start, 0, end - start)
+    bucket = np.maximum(-(-elapsed // minutes) - 1, 0)
+    return day.astype(np.int64) * 10000 + bucket
+
+def group_starts(keys):
+    """桶键 → 每组第一根的下标"""
+    keys = np.asarray(keys)
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+def aggregate(df, starts):
+    """按组起点聚合；返回 DataFrame(time_key, open..turnover 中 df 有的列, src_first, src_last)"""
+    n = len(df)
+    ends = np.append(starts[1:], n) - 1
+    keys = df["time_key"].astype(str).to_numpy()
+    out = {"time_key": keys[ends]}
+    if "open" in df.columns:
+        out["open"] = df["open"].to_numpy(dtype=float)[starts]
+    if "high" in df.columns:
+        out["high"] = np.maximum.reduceat(df["high"].to_numpy(dtype=float), starts)
+    if "low" in df.columns:
+        out["low"] = np.minimum.reduceat(df["low"].to_numpy(dtype=float), starts)
+    out["close"] = df["close"].to_numpy(dtype=float)[ends]
+    for col in ("volume", "turnover"):
+        if col in df.columns:
+            out[col] = np.add.reduceat(df[col].to_numpy(dtype=float), starts)
+    out["src_first"] = keys[starts]
+    out["src_last"] = keys[ends]
+    return pd.DataFrame(out)
+
+def _code_of(df, code):
+    if code is None and "code" in df.columns and len(df):
+        code = str(df["code"].iloc[0])
+    return code
+
+def resample_frame(df, minutes, code=None, drop_first=False):
+    """
+    df: 按时间升序的K线（time_key, open/high/low/close, volume/turnover 可缺）
+    drop_first: 丢弃第一组（窗口起点可能截断了该组）
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=["time_key", *[c for c in OHLC if c in getattr(df, "columns", OHLC)]])
+    starts = group_starts(bucket_keys(_times(df), _code_of(df, code), minutes))
+    out = aggregate(df, starts)
+    if drop_first:
+        out = out.iloc[1:]
+    return out.drop(columns=["src_first", "src_last"]).reset_index(drop=True)
+
+
+class Resampler:
+    """
+    跨轮次缓存已完成的高周期K线（每个 (code, minutes) 一份）
+      - 缓存里记着最后一根已完成K线所含的最后一根源K线（time_key + 收盘价）
+      - 新一轮的 df 里找到这根且收盘价未变 → 只对其后的尾部分组聚合；否则（断档/复权）整段重算
+    结果与 resample_frame(df, minutes, drop_first=True) 相同
+    """
+
+    def __init__(self, max_bars=2000):
+        self.max_bars = max_bars
+        self._entries = {}     # (code, minutes) -> (finished DataFrame, last_src_key, last_src_close)
+        self._lock = threading.Lock()
+        self.incremental = 0   # 复用缓存、只算尾部的次数
+        self.rebuilds = 0      # 整段重算的次数
+
+    def resample(self, df, minutes, code=None):
+        code = _code_of(df, code)
+        if df is None or df.empty:
+            return resample_frame(df, minutes, code)
+        keys = df["time_key"].astype(str).to_numpy()
+        close = df["close"].to_numpy(dtype=float)
+        key = (code, minutes)
+        with self._lock:
+            entry = self._entries.get(key)
+
+        done, start = None, 0
+        if entry is not None:
+            finished, last_key, last_close = entry
+            pos = np.flatnonzero(keys == last_key)
+            if len(pos) and close[pos[-1]] == last_close:
+                done, start = finished, int(pos[-1]) + 1
+        with self._lock:
+            if done is not None:
+                self.incremental += 1
+            else:
+                self.rebuilds += 1
+
+        tail = df.iloc[start:]
+        if len(tail):
+            agg = aggregate(tail, group_starts(bucket_keys(_times(tail), code, minutes)))
+        else:
+            agg = None
+        if agg is not None and len(agg) >= 2:
+            # 除最后一组外都已完成（后面已有下一组的K线）
+            finished = agg.iloc[:-1] if done is None else pd.concat([done, agg.iloc[:-1]], ignore_index=True)
+            finished = finished.tail(self.max_bars).reset_index(drop=True)
+            last_src = finished["src_last"].iloc[-1]
+            last_close = close[start:][np.flatnonzero(tail["time_key"].astype(str).to_numpy() == last_src)[-1]]
+            with self._lock:
+                self._entries[key] = (finished, last_src, float(last_close))
+            done = finished
+            agg = agg.iloc[-1:]
+        parts = [p for p in (done, agg) if p is not None and len(p)]
+        out = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+        # 与整段重算同口径：只保留起点在窗口第一根之后的组
+        out = out[out["src_first"] > keys[0]]
+        return out.drop(columns=["src_first", "src_last"]).reset_index(drop=True)
+
+    def invalidate(self, code=None):
+        with self._lock:
+            if code is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] == code]:
+                del self._entries[key]
+
+    def stats(self):
+        return {"incremental": self.incremental, "rebuilds": self.rebuilds, "entries": len(self._entries)}
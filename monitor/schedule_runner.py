@@ -1,81 +1,319 @@
 import time
 import logging
+import multiprocessing
 import schedule
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from futu import *
-from .trend import check_trend_single_period, aggregate_multiperiod, decide_priority
+from .trend import check_trend_single_period, evaluate_period, period_series, aggregate_multiperiod, decide_priority
+from .batch import batch_evaluate
+from .kline_fetch import KlineFetcher, KlineCache, PERIOD_KLTYPE
+from .bar_archive import BarArchive
+from .resample import Resampler
+from .universe import Universe, scan_codes
+from .memo import PeriodMemo, closed_bars
+from .quote_manager import quote_manager
+from .bus import publish, publish_code
 from .holdings import get_holdings
-from .notify import notify
-from .utils import cooldown_checker, is_market_open
+from .notify import notify_signals, log_sink_stats
+from . import metrics
+from .trading_calendar import get_calendar
+from .utils import cooldown_checker, local_now
 
-def _scan_once(quote_ctx, cfg):
-    holdings = get_holdings()
-    watchlist = cfg.get("watchlist", [])
-    messages_high = []
-    messages_mid = []
+class ScanRuntime:
+    """
+    跨轮次保留的扫描状态（由 run_schedule 持有；单次 run_once 时每次新建）
+      - kline_cache: 增量K线缓存，首轮全量，之后只拉最新几根
+      - archive: 本地K线归档，拉到的K线追加落盘（可关）
+      - resampler: 已完成的 2h/4h K线缓存，每轮只重算形成中的一根
+      - universe: 全市场模式的股票列表缓存与快照配额
+      - memo: 单周期缓存（已收盘前缀指纹 + 配置哈希，只按末根重算），closed_only 时只用已收盘K线
+      - calendar: 交易日历；market_filter 打开时（轮询模式 + market_open_check）每轮只算开市市场的标的
+      - quote_ctx(): 长连接的 ManagedQuoteContext（配额排队、限频重试、断线重连），跨轮复用
+      - ticks: 已跑的轮次（按 metrics.profile.every 决定哪轮做 profile）
+      - 线程池（拉取/逐标的计算）与可选进程池（FFT/小波/回归等纯计算），跨轮复用
+    """
+
+    def __init__(self, cfg):
+        cache_cfg = cfg.get("kline_cache", {})
+        self.kline_cache = None
+        if cache_cfg.get("enabled", True):
+            self.kline_cache = KlineCache(
+                cfg["kline_num"],
+                tail_num=cache_cfg.get("tail_num", 5),
+                jump_tolerance=cache_cfg.get("jump_tolerance", 0.001),
+            )
+
+        archive_cfg = cfg.get("archive", {})
+        self.archive = BarArchive(archive_cfg.get("path", "data/bars")) if archive_cfg.get("enabled", False) else None
+        self.resampler = Resampler(max_bars=cfg["kline_num"])
+        self.universe = Universe(cfg)
+        memo_cfg = cfg.get("memo", {})
+        self.memo = PeriodMemo(memo_cfg.get("max_entries", 4096)) if memo_cfg.get("enabled", False) else None
+        self.closed_only = memo_cfg.get("closed_bars_only", False)
+        self.calendar = get_calendar(cfg)
+        self.market_filter = False
+        self.cfg = cfg
+        self._quote = None
+        self.ticks = 0
+        metrics.configure(cfg)
+
+        conc = cfg["schedule"].get("concurrency", {})
+        self.mode = conc.get("mode", "serial")              # serial / thread / batch
+        self.max_workers = int(conc.get("max_workers", 8))
+        self.process_workers = int(conc.get("process_workers", 0))
+        self._thread_pool = None
+        self._process_pool = None
+
+    def quote_ctx(self):
+        if self._quote is None:
+            self._quote = quote_manager(self.cfg)
+        return self._quote
+
+    def thread_pool(self):
+        if self.mode != "thread":
+            return None
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="scan")
+        return self._thread_pool
+
+    def evaluator(self):
+        """配置了 process_workers 时返回投递到进程池的 evaluate_period，否则 None（在本线程算）"""
+        if self.process_workers <= 0:
+            return None
+        if self._process_pool is None:
+            # spawn：扫描线程已在运行，fork 可能继承到被持有的锁
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.process_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        pool = self._process_pool
+
+        def run(close, turnover, period_label, cfg):
+            return pool.submit(evaluate_period, close, turnover, period_label, cfg).result()
+        return run
+
+    def close(self):
+        if self._quote is not None:
+            self._quote.close()
+            self._quote = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown()
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+            self._process_pool = None
+
+def _build_message(code, period_results, holdings, cfg):
+    """
+    多周期汇总 → 持仓方向过滤 → 冷却 → 优先级
+    返回 (priority, msg) 或 None
+    """
+    with metrics.stage("aggregate"):
+        final_action, score, used_periods, sources, _ = aggregate_multiperiod(
+            period_results, cfg["indicators"].get("confirm_level", 2)
+        )
+    if not final_action:
+        return None
+
+    # 持仓方向过滤：无仓只提示买入，有仓只提示卖出
+    holding = (code in holdings)
+    if holding and final_action != "卖出":
+        return None
+    if (not holding) and final_action != "买入":
+        return None
+
+    # 冷却
+    if not cooldown_checker(code, "多周期", final_action, cfg["signal"]["cooldown_minutes"], cfg["paths"]["signal_csv"]):
+        return None
+
+    priority = decide_priority(score, used_periods, cfg)
+    color = "🔴" if final_action == "买入" else "🟢"
+    msg = (
+        f"【{code}】 多周期{final_action} {color} 强度: {score}\n"
+        f"周期: {','.join(sorted(used_periods))}\n"
+        f"来源: {','.join(sorted(sources))}\n"
+        f"优先级: {priority}"
+    )
+    publish(cfg, "signal", {
+        "code": code, "action": final_action, "score": score, "priority": priority,
+        "periods": sorted(used_periods), "sources": sorted(sources), "msg": msg,
+    })
+    return priority, msg
+
+def _price_kltype(cfg):
+    """面板上的最新价取最细的那个K线类型"""
+    kl_types = [PERIOD_KLTYPE[p] for p in cfg["periods"]]
+    return KLType.K_60M if KLType.K_60M in kl_types else KLType.K_DAY
+
+def _dispatch(signals, cfg):
+    """
+    signals: [(code, priority, msg), ...]
+    推送策略见 notify.routes（默认：高优先级→通知通道；中优先级→日志；低优先级→忽略）
+    """
+    if signals:
+        notify_signals(signals, cfg)
+        log_sink_stats(cfg)
 
-    for code in watchlist:
+def _batch_outputs(cfg, fetcher, watchlist):
+    """批量模式：同一周期的所有标的拼成矩阵一次算完，结果与逐个计算一致"""
+    results = {code: {} for code in watchlist}
+    for p in cfg["periods"]:
+        codes, series_list = [], []
+        for code in watchlist:
+            ret, df = fetcher.get_period(code, p)
+            if ret != RET_OK or df is None or df.empty:
+                logging.warning(f"[{code} {p}] 拉取K线失败")
+                continue
+            if fetcher.closed_only:
+                df = closed_bars(df, PERIOD_KLTYPE[p], code, fetcher.now)
+                if df.empty:
+                    continue
+            series = period_series(df, p, resampler=fetcher.resampler)
+            if series is not None:
+                codes.append(code)
+                series_list.append(series)
+        for code, res in zip(codes, batch_evaluate(series_list, p, cfg)):
+            results[code][p] = res
+    # 批量模式没有单标的耗时，记为 0
+    return [([results[code][p] for p in cfg["periods"] if results[code].get(p)], 0.0) for code in watchlist]
+
+def _evaluate_watchlist(quote_ctx, cfg, runtime, watchlist):
+    """
+    拉取 + 逐标的多周期计算
+    返回 ([(code, period_results), ...] 按 watchlist 顺序, fetcher, 耗时统计)
+    """
+    pool = runtime.thread_pool()
+    evaluator = runtime.evaluator()
+    t0 = time.perf_counter()
+
+    # 拉取阶段：每个 (code, KLType) 只请求一次，1h/2h/4h 共享 60m 数据
+    fetcher = KlineFetcher(quote_ctx, cfg["kline_num"], cache=runtime.kline_cache, archive=runtime.archive,
+                           resampler=runtime.resampler, memo=runtime.memo, closed_only=runtime.closed_only)
+    with metrics.stage("fetch"):
+        fetcher.prefetch(watchlist, cfg["periods"], executor=pool)
+    t1 = time.perf_counter()
+
+    def scan_code(code):
+        start = time.perf_counter()
         period_results = []
         for p in cfg["periods"]:
-            res = check_trend_single_period(quote_ctx, code, p, cfg)
+            res = check_trend_single_period(quote_ctx, code, p, cfg, fetcher=fetcher, evaluator=evaluator)
             if res:
                 period_results.append(res)
+        cost = time.perf_counter() - start
+        metrics.observe_symbol(cost)
+        return period_results, cost
 
-        final_action, score, used_periods, sources = aggregate_multiperiod(
-            period_results, cfg["indicators"].get("confirm_level", 2)
-        )
-        if not final_action:
-            continue
-
-        # 持仓方向过滤：无仓只提示买入，有仓只提示卖出
-        holding = (code in holdings)
-        if holding and final_action != "卖出":
-            continue
-        if (not holding) and final_action != "买入":
-            continue
-
-        # 冷却
-        if not cooldown_checker(code, "多周期", final_action, cfg["signal"]["cooldown_minutes"], cfg["paths"]["signal_csv"]):
-            continue
-
-        priority = decide_priority(score, used_periods, cfg)
-        color = "🔴" if final_action == "买入" else "🟢"
-        msg = (
-            f"【{code}】 多周期{final_action} {color} 强度: {score}\n"
-            f"周期: {','.join(sorted(used_periods))}\n"
-            f"来源: {','.join(sorted(sources))}\n"
-            f"优先级: {priority}"
-        )
+    # 计算阶段：map 保证结果顺序与 watchlist 一致，与串行路径相同
+    if runtime.mode == "batch":
+        outputs = _batch_outputs(cfg, fetcher, watchlist)
+    elif pool is None:
+        outputs = [scan_code(code) for code in watchlist]
+    else:
+        outputs = list(pool.map(scan_code, watchlist))
+    t2 = time.perf_counter()
+
+    per_code = [cost for _, cost in outputs]
+    timing = {
+        "fetch": t1 - t0,
+        "compute": t2 - t1,
+        "code_mean": (sum(per_code) / len(per_code)) if per_code else 0.0,
+        "code_max": max(per_code) if per_code else 0.0,
+    }
+    return [(code, res) for code, (res, _) in zip(watchlist, outputs)], fetcher, timing
+
+def _scan_once(quote_ctx, cfg, runtime=None):
+    own_runtime = runtime is None
+    runtime = runtime or ScanRuntime(cfg)
+    runtime.ticks += 1
+    try:
+        with metrics.profiled(cfg, runtime.ticks):
+            return _scan_with(quote_ctx, cfg, runtime)
+    finally:
+        if own_runtime:
+            runtime.close()
+
+def _scan_with(quote_ctx, cfg, runtime):
+    holdings = get_holdings()
+    signals = []
+    if hasattr(quote_ctx, "set_priority_codes"):
+        # 配额紧张时持仓先拉，保证卖出信号不被挤掉
+        quote_ctx.set_priority_codes(holdings)
 
-        if priority == "高":
-            messages_high.append(msg)
-        elif priority == "中":
-            messages_mid.append(msg)
+    t0 = time.perf_counter()
+    # 休市市场的标的整轮跳过（全市场模式下也不拉它们的列表和快照）
+    now = local_now()
+    markets = runtime.calendar.open_markets(now) if runtime.market_filter else None
+    # 全市场模式：先按快照粗筛，只对幸存者拉K线
+    watchlist = scan_codes(quote_ctx, cfg, runtime, holdings, markets)
+    if markets is not None:
+        watchlist = runtime.calendar.filter_codes(watchlist, now)
+    evaluated, fetcher, timing = _evaluate_watchlist(quote_ctx, cfg, runtime, watchlist)
 
-    # 推送策略：高优先级→通知通道；中优先级→日志；低优先级→忽略
-    if messages_high:
-        notify(messages_high, cfg)
-    for m in messages_mid:
-        logging.info("[中优先级] " + m)
+    # 汇总/冷却/推送在本线程按 watchlist 顺序进行，通知顺序确定
+    price_kl = _price_kltype(cfg)
+    for code, period_results in evaluated:
+        publish_code(cfg, code, {r["period"]: r for r in period_results}, fetcher.peek(code, price_kl))
+        out = _build_message(code, period_results, holdings, cfg)
+        if out is not None:
+            signals.append((code, *out))
 
-def run_once(cfg):
-    quote_ctx = OpenQuoteContext(host=cfg["futu"]["host"], port=cfg["futu"]["port"])
+    _dispatch(signals, cfg)
+    fetcher.log_stats()
+    if runtime.memo is not None:
+        runtime.memo.log_stats()
+    if hasattr(quote_ctx, "log_stats"):
+        quote_ctx.log_stats()
+    total = time.perf_counter() - t0
+    metrics.observe(metrics.STAGE, total, "tick")
+    metrics.inc("monitor_ticks_total")
+    metrics.inc("monitor_symbols_total", len(watchlist))
+    metrics.publish_snapshot(cfg)
+    logging.info(
+        f"[扫描耗时] 模式 {runtime.mode}（进程 {runtime.process_workers}），{len(watchlist)} 个标的："
+        f"拉取 {timing['fetch']:.2f}s，计算 {timing['compute']:.2f}s，"
+        f"汇总推送 {total - timing['fetch'] - timing['compute']:.2f}s，合计 {total:.2f}s；"
+        f"单标的均值 {timing['code_mean'] * 1000:.1f}ms，最大 {timing['code_max'] * 1000:.1f}ms"
+    )
+    messages_high = [msg for _, priority, msg in signals if priority == "高"]
+    messages_mid = [msg for _, priority, msg in signals if priority == "中"]
+    return messages_high, messages_mid
+
+def run_once(cfg, runtime=None):
+    """runtime 由 run_schedule 传入时沿用其长连接；单次运行时用完即关"""
+    own_runtime = runtime is None
+    runtime = runtime or ScanRuntime(cfg)
     try:
-        _scan_once(quote_ctx, cfg)
+        _scan_once(runtime.quote_ctx(), cfg, runtime)
     finally:
-        quote_ctx.close()
+        if own_runtime:
+            runtime.close()
 
 def run_schedule(cfg):
+    if cfg["schedule"].get("mode", "poll") == "stream":
+        from .stream_runner import run_stream
+        run_stream(cfg)
+        return
+    if cfg["schedule"].get("mode", "poll") == "aligned":
+        from .tick_scheduler import run_aligned
+        run_aligned(cfg)
+        return
+
     interval = int(cfg["schedule"].get("interval_minutes", 5))
     logging.info(f"定时任务启动，每 {interval} 分钟执行一次。")
+    runtime = ScanRuntime(cfg)
+    runtime.market_filter = cfg["schedule"].get("market_open_check", True)
 
     def job():
-        if cfg["schedule"].get("market_open_check", True):
-            if not is_market_open():
-                logging.info("休市，跳过本轮。")
-                return
-        run_once(cfg)
+        if runtime.market_filter and not runtime.calendar.open_markets():
+            logging.info("休市，跳过本轮。")
+            return
+        run_once(cfg, runtime)
 
     schedule.every(interval).minutes.do(job)
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    try:
+        while True:
+            schedule.run_pending()
+            time.sleep(1)
+    finally:
+        runtime.close()
@@ -0,0 +1,161 @@
+# monitor/signal_store.py
+"""
+信号历史存储：SQLite 追加写 + 内存索引
+  - 启动时一次性加载 (code, period, action) → 最近时间戳，冷却判断 O(1)
+  - 每条信号 INSERT 一行，(code, period, action, ts) 有索引，历史查询不用全表扫描
+  - import_csv 导入旧版 signals.csv（同一文件只导入一次）
+"""
+
+import csv
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS signals (
+    id     INTEGER PRIMARY KEY AUTOINCREMENT,
+    code   TEXT    NOT NULL,
+    period TEXT    NOT NULL,
+    action TEXT    NOT NULL,
+    ts     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_signals_key_ts ON signals (code, period, action, ts);
+CREATE INDEX IF NOT EXISTS idx_signals_ts ON signals (ts);
+CREATE TABLE IF NOT EXISTS imports (
+    path  TEXT PRIMARY KEY,
+    rows  INTEGER NOT NULL,
+    ts    INTEGER NOT NULL
+);
+"""
+
+
+class SignalStore:
+    def __init__(self, path):
+        self.path = path
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._last = {}
+        for code, period, action, ts in self._conn.execute(
+            "SELECT code, period, action, MAX(ts) FROM signals GROUP BY code, period, action"
+        ):
+            self._last[(code, period, action)] = ts
+
+    # ---------- 写入 ----------
+
+    def _insert(self, code, period, action, ts):
+        """调用方持有 self._lock"""
+        self._conn.execute(
+            "INSERT INTO signals (code, period, action, ts) VALUES (?, ?, ?, ?)",
+            (code, period, action, ts),
+        )
+        self._conn.commit()
+        key = (code, period, action)
+        if ts > self._last.get(key, -1):
+            self._last[key] = ts
+
+    def record(self, code, period, action, ts=None):
+        ts = int(time.time()) if ts is None else int(ts)
+        with self._lock:
+            self._insert(code, period, action, ts)
+
+    def check_and_record(self, code, period, action, cooldown_minutes, now=None):
+        """冷却期内返回 False；否则记录本次信号并返回 True（判断与写入在同一把锁内，并发只放行一次）"""
+        now = int(time.time()) if now is None else int(now)
+        with self._lock:
+            last = self._last.get((code, period, action))
+            if last is not None and now - last < cooldown_minutes * 60:
+                return False
+            self._insert(code, period, action, now)
+        return True
+
+    def import_csv(self, csv_path):
+        """导入旧版 signals.csv（列 code, period, action, ts）；已导入过的文件跳过，返回导入行数"""
+        if not os.path.exists(csv_path):
+            return 0
+        key = os.path.abspath(csv_path)
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM imports WHERE path = ?", (key,)).fetchone():
+                return 0
+        rows = []
+        with open(csv_path, "r", encoding="utf-8") as f:
+            for r in csv.DictReader(f):
+                try:
+                    rows.append((r["code"], r["period"], r["action"], int(r["ts"])))
+                except (KeyError, TypeError, ValueError):
+                    continue
+        with self._lock:
+            self._conn.executemany("INSERT INTO signals (code, period, action, ts) VALUES (?, ?, ?, ?)", rows)
+            self._conn.execute("INSERT INTO imports (path, rows, ts) VALUES (?, ?, ?)",
+                               (key, len(rows), int(time.time())))
+            self._conn.commit()
+            for code, period, action, ts in rows:
+                k = (code, period, action)
+                if ts > self._last.get(k, -1):
+                    self._last[k] = ts
+        return len(rows)
+
+    # ---------- 查询 ----------
+
+    def last(self, code, period, action):
+        return self._last.get((code, period, action))
+
+    def history(self, code=None, since=None, until=None, limit=None, before_id=None):
+        """
+        按 (ts, id) 升序返回 [{id, code, period, action, ts}, ...]；limit 取最近的 N 条
+        before_id 与 until 一起用作分页游标：只取 (ts, id) < (until, before_id) 的
+        """
+        where, args = [], []
+        if code is not None:
+            where.append("code = ?"); args.append(code)
+        if since is not None:
+            where.append("ts >= ?"); args.append(int(since))
+        if until is not None and before_id is not None:
+            where.append("(ts < ? OR (ts = ? AND id < ?))"); args.extend([int(until), int(until), int(before_id)])
+        elif until is not None:
+            where.append("ts <= ?"); args.append(int(until))
+        sql = "SELECT id, code, period, action, ts FROM signals"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"; args.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [{"id": i, "code": c, "period": p, "action": a, "ts": t} for i, c, p, a, t in reversed(rows)]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def db_path_for(path):
+    """signals.csv → signals.db；已经是 .db/.sqlite 的原样返回"""
+    root, ext = os.path.splitext(path)
+    return root + ".db" if ext.lower() == ".csv" else path
+
+
+def get_store(path):
+    """
+    按路径复用进程内的 SignalStore。
+    path 可以是旧的 signals.csv：数据库放在同名 .db，首次打开时导入该 CSV
+    """
+    db = db_path_for(path)
+    with _STORES_LOCK:
+        store = _STORES.get(db)
+        if store is None:
+            store = SignalStore(db)
+            if db != path:
+                store.import_csv(path)
+            _STORES[db] = store
+    return store
@@ -0,0 +1,229 @@
+# monitor/stream_runner.py
+
+import queue
+import logging
+import time
+from futu import *
+
+from .incremental import IndicatorBank, load_checkpoint, save_checkpoint
+from .trend import check_trend_incremental, check_trend_single_period
+from .kline_fetch import KlineFetcher, KlineCache, PERIOD_KLTYPE
+from .holdings import get_holdings
+from .schedule_runner import ScanRuntime, _build_message, _dispatch, _price_kltype
+from .bus import publish_code
+from . import metrics
+
+# K线类型 → 推送订阅类型
+KLTYPE_SUBTYPE = {
+    KLType.K_60M: SubType.K_60M,
+    KLType.K_DAY: SubType.K_DAY,
+}
+
+
+class BarCloseHandler(CurKlineHandlerBase):
+    """K线推送回调：运行在 futu 推送线程里，只解析并转交给 StreamRunner"""
+
+    def __init__(self, runner):
+        super().__init__()
+        self.runner = runner
+
+    def on_recv_rsp(self, rsp_pb):
+        ret, data = super().on_recv_rsp(rsp_pb)
+        if ret != RET_OK:
+            logging.warning(f"[推送] K线推送解析失败: {data}")
+            return ret, data
+        self.handle_frame(data)
+        return RET_OK, data
+
+    def handle_frame(self, df):
+        """解析后的推送 DataFrame（本地假推送源直接调这里）"""
+        self.runner.on_kline_push(df)
+
+
+class StreamRunner:
+    """
+    推送驱动的扫描：
+      - 订阅 watchlist 的 60m / 日K 推送，推送合并进本地K线缓冲
+      - 某 (code, KLType) 出现新的 time_key → 上一根已收盘 → 只重算该 code 受影响的周期
+      - 其他周期沿用上次结果，再走多周期汇总、冷却与推送
+      - schedule.stream.incremental_indicators 时每个 (code, period) 持有一个 IndicatorBank，
+        MA/MACD/RSI/BOLL 只喂新收盘的K线；stop() 存到 checkpoint，下次启动接着用
+    推送回调只入队，计算在 process_pending 所在线程完成，避免阻塞推送线程。
+    """
+
+    def __init__(self, quote_ctx, cfg, runtime=None):
+        self.quote_ctx = quote_ctx
+        self.cfg = cfg
+        self.runtime = runtime or ScanRuntime(cfg)
+        if self.runtime.kline_cache is None:
+            # 推送模式必须有本地缓冲，即使配置里关闭了增量缓存
+            self.runtime.kline_cache = KlineCache(cfg["kline_num"])
+        self.cache = self.runtime.kline_cache
+        self.period_results = {}   # code -> {period: result 或 None}
+        self._last_key = {}        # (code, kl_type) -> 最新一根 time_key
+        self._events = queue.Queue()
+        self.evaluations = 0       # 累计单周期重算次数
+        scfg = cfg["schedule"].get("stream", {})
+        self.incremental = scfg.get("incremental_indicators", True)
+        self.checkpoint = scfg.get("checkpoint")
+        self.banks = {}            # (code, period) -> IndicatorBank
+        if self.incremental and self.checkpoint:
+            self.banks = load_checkpoint(self.checkpoint)
+            if self.banks:
+                logging.info(f"[推送] 从 {self.checkpoint} 恢复 {len(self.banks)} 组增量指标状态")
+
+    def _kl_types(self):
+        kl_types = []
+        for p in self.cfg["periods"]:
+            kl = PERIOD_KLTYPE[p]
+            if kl not in kl_types:
+                kl_types.append(kl)
+        return kl_types
+
+    def start(self):
+        """订阅推送，并用一次全量拉取建立缓冲与各周期的初始结果"""
+        watchlist = self.cfg.get("watchlist", [])
+        kl_types = self._kl_types()
+
+        self.quote_ctx.set_handler(BarCloseHandler(self))
+        ret, err = self.quote_ctx.subscribe(watchlist, [KLTYPE_SUBTYPE[kl] for kl in kl_types])
+        if ret != RET_OK:
+            logging.error(f"[推送] 订阅K线失败: {err}")
+
+        holdings = get_holdings()
+        fetcher = KlineFetcher(self.quote_ctx, self.cfg["kline_num"], cache=self.cache, archive=self.runtime.archive,
+                               resampler=self.runtime.resampler)
+        fetcher.prefetch(watchlist, self.cfg["periods"])
+        signals = []
+        for code in watchlist:
+            for kl in kl_types:
+                df = self.cache.peek(code, kl)
+                if df is not None:
+                    self._last_key[(code, kl)] = df["time_key"].iloc[-1]
+            self.period_results[code] = {p: self._evaluate(code, p, fetcher) for p in self.cfg["periods"]}
+            self._collect(code, holdings, signals)
+        _dispatch(signals, self.cfg)
+        fetcher.log_stats()
+        logging.info(f"[推送] 已订阅 {len(watchlist)} 个标的，等待K线收盘事件")
+
+    def stop(self):
+        """增量指标状态存盘"""
+        if self.incremental and self.checkpoint and self.banks:
+            save_checkpoint(self.checkpoint, self.banks)
+            logging.info(f"[推送] 增量指标状态已存到 {self.checkpoint}（{len(self.banks)} 组）")
+
+    def _evaluate(self, code, period, fetcher):
+        if not self.incremental:
+            return check_trend_single_period(self.quote_ctx, code, period, self.cfg, fetcher=fetcher)
+        ret, df = fetcher.get_period(code, period)
+        if ret != RET_OK or df is None or df.empty:
+            logging.warning(f"[{code} {period}] 拉取K线失败")
+            return None
+        bank = self.banks.get((code, period))
+        if bank is None:
+            bank = self.banks[(code, period)] = IndicatorBank()
+        return check_trend_incremental(df, period, self.cfg, bank, resampler=fetcher.resampler)
+
+    def on_kline_push(self, df):
+        """推送线程：合并K线，检测收盘并入队"""
+        if df is None or df.empty:
+            return
+        for (code, k_type), rows in df.groupby(["code", "k_type"], sort=False):
+            kl = str(k_type)
+            rows = rows.sort_values("time_key")
+            if not self.cache.apply_push(code, kl, rows):
+                # 缓冲还没建立：让处理线程全量补种子
+                self._events.put((code, kl, None))
+                continue
+            newest = rows["time_key"].iloc[-1]
+            prev = self._last_key.get((code, kl))
+            if prev is not None and newest > prev:
+                self._events.put((code, kl, prev))
+            if prev is None or newest > prev:
+                self._last_key[(code, kl)] = newest
+
+    def _collect(self, code, holdings, signals):
+        results = [r for r in self.period_results.get(code, {}).values() if r]
+        out = _build_message(code, results, holdings, self.cfg)
+        if out is not None:
+            signals.append((code, *out))
+
+    def _on_bar_close(self, code, kl_type, closed_key):
+        """只重算 (code, kl_type) 对应的周期；closed_key 之后尚在形成的K线不参与计算"""
+        df = self.cache.peek(code, kl_type)
+        if df is None:
+            ret, df = self.cache.fetch(self.quote_ctx, code, kl_type)
+            if ret != RET_OK or df is None or df.empty:
+                logging.warning(f"[{code} {kl_type}] 补拉K线失败")
+                return
+            self._last_key[(code, kl_type)] = df["time_key"].iloc[-1]
+        if closed_key is not None:
+            df = df[df["time_key"] <= closed_key].reset_index(drop=True)
+        if self.runtime.archive is not None:
+            self.runtime.archive.append(code, kl_type, df.tail(self.cfg.get("kline_cache", {}).get("tail_num", 5)))
+
+        fetcher = KlineFetcher(self.quote_ctx, self.cfg["kline_num"], resampler=self.runtime.resampler,
+                               memo=self.runtime.memo)
+        fetcher.put(code, kl_type, df)
+        results = self.period_results.setdefault(code, {})
+        for p in self.cfg["periods"]:
+            if PERIOD_KLTYPE[p] == kl_type:
+                results[p] = self._evaluate(code, p, fetcher)
+                self.evaluations += 1
+        publish_code(self.cfg, code, results, df if kl_type == _price_kltype(self.cfg) else None)
+
+    def process_pending(self, timeout=None):
+        """
+        处理已入队的收盘事件；timeout 为等待第一个事件的秒数（None 表示不等待）
+        返回处理的事件数
+        """
+        events = []
+        try:
+            if timeout is None:
+                events.append(self._events.get_nowait())
+            else:
+                events.append(self._events.get(timeout=timeout))
+            while True:
+                events.append(self._events.get_nowait())
+        except queue.Empty:
+            pass
+        if not events:
+            return 0
+
+        t0 = time.perf_counter()
+        touched = []
+        for code, kl_type, closed_key in events:
+            start = time.perf_counter()
+            self._on_bar_close(code, kl_type, closed_key)
+            metrics.observe_symbol(time.perf_counter() - start)
+            if code not in touched:
+                touched.append(code)
+
+        holdings = get_holdings()
+        signals = []
+        for code in touched:
+            self._collect(code, holdings, signals)
+        _dispatch(signals, self.cfg)
+        metrics.observe(metrics.STAGE, time.perf_counter() - t0, "tick")
+        metrics.inc("monitor_ticks_total")
+        metrics.publish_snapshot(self.cfg)
+        return len(events)
+
+    def run_forever(self, poll_seconds=1.0):
+        while True:
+            self.process_pending(timeout=poll_seconds)
+
+
+def run_stream(cfg):
+    logging.info("推送模式启动，按K线收盘事件触发计算。")
+    runtime = ScanRuntime(cfg)
+    try:
+        # 断线重连后由 ManagedQuoteContext 恢复回调与订阅
+        runner = StreamRunner(runtime.quote_ctx(), cfg, runtime)
+        runner.start()
+        try:
+            runner.run_forever()
+        finally:
+            runner.stop()
+    finally:
+        runtime.close()
@@ -0,0 +1,269 @@
+# monitor/sweep.py
+"""
+参数扫描：在历史数据上对 config.json 的权重/阈值做网格或随机搜索。
+  - 指标信号只 prepare 一次（backtest.prepare），各组参数只重新计票/计分/回放
+  - 多进程：预计算数组打包进一块共享内存，子进程启动时挂载，任务只传参数
+  - 每完成一组参数追加写入 JSONL，重启时跳过已完成的组合（断点续跑）
+  - 连续 patience 组没有刷新最优时提前停止
+  - 结果按目标指标排序写出 CSV
+计分复用 trend.score_period / _tally_votes（见 backtest），不另写一套。
+"""
+
+import argparse
+import copy
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from .backtest import PreparedCode, prepare, run, add_data_args, load_bars_args
+
+_ALIGN = 64
+
+# ---------- 参数空间 ----------
+
+def apply_params(cfg, params):
+    """params: {"weights.macd": 3, "signal.priority_high_score": 60, ...} → 新的 cfg"""
+    out = copy.deepcopy(cfg)
+    for dotted, value in params.items():
+        node = out
+        keys = dotted.split(".")
+        for k in keys[:-1]:
+            node = node.setdefault(k, {})
+        node[keys[-1]] = value
+    return out
+
+def grid(space):
+    """space: {key: [取值...]}，按键顺序做笛卡尔积"""
+    keys = list(space)
+    for values in itertools.product(*(space[k] for k in keys)):
+        yield dict(zip(keys, values))
+
+def random_search(space, n_trials, seed=0):
+    """
+    space 的值可以是列表（随机取一个）或 {"min": a, "max": b}（均匀取值，两端都是整数时取整数）
+    """
+    rng = random.Random(seed)
+    for _ in range(n_trials):
+        params = {}
+        for key, spec in space.items():
+            if isinstance(spec, dict):
+                lo, hi = spec["min"], spec["max"]
+                if isinstance(lo, int) and isinstance(hi, int):
+                    params[key] = rng.randint(lo, hi)
+                else:
+                    params[key] = rng.uniform(lo, hi)
+            else:
+                params[key] = rng.choice(list(spec))
+        yield params
+
+def _param_key(params):
+    return json.dumps(params, sort_keys=True, ensure_ascii=False)
+
+# ---------- 单组参数评估 ----------
+
+def evaluate_params(prepared, cfg, params, objective="total_return", min_trades=1):
+    """回放一组参数，返回指标 dict；交易数不足 min_trades 时 objective 记为 NaN"""
+    stats = run(prepared, apply_params(cfg, params)).stats
+    first_h = next(iter(stats["hit_rate"]["买入"]))
+    metrics = {
+        "signals": stats["signals"],
+        "trades": stats["trades"],
+        "win_rate": stats["win_rate"],
+        "avg_pnl": stats["avg_pnl"],
+        "total_return": stats["total_return"],
+        "buy_hit_rate": stats["hit_rate"]["买入"][first_h]["hit_rate"],
+        "sell_hit_rate": stats["hit_rate"]["卖出"][first_h]["hit_rate"],
+    }
+    value = metrics.get(objective, float("nan"))
+    metrics["objective"] = value if stats["trades"] >= min_trades else float("nan")
+    return metrics
+
+# ---------- 共享内存 ----------
+
+def _pack_shared(prepared):
+    """
+    把所有 PreparedCode 的数组拷进一块共享内存
+    返回 (SharedMemory, index, metas)；index: {code: {key: (offset, shape, dtype)}}
+    """
+    layout, total = {}, 0
+    metas = {}
+    for code, pc in prepared.items():
+        metas[code] = pc.meta()
+        layout[code] = {}
+        for key, arr in pc.arrays().items():
+            arr = np.ascontiguousarray(arr)
+            layout[code][key] = (total, arr.shape, arr.dtype.str, arr)
+            total += -(-arr.nbytes // _ALIGN) * _ALIGN
+    shm = shared_memory.SharedMemory(create=True, size=max(total, 1))
+    index = {}
+    for code, entries in layout.items():
+        index[code] = {}
+        for key, (offset, shape, dtype, arr) in entries.items():
+            view = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            view[...] = arr
+            index[code][key] = (offset, shape, dtype)
+    return shm, index, metas
+
+def _attach_shared(shm, index, metas):
+    prepared = {}
+    for code, entries in index.items():
+        arrays = {
+            key: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            for key, (offset, shape, dtype) in entries.items()
+        }
+        prepared[code] = PreparedCode.from_arrays(metas[code], arrays)
+    return prepared
+
+# 子进程内的全局状态（initializer 里挂载一次）
+_WORKER = {}
+
+def _init_worker(shm_name, index, metas, cfg, objective, min_trades):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _WORKER.update(shm=shm, prepared=_attach_shared(shm, index, metas), cfg=cfg,
+                   objective=objective, min_trades=min_trades)
+
+def _worker_eval(params):
+    w = _WORKER
+    return evaluate_params(w["prepared"], w["cfg"], params, w["objective"], w["min_trades"])
+
+# ---------- 扫描主流程 ----------
+
+def _load_done(path):
+    done = []
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        done.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # 上次中断时写了半行，丢弃
+                        logging.warning("[参数扫描] 检查点末行不完整，已忽略")
+    return done
+
+def _better(a, b):
+    return not math.isnan(a) and (b is None or a > b)
+
+def sweep(prepared, cfg, trials, objective="total_return", workers=0, checkpoint=None,
+          patience=None, min_trades=1):
+    """
+    trials: 参数 dict 的可迭代对象（grid / random_search）
+    workers: 0 表示在当前进程串行；>0 为进程数
+    checkpoint: JSONL 路径，已有记录的参数组合不再重算
+    patience: 连续多少组没有刷新最优就停止（None 不提前停）
+    返回按 objective 降序排列的 DataFrame
+    """
+    records = _load_done(checkpoint)
+    done = {_param_key(r["params"]) for r in records}
+    best, stale = None, 0
+    for r in records:
+        if _better(r["metrics"]["objective"], best):
+            best, stale = r["metrics"]["objective"], 0
+        else:
+            stale += 1
+    if records:
+        logging.info(f"[参数扫描] 从检查点恢复 {len(records)} 组")
+
+    pending = (p for p in trials if _param_key(p) not in done)
+    out = open(checkpoint, "a", encoding="utf-8") if checkpoint else None
+    shm = executor = None
+    try:
+        if workers > 0:
+            shm, index, metas = _pack_shared(prepared)
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(shm.name, index, metas, cfg, objective, min_trades),
+            )
+        batch_size = max(workers, 1) * 2
+        stopped = patience is not None and stale >= patience
+        while not stopped:
+            batch = list(itertools.islice(pending, batch_size))
+            if not batch:
+                break
+            if executor is not None:
+                results = list(executor.map(_worker_eval, batch))
+            else:
+                results = [evaluate_params(prepared, cfg, p, objective, min_trades) for p in batch]
+            # 按提交顺序记账，检查点与提前停止的判定与进程数无关
+            for params, metrics in zip(batch, results):
+                rec = {"params": params, "metrics": metrics}
+                records.append(rec)
+                if out:
+                    out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                    out.flush()
+                if _better(metrics["objective"], best):
+                    best, stale = metrics["objective"], 0
+                else:
+                    stale += 1
+                if patience is not None and stale >= patience:
+                    logging.info(f"[参数扫描] 连续 {patience} 组无提升，提前停止")
+                    stopped = True
+                    break
+    finally:
+        if out:
+            out.close()
+        if executor is not None:
+            executor.shutdown()
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    return rank(records)
+
+def rank(records):
+    rows = [{**r["params"], **r["metrics"]} for r in records]
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return df
+    return df.sort_values("objective", ascending=False, na_position="last", kind="stable").reset_index(drop=True)
+
+# ---------- 命令行 ----------
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="在历史K线上扫描权重/阈值")
+    add_data_args(ap)
+    ap.add_argument("--config", default="config.json")
+    ap.add_argument("--search", choices=["grid", "random"], default=None)
+    ap.add_argument("--trials", type=int, default=None, help="随机搜索的组数")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--out", default="data/sweep")
+    args = ap.parse_args(argv)
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    scfg = cfg.get("sweep", {})
+    search = args.search or scfg.get("search", "grid")
+    space = scfg.get("space", {})
+    if search == "grid":
+        trials = grid(space)
+    else:
+        trials = random_search(space, args.trials or scfg.get("trials", 200), seed=scfg.get("seed", 0))
+    workers = args.workers if args.workers is not None else scfg.get("workers", os.cpu_count() or 1)
+
+    os.makedirs(args.out, exist_ok=True)
+    prepared = prepare(load_bars_args(args), cfg)
+    table = sweep(
+        prepared, cfg, trials,
+        objective=scfg.get("objective", "total_return"),
+        workers=workers,
+        checkpoint=os.path.join(args.out, "trials.jsonl"),
+        patience=scfg.get("patience"),
+        min_trades=scfg.get("min_trades", 1),
+    )
+    table.to_csv(os.path.join(args.out, "ranked.csv"), index=False)
+    print(table.head(20).to_string())
+
+if __name__ == "__main__":
+    main()
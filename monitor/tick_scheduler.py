@@ -0,0 +1,278 @@
+# monitor/tick_scheduler.py
+"""
+按K线收盘对齐的扫描调度（schedule.mode = "aligned"，可选；默认仍是 poll 定时轮询）：
+  注意：对齐模式只在K线收盘后计算，不会出盘中（K线形成中）的信号
+  - 各市场、各周期的收盘时刻由 utils.MARKET_SESSIONS 推出：1h 为各根 60m 的结束时间，
+    2h/4h 为按交易时段合并后每组最后一根 60m 的结束时间（与 resample 分桶一致），1d 为当日收盘；
+    交易日按交易日历（节假日不收盘，半日市截到当日收盘）
+  - 醒来时只重算“上次计算之后又有收盘”的 (标的, 周期)，其余周期沿用上次结果再做多周期汇总；
+    1d 一天只算一次
+  - 计算只用截至该周期最近一次收盘的K线（形成中的K线不参与），收盘后等 settle_seconds 再取数
+  - 单线程依次执行，不会重叠：一轮超时错过的收盘点，在下一轮合并成一次计算
+  - 顺序：持仓 → 最近 recent_signal_minutes 内出过信号的 → 其余（同档内积压最久的先算）；
+    按历史单标的耗时估算，到下一个收盘点前算不完的低优先级标的顺延到下一轮（持仓不顺延）
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta
+
+from dateutil import tz
+from futu import *
+
+from . import metrics
+from .bus import publish_code
+from .holdings import get_holdings
+from .kline_fetch import KlineFetcher, PERIOD_KLTYPE
+from .resample import PERIOD_MINUTES
+from .schedule_runner import ScanRuntime, _build_message, _dispatch, _price_kltype
+from .trading_calendar import TradingCalendar
+from .trend import check_trend_single_period
+from .universe import scan_codes
+from .utils import MARKET_TZ, bar_ends, local_now, market_of, session_minutes
+
+_TIME_FMT = "%Y-%m-%d %H:%M:%S"
+
+
+def period_close_minutes(code, period):
+    """code 所属市场一个交易日内 period 的各收盘时刻（当日分钟数）"""
+    ends = bar_ends(code, 60)
+    if period == "1h":
+        return ends
+    if period == "1d":
+        return [ends[-1]]
+    minutes = PERIOD_MINUTES[period]
+    sessions = session_minutes(code)
+    buckets = []
+    for end in ends:
+        elapsed = sum(min(max(end - s, 0), e - s) for s, e in sessions)
+        buckets.append(max(-(-elapsed // minutes) - 1, 0))
+    return [end for i, end in enumerate(ends) if i == len(ends) - 1 or buckets[i + 1] != buckets[i]]
+
+
+class BarCloseSchedule:
+    """(市场, 周期) → 收盘时刻；时间均为交易所当地时间（与K线 time_key 同口径）"""
+
+    def __init__(self, settle_seconds=10, calendar=None):
+        self.settle = timedelta(seconds=settle_seconds)
+        self.calendar = calendar or TradingCalendar()
+        self._minutes = {}
+
+    def minutes(self, market, period):
+        key = (market, period)
+        if key not in self._minutes:
+            self._minutes[key] = period_close_minutes(f"{market}.X", period)
+        return self._minutes[key]
+
+    def day_closes(self, market, period, day):
+        """day 当天的收盘时刻（分钟）：休市日为空；半日市只留收盘前的，并以当日收盘作为最后一个"""
+        sessions = self.calendar.day_sessions(market, day.date())
+        if not sessions:
+            return []
+        mins = self.minutes(market, period)
+        close = sessions[-1][1]
+        if close >= mins[-1]:
+            return mins
+        return [m for m in mins if m < close] + [close]
+
+    @staticmethod
+    def _local(market, now):
+        return now.astimezone(tz.gettz(MARKET_TZ.get(market, "Asia/Shanghai"))).replace(tzinfo=None)
+
+    def last_close(self, market, period, now):
+        """now 之前（已过 settle）最近一次收盘的当地时间；往前找两周仍没有返回 None"""
+        local = self._local(market, now) - self.settle
+        day = datetime.combine(local.date(), datetime.min.time())
+        for back in range(15):
+            d = day - timedelta(days=back)
+            for m in reversed(self.day_closes(market, period, d)):
+                t = d + timedelta(minutes=m)
+                if t <= local:
+                    return t
+        return None
+
+    def next_close(self, market, period, now):
+        """now 之后下一次收盘（含 settle）的绝对时间"""
+        zone = tz.gettz(MARKET_TZ.get(market, "Asia/Shanghai"))
+        local = self._local(market, now) - self.settle
+        day = datetime.combine(local.date(), datetime.min.time())
+        for ahead in range(15):
+            d = day + timedelta(days=ahead)
+            for m in self.day_closes(market, period, d):
+                t = d + timedelta(minutes=m)
+                if t > local:
+                    return (t + self.settle).replace(tzinfo=zone)
+        return None
+
+
+class AlignedRunner:
+    """
+    tick() 算一轮到期的 (标的, 周期)；next_wakeup() 给出下一个收盘点
+    period_results 跨轮保留各周期最近一次的结果，evaluated 记每个 (标的, 周期) 已算到的收盘时刻
+    """
+
+    def __init__(self, cfg, runtime=None):
+        acfg = cfg["schedule"].get("aligned", {})
+        self.cfg = cfg
+        self.runtime = runtime or ScanRuntime(cfg)
+        self.schedule = BarCloseSchedule(acfg.get("settle_seconds", 10), self.runtime.calendar)
+        self.recent_window = timedelta(minutes=acfg.get("recent_signal_minutes", 120))
+        self.budget_ratio = float(acfg.get("budget_ratio", 0.8))
+        self.period_results = {}   # code -> {period: 结果或 None}
+        self.evaluated = {}        # (code, period) -> 已算到的收盘时刻（当地时间）
+        self.recent = {}           # code -> 最近出信号的时间
+        self.code_cost = None      # 单标的耗时（秒）的指数平均
+        self.codes = list(cfg.get("watchlist", []))
+        self.deferred = 0          # 上一轮顺延的标的数
+
+    # ---------- 计划 ----------
+
+    def due(self, code, now):
+        """code 到期的周期 → 该周期最近一次收盘时刻"""
+        market = market_of(code)
+        out = {}
+        for p in self.cfg["periods"]:
+            close = self.schedule.last_close(market, p, now)
+            if close is not None and (self.evaluated.get((code, p)) is None or self.evaluated[(code, p)] < close):
+                out[p] = close
+        return out
+
+    def plan(self, codes, holdings, now):
+        """[(code, {period: 收盘时刻})]，按 持仓 → 最近出信号 → 其余 排序，同档积压久的在前"""
+        recent = {c for c, t in self.recent.items() if now - t <= self.recent_window}
+        items = []
+        for i, code in enumerate(codes):
+            due = self.due(code, now)
+            if not due:
+                continue
+            tier = 0 if code in holdings else (1 if code in recent else 2)
+            oldest = min((self.evaluated.get((code, p)) or datetime.min) for p in due)
+            items.append(((tier, oldest, i), code, due))
+        items.sort(key=lambda x: x[0])
+        return [(code, due) for _, code, due in items]
+
+    def fit_budget(self, plan, holdings, now):
+        """按单标的耗时估算，下一个收盘点前算不完的尾部顺延；持仓总是保留"""
+        if self.code_cost is None or not plan:
+            return plan
+        markets = {market_of(code) for code, _ in plan}
+        nexts = [self.schedule.next_close(m, p, now) for m in markets for p in self.cfg["periods"]]
+        nexts = [t for t in nexts if t is not None]
+        if not nexts:
+            return plan
+        budget = (min(nexts) - now).total_seconds() * self.budget_ratio
+        fit = max(int(budget / self.code_cost), 0) if self.code_cost > 0 else len(plan)
+        keep = max(fit, sum(1 for code, _ in plan if code in holdings))
+        if keep >= len(plan):
+            return plan
+        logging.info(f"[对齐调度] 预计单标的 {self.code_cost * 1000:.0f}ms，距下个收盘 {budget:.0f}s，"
+                     f"本轮算 {keep} 只，{len(plan) - keep} 只顺延")
+        return plan[:keep]
+
+    # ---------- 一轮 ----------
+
+    def _evaluate(self, quote_ctx, fetcher, code, due):
+        """只用截至各周期收盘时刻的K线；返回耗时"""
+        start = time.perf_counter()
+        results = self.period_results.setdefault(code, {})
+        for p, close in due.items():
+            kl = PERIOD_KLTYPE[p]
+            ret, df = fetcher.get(code, kl)
+            if ret != RET_OK or df is None or df.empty:
+                # 不记 evaluated，下一轮仍到期重试
+                logging.warning(f"[{code} {p}] 拉取K线失败")
+                continue
+            local = KlineFetcher(quote_ctx, self.cfg["kline_num"], resampler=fetcher.resampler, memo=fetcher.memo)
+            local.put(code, kl, df[df["time_key"] <= close.strftime(_TIME_FMT)].reset_index(drop=True))
+            results[p] = check_trend_single_period(quote_ctx, code, p, self.cfg, fetcher=local)
+            self.evaluated[(code, p)] = close
+        cost = time.perf_counter() - start
+        metrics.observe_symbol(cost)
+        return cost
+
+    def tick(self, quote_ctx, now=None):
+        """算一轮；返回本轮重算的 (标的, 周期) 数"""
+        now = now or local_now()
+        cfg, runtime = self.cfg, self.runtime
+        holdings = get_holdings()
+        self.codes = scan_codes(quote_ctx, cfg, runtime, holdings)
+        full = self.plan(self.codes, holdings, now)
+        plan = self.fit_budget(full, holdings, now)
+        self.deferred = len(full) - len(plan)
+        if not plan:
+            return 0
+        if hasattr(quote_ctx, "set_priority_codes"):
+            recent = [c for c, t in self.recent.items() if now - t <= self.recent_window]
+            quote_ctx.set_priority_codes(list(holdings) + recent)
+
+        t0 = time.perf_counter()
+        fetcher = KlineFetcher(quote_ctx, cfg["kline_num"], cache=runtime.kline_cache, archive=runtime.archive,
+                               resampler=runtime.resampler, memo=runtime.memo)
+        pool = runtime.thread_pool()
+        # 按到期的 KLType 组合分组，每组一次 prefetch，线程池在所有标的间并发
+        groups = {}
+        for code, due in plan:
+            kls = frozenset(PERIOD_KLTYPE[p] for p in due)
+            groups.setdefault(kls, (list(due), []))[1].append(code)
+        with metrics.stage("fetch"):
+            for periods, codes in groups.values():
+                fetcher.prefetch(codes, periods, executor=pool)
+
+        if pool is None:
+            costs = [self._evaluate(quote_ctx, fetcher, code, due) for code, due in plan]
+        else:
+            costs = list(pool.map(lambda item: self._evaluate(quote_ctx, fetcher, *item), plan))
+        if costs:
+            mean = sum(costs) / len(costs)
+            self.code_cost = mean if self.code_cost is None else 0.7 * self.code_cost + 0.3 * mean
+
+        signals = []
+        price_kl = _price_kltype(cfg)
+        for code, _ in plan:
+            results = self.period_results[code]
+            publish_code(cfg, code, results, fetcher.peek(code, price_kl))
+            out = _build_message(code, [r for r in results.values() if r], holdings, cfg)
+            if out is not None:
+                signals.append((code, *out))
+                self.recent[code] = now
+        _dispatch(signals, cfg)
+
+        total = time.perf_counter() - t0
+        evaluated = sum(len(due) for _, due in plan)
+        metrics.observe(metrics.STAGE, total, "tick")
+        metrics.inc("monitor_ticks_total")
+        metrics.inc("monitor_symbols_total", len(plan))
+        metrics.publish_snapshot(cfg)
+        by_period = {}
+        for _, due in plan:
+            for p in due:
+                by_period[p] = by_period.get(p, 0) + 1
+        logging.info(f"[对齐调度] {len(plan)} 个标的重算 {evaluated} 个周期 {by_period}，"
+                     f"顺延 {self.deferred} 只，耗时 {total:.2f}s")
+        return evaluated
+
+    def next_wakeup(self, now=None):
+        """下一次有收盘的时刻（有顺延的标的时立即再跑）"""
+        now = now or local_now()
+        if self.deferred:
+            return now
+        markets = {market_of(code) for code in self.codes} or {"HK"}
+        nexts = [self.schedule.next_close(m, p, now) for m in markets for p in self.cfg["periods"]]
+        nexts = [t for t in nexts if t is not None]
+        return min(nexts) if nexts else now + timedelta(minutes=5)
+
+
+def run_aligned(cfg):
+    runtime = ScanRuntime(cfg)
+    runner = AlignedRunner(cfg, runtime)
+    logging.info("对齐调度启动：按各周期K线收盘触发计算。")
+    try:
+        while True:
+            try:
+                runner.tick(runtime.quote_ctx())
+            except Exception as e:
+                logging.exception(f"[对齐调度] 本轮异常: {e}")
+            wake = runner.next_wakeup()
+            time.sleep(max((wake - local_now()).total_seconds(), 1.0))
+    finally:
+        runtime.close()
@@ -0,0 +1,163 @@
+# monitor/trading_calendar.py
+"""
+交易日历：各市场的交易时段表（含节假日、半日市），用于开盘判断、按市场过滤标的、收盘对齐调度
+  - 节假日文件（calendar.holidays_file，默认 data/holidays.json）：
+      {"HK": {"holidays": ["2024-02-12", ...], "half_days": {"2024-02-09": "12:00", ...}}, ...}
+    half_days 的值为当日收盘时间（之后的时段不开）；文件里没有的市场按“工作日 + MARKET_SESSIONS”
+  - 按年展开成时段表：每个市场一组有序的 开盘 / 收盘 时间戳（UTC 秒）；
+    is_open / next_open / next_close 各一次 bisect，O(log n)；查询落到已展开年份之外时再扩展
+  - 节假日文件需每年补充下一年的安排（交易所年底前公布）；各市场覆盖到文件里最晚日期所在的年份，
+    查询超出覆盖年份时记警告（该年只按工作日判断）
+"""
+
+import bisect
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+from dateutil import tz
+
+from .utils import MARKET_SESSIONS, MARKET_TZ, local_now, market_of, session_minutes
+
+DEFAULT_HOLIDAYS_FILE = "data/holidays.json"
+
+
+def _minutes(hhmm):
+    h, m = map(int, hhmm.split(":"))
+    return h * 60 + m
+
+
+class TradingCalendar:
+    def __init__(self, holidays=None):
+        self.holidays = {}    # market -> {date, ...}
+        self.half_days = {}   # market -> {date: 收盘分钟数}
+        self.covered = {}     # market -> 节假日数据覆盖到的最后一年
+        for market, spec in (holidays or {}).items():
+            if market.startswith("_"):
+                continue
+            self.holidays[market] = {date.fromisoformat(d) for d in spec.get("holidays", [])}
+            self.half_days[market] = {date.fromisoformat(d): _minutes(t) for d, t in spec.get("half_days", {}).items()}
+            days = self.holidays[market] | set(self.half_days[market])
+            if days:
+                self.covered[market] = max(d.year for d in days)
+        self._warned = set()  # 已警告过的 (market, 年)
+        self._tables = {}     # market -> (起始年, 结束年, [开盘 ts], [收盘 ts])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        if not path or not os.path.exists(path):
+            logging.warning(f"[交易日历] 找不到节假日文件 {path}，只按工作日判断")
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    # ---------- 单日 ----------
+
+    def is_trading_day(self, market, day):
+        return day.weekday() < 5 and day not in self.holidays.get(market, ())
+
+    def day_sessions(self, market, day):
+        """market 在 day 的交易时段 [(开, 收), ...]（当日分钟数）；休市日为空，半日市截到当日收盘"""
+        if not self.is_trading_day(market, day):
+            return []
+        sessions = session_minutes(f"{market}.X")
+        close = self.half_days.get(market, {}).get(day)
+        if close is None:
+            return sessions
+        return [(s, min(e, close)) for s, e in sessions if s < close]
+
+    # ---------- 时段表 ----------
+
+    def _build(self, market, first, last):
+        zone = tz.gettz(MARKET_TZ.get(market, "Asia/Shanghai"))
+        opens, closes = [], []
+        day, end = date(first, 1, 1), date(last, 12, 31)
+        while day <= end:
+            midnight = datetime(day.year, day.month, day.day, tzinfo=zone)
+            for s, e in self.day_sessions(market, day):
+                opens.append((midnight + timedelta(minutes=s)).timestamp())
+                closes.append((midnight + timedelta(minutes=e)).timestamp())
+            day += timedelta(days=1)
+        return first, last, opens, closes
+
+    def _table(self, market, now):
+        """覆盖 now 所在年份前后各一年的时段表（跨年找下一次开盘也够用）"""
+        year = now.year
+        covered = self.covered.get(market)
+        with self._lock:
+            if covered is not None and year > covered and (market, year) not in self._warned:
+                self._warned.add((market, year))
+                logging.warning(f"[交易日历] {market} 节假日数据只到 {covered} 年，{year} 年只按工作日判断，"
+                                f"请更新节假日文件")
+            table = self._tables.get(market)
+            if table is None or year - 1 < table[0] or year + 1 > table[1]:
+                first = year - 1 if table is None else min(table[0], year - 1)
+                last = year + 1 if table is None else max(table[1], year + 1)
+                table = self._tables[market] = self._build(market, first, last)
+            return table
+
+    # ---------- 查询 ----------
+
+    def is_open(self, market, now=None):
+        """market 此刻是否在交易时段内；未知市场视为开市"""
+        if market not in MARKET_SESSIONS:
+            return True
+        now = now or local_now()
+        _, _, opens, closes = self._table(market, now)
+        ts = now.timestamp()
+        i = bisect.bisect_right(opens, ts) - 1
+        return i >= 0 and ts < closes[i]
+
+    def next_open(self, market, now=None):
+        """下一次开盘（交易所当地时间，带时区）；正在交易时返回 now"""
+        now = now or local_now()
+        if self.is_open(market, now):
+            return now
+        _, _, opens, _ = self._table(market, now)
+        i = bisect.bisect_right(opens, now.timestamp())
+        if i >= len(opens):
+            return None
+        return datetime.fromtimestamp(opens[i], tz.gettz(MARKET_TZ.get(market, "Asia/Shanghai")))
+
+    def next_close(self, market, now=None):
+        """当前（或下一个）交易时段的收盘时间"""
+        now = now or local_now()
+        _, _, _, closes = self._table(market, now)
+        i = bisect.bisect_right(closes, now.timestamp())
+        if i >= len(closes):
+            return None
+        return datetime.fromtimestamp(closes[i], tz.gettz(MARKET_TZ.get(market, "Asia/Shanghai")))
+
+    def open_markets(self, now=None, markets=None):
+        now = now or local_now()
+        return {m for m in (markets or MARKET_SESSIONS) if self.is_open(m, now)}
+
+    def filter_codes(self, codes, now=None):
+        """只留所在市场正在交易的标的（无市场前缀的保留）"""
+        now = now or local_now()
+        status = {}
+        out = []
+        for code in codes:
+            m = market_of(code)
+            if m not in status:
+                status[m] = self.is_open(m, now)
+            if status[m]:
+                out.append(code)
+        return out
+
+
+_CALENDARS = {}
+_CALENDARS_LOCK = threading.Lock()
+
+
+def get_calendar(cfg=None):
+    """按节假日文件路径复用进程内的 TradingCalendar"""
+    path = (cfg or {}).get("calendar", {}).get("holidays_file", DEFAULT_HOLIDAYS_FILE)
+    with _CALENDARS_LOCK:
+        cal = _CALENDARS.get(path)
+        if cal is None:
+            cal = _CALENDARS[path] = TradingCalendar.load(path)
+    return cal
@@ -11,9 +11,13 @@ from .trend_math import (
     wavelet_signal,
     rolling_regression_signal,
     hybrid_fft_wavelet_signal,  # 新增混合检测
+    SmoothingContext,
 )
+from .kline_fetch import KlineFetcher, PERIOD_KLTYPE
+from .memo import PrefixEntry, bar_fingerprint, closed_bars
+from .metrics import stage
+from .resample import PERIOD_MINUTES, resample_frame
 
-<<<<<<< HEAD
 # ---------- 小工具 ----------
 
 def _series_ok(arr, min_len=50):
@@ -26,216 +30,257 @@ def _series_ok(arr, min_len=50):
         return False
     return True
 
+def _volume_factor(turnover):
+    """最近一根成交额 / 过去19根均值；数据不足或均值无效返回 None"""
+    if turnover is None or len(turnover) < 20:
+        return None
+    base = np.nanmean(turnover[-20:-1])
+    if base <= 0 or np.isnan(base):
+        return None
+    return float(turnover[-1]) / float(base)
+
 def _volume_spike(turnover, threshold):
     """
     成交额突变：最近一根 / 过去20根均值 >= threshold
     返回 (是否突变, 倍数)
     """
-    if turnover is None or len(turnover) < 20:
-        return False, 0.0
-    base = np.nanmean(turnover[-20:-1])
-    if base <= 0 or np.isnan(base):
+    factor = _volume_factor(turnover)
+    if factor is None:
         return False, 0.0
-    factor = float(turnover[-1]) / float(base)
     return (factor >= threshold), factor
 
-def _apply_period_downsample(close, turnover, period_label):
+def _apply_period_resample(df, period_label, resampler=None):
     """
-    用 60m K 线下采样为 2h / 4h
+    60m K 线按交易时段合并为 2h / 4h（OHLC 聚合、成交额求和），窗口首个不完整的组丢弃
+    返回合并后的 DataFrame；1h/1d 原样返回
     """
-    if period_label == "2h":
-        return close[::2], (turnover[::2] if turnover is not None else None)
-    if period_label == "4h":
-        return close[::4], (turnover[::4] if turnover is not None else None)
-    return close, turnover
+    minutes = PERIOD_MINUTES.get(period_label)
+    if minutes is None:
+        return df
+    if resampler is not None:
+        return resampler.resample(df, minutes)
+    return resample_frame(df, minutes, drop_first=True)
 
 # ---------- 指标投票 ----------
 
-def _indicator_votes(close, indicators_cfg, weights):
+# 计票顺序：(indicators 配置键, 来源名)；权重键与配置键相同
+VOTE_ORDER = [
+    ("ma", "MA"),
+    ("macd", "MACD"),
+    ("rsi", "RSI"),
+    ("boll", "BOLL"),
+    ("fft", "FFT"),
+    ("derivative", "DERIV"),
+    ("wavelet", "WAVELET"),
+    ("hybrid", "HYBRID"),       # 混合：FFT + 小波
+    ("regression", "REG"),
+]
+
+def _indicator_weight(key, weights):
+    if key == "hybrid":
+        return weights.get("hybrid", weights.get("wavelet", 1))  # 若未显式配置，沿用 wavelet 的权重
+    return weights.get(key, 1)
+
+def _cross_signal(fast, slow):
+    """fast 上穿 slow → 买入，下穿 → 卖出（只看最后两根）"""
+    if fast[-1] > slow[-1] and fast[-2] <= slow[-2]:
+        return "买入"
+    if fast[-1] < slow[-1] and fast[-2] >= slow[-2]:
+        return "卖出"
+    return None
+
+def _indicator_signals(close, indicators_cfg):
     """
-    返回：
-      votes_buy, votes_sell, sources, detail_by_indicator
-    其中 detail_by_indicator: { "MACD": "买入/卖出/None", ... }
+    逐个计算已启用指标的信号
+    返回 { 来源名: "买入"/"卖出"/None 或 信号函数原样返回值 }
     """
-    votes_buy = 0
-    votes_sell = 0
-    sources = []
-    detail = {}
+    signals = _classic_signals(close, indicators_cfg)
+    signals.update(_math_signals(close, indicators_cfg))
+    return signals
+
+def _classic_signals(close, indicators_cfg):
+    """传统指标：MA / MACD / RSI / BOLL"""
+    signals = {}
 
-    # ---- 传统指标 ----
     if indicators_cfg.get("ma", True):
+        signals["MA"] = None
         # 需要至少20长度
-        if _series_ok(close, min_len=25):
-            ma5 = talib.SMA(close, timeperiod=5)
-            ma20 = talib.SMA(close, timeperiod=20)
-            w = weights.get("ma", 1)
-            if not (np.isnan(ma5[-2:]).any() or np.isnan(ma20[-2:]).any()):
-                if ma5[-1] > ma20[-1] and ma5[-2] <= ma20[-2]:
-                    votes_buy += w; sources.append("MA"); detail["MA"] = "买入"
-                elif ma5[-1] < ma20[-1] and ma5[-2] >= ma20[-2]:
-                    votes_sell += w; sources.append("MA"); detail["MA"] = "卖出"
-                else:
-                    detail["MA"] = None
-        else:
-            detail["MA"] = None
+        with stage("indicator.MA"):
+            if _series_ok(close, min_len=25):
+                ma5 = talib.SMA(close, timeperiod=5)
+                ma20 = talib.SMA(close, timeperiod=20)
+                if not (np.isnan(ma5[-2:]).any() or np.isnan(ma20[-2:]).any()):
+                    signals["MA"] = _cross_signal(ma5, ma20)
 
     if indicators_cfg.get("macd", True):
-        if _series_ok(close, min_len=35):
-            macd, sig, _ = talib.MACD(close, 12, 26, 9)
-            w = weights.get("macd", 1)
-            if not (np.isnan(macd[-2:]).any() or np.isnan(sig[-2:]).any()):
-                if macd[-1] > sig[-1] and macd[-2] <= sig[-2]:
-                    votes_buy += w; sources.append("MACD"); detail["MACD"] = "买入"
-                elif macd[-1] < sig[-1] and macd[-2] >= sig[-2]:
-                    votes_sell += w; sources.append("MACD"); detail["MACD"] = "卖出"
-                else:
-                    detail["MACD"] = None
-        else:
-            detail["MACD"] = None
+        signals["MACD"] = None
+        with stage("indicator.MACD"):
+            if _series_ok(close, min_len=35):
+                macd, sig, _ = talib.MACD(close, 12, 26, 9)
+                if not (np.isnan(macd[-2:]).any() or np.isnan(sig[-2:]).any()):
+                    signals["MACD"] = _cross_signal(macd, sig)
 
     if indicators_cfg.get("rsi", True):
-        if _series_ok(close, min_len=20):
-            rsi = talib.RSI(close, timeperiod=14)
-            w = weights.get("rsi", 1)
-            if not np.isnan(rsi[-2:]).any():
-                # 过低/过高阈值也可做成配置
-                if rsi[-1] < 30 <= rsi[-2]:
-                    votes_buy += w; sources.append("RSI"); detail["RSI"] = "买入"
-                elif rsi[-1] > 70 >= rsi[-2]:
-                    votes_sell += w; sources.append("RSI"); detail["RSI"] = "卖出"
-                else:
-                    detail["RSI"] = None
-        else:
-            detail["RSI"] = None
+        signals["RSI"] = None
+        with stage("indicator.RSI"):
+            if _series_ok(close, min_len=20):
+                rsi = talib.RSI(close, timeperiod=14)
+                if not np.isnan(rsi[-2:]).any():
+                    # 过低/过高阈值也可做成配置
+                    if rsi[-1] < 30 <= rsi[-2]:
+                        signals["RSI"] = "买入"
+                    elif rsi[-1] > 70 >= rsi[-2]:
+                        signals["RSI"] = "卖出"
 
     if indicators_cfg.get("boll", True):
-        if _series_ok(close, min_len=25):
-            up, mid, low = talib.BBANDS(close, timeperiod=20, nbdevup=2, nbdevdn=2)
-            w = weights.get("boll", 1)
-            if not (np.isnan(up[-2:]).any() or np.isnan(low[-2:]).any()):
-                # 下轨跌破→反弹（买）、上轨突破→回落（卖）
-                if close[-1] > low[-1] and close[-2] <= low[-2]:
-                    votes_buy += w; sources.append("BOLL"); detail["BOLL"] = "买入"
-                elif close[-1] < up[-1] and close[-2] >= up[-2]:
-                    votes_sell += w; sources.append("BOLL"); detail["BOLL"] = "卖出"
-                else:
-                    detail["BOLL"] = None
-        else:
-            detail["BOLL"] = None
-
-    # ---- 数学方法 ----
+        signals["BOLL"] = None
+        with stage("indicator.BOLL"):
+            if _series_ok(close, min_len=25):
+                up, mid, low = talib.BBANDS(close, timeperiod=20, nbdevup=2, nbdevdn=2)
+                if not (np.isnan(up[-2:]).any() or np.isnan(low[-2:]).any()):
+                    # 下轨跌破→反弹（买）、上轨突破→回落（卖）
+                    if close[-1] > low[-1] and close[-2] <= low[-2]:
+                        signals["BOLL"] = "买入"
+                    elif close[-1] < up[-1] and close[-2] >= up[-2]:
+                        signals["BOLL"] = "卖出"
+
+    return signals
+
+def _math_signals(close, indicators_cfg, ctx=None):
+    """
+    数学方法：FFT / 导数 / 小波 / 混合 / 回归（FFT 与小波平滑共用一个 SmoothingContext）
+    ctx: 外部给定的平滑上下文（如结果缓存里前缀已算好的 PrefixSmoothing.context）
+    """
+    signals = {}
+    ctx = ctx or SmoothingContext(close)
     if indicators_cfg.get("fft", True):
-        sig = fft_signal(close)
-        w = weights.get("fft", 1)
-        if sig == "买入":
-            votes_buy += w; sources.append("FFT"); detail["FFT"] = "买入"
-        elif sig == "卖出":
-            votes_sell += w; sources.append("FFT"); detail["FFT"] = "卖出"
-        else:
-            detail["FFT"] = None
-
+        with stage("indicator.FFT"):
+            signals["FFT"] = fft_signal(close, ctx=ctx)
     if indicators_cfg.get("derivative", True):
-        sig = derivative_signal(close)
-        w = weights.get("derivative", 1)
-        if sig == "买入":
-            votes_buy += w; sources.append("DERIV"); detail["DERIV"] = "买入"
-        elif sig == "卖出":
-            votes_sell += w; sources.append("DERIV"); detail["DERIV"] = "卖出"
-        else:
-            detail["DERIV"] = None
-
+        with stage("indicator.DERIV"):
+            signals["DERIV"] = derivative_signal(close)
     if indicators_cfg.get("wavelet", True):
-        sig = wavelet_signal(close)
-        w = weights.get("wavelet", 1)
-        if sig == "买入":
-            votes_buy += w; sources.append("WAVELET"); detail["WAVELET"] = "买入"
-        elif sig == "卖出":
-            votes_sell += w; sources.append("WAVELET"); detail["WAVELET"] = "卖出"
-        else:
-            detail["WAVELET"] = None
-
-    # 混合：FFT + 小波
+        with stage("indicator.WAVELET"):
+            signals["WAVELET"] = wavelet_signal(close, ctx=ctx)
     if indicators_cfg.get("hybrid", True):
-        sig = hybrid_fft_wavelet_signal(close)
-        w = weights.get("hybrid", weights.get("wavelet", 1))  # 若未显式配置，沿用 wavelet 的权重
-        if sig == "买入":
-            votes_buy += w; sources.append("HYBRID"); detail["HYBRID"] = "买入"
-        elif sig == "卖出":
-            votes_sell += w; sources.append("HYBRID"); detail["HYBRID"] = "卖出"
-        else:
-            detail["HYBRID"] = None
-
+        with stage("indicator.HYBRID"):
+            signals["HYBRID"] = hybrid_fft_wavelet_signal(close, ctx=ctx)
     if indicators_cfg.get("regression", True):
-        sig = rolling_regression_signal(close)
-        w = weights.get("regression", 1)
+        with stage("indicator.REG"):
+            signals["REG"] = rolling_regression_signal(close)
+
+    return signals
+
+def _tally_votes(signals, indicators_cfg, weights):
+    """
+    按 VOTE_ORDER 计票；只有 "买入"/"卖出" 计入，其余记为 None
+    返回：votes_buy, votes_sell, sources, detail
+    """
+    votes_buy = 0
+    votes_sell = 0
+    sources = []
+    detail = {}
+    for key, name in VOTE_ORDER:
+        if not indicators_cfg.get(key, True):
+            continue
+        sig = signals.get(name)
+        w = _indicator_weight(key, weights)
         if sig == "买入":
-            votes_buy += w; sources.append("REG"); detail["REG"] = "买入"
+            votes_buy += w; sources.append(name); detail[name] = "买入"
         elif sig == "卖出":
-            votes_sell += w; sources.append("REG"); detail["REG"] = "卖出"
+            votes_sell += w; sources.append(name); detail[name] = "卖出"
         else:
-            detail["REG"] = None
-
+            detail[name] = None
     return votes_buy, votes_sell, sources, detail
 
+def _indicator_votes(close, indicators_cfg, weights):
+    """
+    返回：
+      votes_buy, votes_sell, sources, detail_by_indicator
+    其中 detail_by_indicator: { "MACD": "买入/卖出/None", ... }
+    """
+    return _tally_votes(_indicator_signals(close, indicators_cfg), indicators_cfg, weights)
+
+def _indicator_votes_incremental(bank, close, indicators_cfg, weights):
+    """
+    与 _indicator_votes 相同的返回值；传统指标取自 IndicatorBank 的增量状态（O(1)），
+    数学方法依赖整段窗口，仍按 close 计算
+    """
+    signals = bank.signals(indicators_cfg)
+    signals.update(_math_signals(close, indicators_cfg))
+    return _tally_votes(signals, indicators_cfg, weights)
+
 # ---------- 单周期检测 ----------
 
-def check_trend_single_period(quote_ctx, code, period_label, cfg):
+def period_frame(df, period_label, resampler=None):
+    """K线 DataFrame → 按周期合并后的 DataFrame；数据不足返回 None"""
+    # 基础校验（在 60m 原始K线上做）
+    if not _series_ok(df["close"].to_numpy(dtype=float), min_len=50):
+        return None
+
+    # 合并到 2h/4h
+    with stage("resample"):
+        return _apply_period_resample(df, period_label, resampler)
+
+def period_series(df, period_label, resampler=None):
     """
-    返回：
-      {
-        "period": "1h/2h/4h/1d",
-        "action": "买入/卖出",
-        "score": int,
-        "sources": [指示器...],
-        "detail": { indicator: "买入/卖出/None", ... }
-      }
-    或 None
+    K线 DataFrame → (close, turnover)，已按周期合并；数据不足返回 None
+    resampler: 可选 Resampler，跨轮次缓存已完成的 2h/4h K线
     """
-    # 选择基础K线类型（2h/4h 用 60m 下采样）
-    kl_type = {
-        "1h": KLType.K_60M,
-        "2h": KLType.K_60M,
-        "4h": KLType.K_60M,
-        "1d": KLType.K_DAY
-    }[period_label]
-
-    ret, df = quote_ctx.get_cur_kline(code, cfg["kline_num"], kl_type=kl_type)
-    if ret != RET_OK or df is None or df.empty:
-        logging.warning(f"[{code} {period_label}] 拉取K线失败")
+    df = period_frame(df, period_label, resampler)
+    if df is None:
         return None
+    return _frame_series(df)
 
-    # 成交额与收盘价
+def _frame_series(df):
+    # 成交额与收盘价（df 在本轮各周期间共享，取独立副本；talib 也不接受只读数组）
     turnover = None
     if "turnover" in df.columns:
-        turnover = df["turnover"].astype(float).values
-    elif "turnover" in df:
-        turnover = df["turnover"].astype(float).values
+        turnover = df["turnover"].to_numpy(dtype=float, copy=True)
 
-    close = df["close"].astype(float).values
-
-    # 基础校验
-    if not _series_ok(close, min_len=50):
+    close = df["close"].to_numpy(dtype=float, copy=True)
+    if len(close) == 0:
         return None
+    return close, turnover
 
-    # 下采样到 2h/4h
-    close, turnover = _apply_period_downsample(close, turnover, period_label)
-
+def evaluate_period(close, turnover, period_label, cfg, votes=None):
+    """
+    纯计算部分（过滤 + 指标投票 + 成交额加分），不做任何 I/O，可放进进程池
+    votes: 已算好的 _indicator_votes 结果（如批量引擎），不传则现算
+    返回值同 check_trend_single_period
+    """
     # 过滤成交额/价格
-    if turnover is not None and turnover[-1] < cfg["filters"]["min_turnover"]:
-        return None
-    if close[-1] < cfg["filters"]["min_price"]:
+    last_turnover = turnover[-1] if turnover is not None else None
+    if not _passes_filters(close[-1], last_turnover, cfg):
         return None
 
     # 指标投票
-    buy, sell, sources, detail = _indicator_votes(close, cfg["indicators"], cfg["weights"])
+    if votes is None:
+        votes = _indicator_votes(close, cfg["indicators"], cfg["weights"])
+
+    factor = _volume_factor(turnover) if turnover is not None else None
+    return score_period(votes, factor, period_label, cfg)
+
+def _passes_filters(last_close, last_turnover, cfg):
+    if last_turnover is not None and last_turnover < cfg["filters"]["min_turnover"]:
+        return False
+    if last_close < cfg["filters"]["min_price"]:
+        return False
+    return True
+
+def score_period(votes, volume_factor, period_label, cfg):
+    """
+    投票结果 + 成交额倍数（无成交额为 None）→ 单周期结果或 None
+    回测/参数扫描复用这里的计分，保证与实盘一致
+    """
+    buy, sell, sources, detail = votes
+    sources = list(sources)
 
     # 成交额突变加分
     bonus = 0
-    if turnover is not None:
-        spike, factor = _volume_spike(turnover, cfg["signal"]["volume_spike_threshold"])
-        if spike:
-            bonus = int(factor * cfg["weights"].get("volume_spike_bonus_per_x", 5))
-            sources.append("VOLUME_SPIKE")
+    if volume_factor is not None and volume_factor >= cfg["signal"]["volume_spike_threshold"]:
+        bonus = int(volume_factor * cfg["weights"].get("volume_spike_bonus_per_x", 5))
+        sources.append("VOLUME_SPIKE")
 
     # 方向与评分：仅统计占优方向（避免 5:4 这类“势均力敌”抬高分）
     if buy > sell:
@@ -257,6 +302,85 @@ def check_trend_single_period(quote_ctx, code, period_label, cfg):
         "detail": detail,
     }
 
+def check_trend_single_period(quote_ctx, code, period_label, cfg, fetcher=None, evaluator=None):
+    """
+    fetcher: 本轮共享的 KlineFetcher；不传则单独拉取
+    evaluator: 替代 evaluate_period 的执行方式（如投递到进程池），签名相同
+    返回：
+      {
+        "period": "1h/2h/4h/1d",
+        "action": "买入/卖出",
+        "score": int,
+        "sources": [指示器...],
+        "detail": { indicator: "买入/卖出/None", ... }
+      }
+    或 None
+    """
+    # 基础K线类型见 PERIOD_KLTYPE（2h/4h 由 60m 合并），同一轮内共享
+    if fetcher is None:
+        fetcher = KlineFetcher(quote_ctx, cfg["kline_num"])
+    ret, df = fetcher.get_period(code, period_label)
+    if ret != RET_OK or df is None or df.empty:
+        logging.warning(f"[{code} {period_label}] 拉取K线失败")
+        return None
+    if fetcher.closed_only:
+        df = closed_bars(df, PERIOD_KLTYPE[period_label], code, fetcher.now)
+        if df.empty:
+            return None
+
+    if fetcher.memo is not None:
+        return _check_with_memo(fetcher, code, df, period_label, cfg)
+
+    series = period_series(df, period_label, resampler=fetcher.resampler)
+    if series is None:
+        return None
+    close, turnover = series
+    return (evaluator or evaluate_period)(close, turnover, period_label, cfg)
+
+def _check_with_memo(fetcher, code, df, period_label, cfg):
+    """
+    已收盘前缀（合并后去掉末根）与配置没变 → 复用前缀上的 PrefixEntry，只按末根重算
+    末根重算只剩过滤、talib 传统指标与 O(1) 的平滑尾部，直接在本线程算，不投递进程池
+    """
+    frame = period_frame(df, period_label, resampler=fetcher.resampler)
+    if frame is None or frame.empty:
+        return None
+    key = (code, period_label, bar_fingerprint(frame.iloc[:-1]), fetcher.config_key(cfg))
+    hit, entry = fetcher.memo.get(key)
+    if not hit:
+        entry = PrefixEntry(frame["close"].to_numpy(dtype=float)[:-1])
+        fetcher.memo.put(key, entry)
+
+    tail = bar_fingerprint(frame)
+    if tail == entry.tail:
+        return entry.result
+    close, turnover = _frame_series(frame)
+    votes = None   # 过滤不通过时 evaluate_period 不看 votes
+    if _passes_filters(close[-1], turnover[-1] if turnover is not None else None, cfg):
+        signals = _classic_signals(close, cfg["indicators"])
+        signals.update(_math_signals(close, cfg["indicators"], ctx=entry.smoothing.context(close)))
+        votes = _tally_votes(signals, cfg["indicators"], cfg["weights"])
+    res = evaluate_period(close, turnover, period_label, cfg, votes=votes)
+    entry.tail, entry.result = tail, res
+    return res
+
+def check_trend_incremental(df, period_label, cfg, bank, resampler=None):
+    """
+    推送模式的单周期检测：df 为该周期基础K线（只含已收盘的），bank 为该 (code, period) 的 IndicatorBank
+    传统指标只把新K线喂进 bank（O(1)/根），数学方法仍按整段窗口算；返回值同 check_trend_single_period
+    """
+    frame = period_frame(df, period_label, resampler)
+    if frame is None or frame.empty:
+        return None
+    close = frame["close"].to_numpy(dtype=float, copy=True)
+    turnover = frame["turnover"].to_numpy(dtype=float, copy=True) if "turnover" in frame.columns else None
+    # 过滤掉的周期也要喂，bank 状态始终跟上K线
+    bank.sync(frame["time_key"], close)
+    if not _passes_filters(close[-1], turnover[-1] if turnover is not None else None, cfg):
+        return None
+    votes = _indicator_votes_incremental(bank, close, cfg["indicators"], cfg["weights"])
+    return evaluate_period(close, turnover, period_label, cfg, votes=votes)
+
 # ---------- 多周期汇总 ----------
 
 def aggregate_multiperiod(results, confirm_level):
@@ -306,146 +430,3 @@ def decide_priority(score, used_periods, cfg):
     if score >= cfg["signal"]["priority_mid_score"]:
         return "中"
     return "低"
-=======
-def detect_signals(close, indicators, weights):
-    """检测单周期信号，返回信号方向和来源"""
-    signals = []
-    sources = []
-    total_score = 0
-
-    # === 技术指标 ===
-    if indicators.get("ma", True):
-        ma5 = talib.SMA(close, timeperiod=5)
-        ma20 = talib.SMA(close, timeperiod=20)
-        if ma5[-1] > ma20[-1] and ma5[-2] <= ma20[-2]:
-            signals.append("买入"); sources.append("MA"); total_score += weights.get("ma", 1)
-        elif ma5[-1] < ma20[-1] and ma5[-2] >= ma20[-2]:
-            signals.append("卖出"); sources.append("MA"); total_score -= weights.get("ma", 1)
-
-    if indicators.get("macd", True):
-        macd, signal, hist = talib.MACD(close, fastperiod=12, slowperiod=26, signalperiod=9)
-        if macd[-1] > signal[-1] and macd[-2] <= signal[-2]:
-            signals.append("买入"); sources.append("MACD"); total_score += weights.get("macd", 1)
-        elif macd[-1] < signal[-1] and macd[-2] >= signal[-2]:
-            signals.append("卖出"); sources.append("MACD"); total_score -= weights.get("macd", 1)
-
-    if indicators.get("rsi", True):
-        rsi = talib.RSI(close, timeperiod=14)
-        if rsi[-1] < 30 and rsi[-2] >= 30:
-            signals.append("买入"); sources.append("RSI"); total_score += weights.get("rsi", 1)
-        elif rsi[-1] > 70 and rsi[-2] <= 70:
-            signals.append("卖出"); sources.append("RSI"); total_score -= weights.get("rsi", 1)
-
-    if indicators.get("boll", True):
-        upper, middle, lower = talib.BBANDS(close, timeperiod=20, nbdevup=2, nbdevdn=2)
-        if close[-1] < lower[-1] and close[-2] >= lower[-2]:
-            signals.append("买入"); sources.append("BOLL"); total_score += weights.get("boll", 1)
-        elif close[-1] > upper[-1] and close[-2] <= upper[-2]:
-            signals.append("卖出"); sources.append("BOLL"); total_score -= weights.get("boll", 1)
-
-    # === 数学方法 ===
-    if indicators.get("fft", False):
-        sig = fft_signal(close)
-        if sig: signals.append(sig); sources.append("FFT")
-        if sig == "买入": total_score += weights.get("fft", 1)
-        if sig == "卖出": total_score -= weights.get("fft", 1)
-
-    if indicators.get("derivative", False):
-        sig = derivative_signal(close)
-        if sig: signals.append(sig); sources.append("DERIV")
-        if sig == "买入": total_score += weights.get("derivative", 1)
-        if sig == "卖出": total_score -= weights.get("derivative", 1)
-
-    if indicators.get("wavelet", False):
-        sig = wavelet_signal(close)
-        if sig: signals.append(sig); sources.append("WAVELET")
-        if sig == "买入": total_score += weights.get("wavelet", 1)
-        if sig == "卖出": total_score -= weights.get("wavelet", 1)
-
-    if indicators.get("regression", False):
-        sig = rolling_regression_signal(close)
-        if sig: signals.append(sig); sources.append("REG")
-        if sig == "买入": total_score += weights.get("regression", 1)
-        if sig == "卖出": total_score -= weights.get("regression", 1)
-
-    # === 综合信号 ===
-    if not signals:
-        return None, 0, sources
-
-    if total_score > 0:
-        return "买入", abs(total_score), sources
-    elif total_score < 0:
-        return "卖出", abs(total_score), sources
-    return None, 0, sources
-
-
-def check_trend(quote_ctx, code, holdings, config):
-    """多周期趋势检测"""
-    periods = {
-        "1小时": KLType.K_60M,
-        "2小时": KLType.K_60M,  # 手动取两根拼成2h
-        "4小时": KLType.K_60M,  # 手动取四根拼成4h
-        "日线": KLType.K_DAY
-    }
-
-    weights = config.get("weights", {})
-    signals_summary = {}
-    final_action = None
-    final_score = 0
-    used_periods = []
-    all_sources = []
-
-    for pname, kltype in periods.items():
-        ret, data = quote_ctx.get_cur_kline(code, config["kline_num"], kl_type=kltype)
-        if ret != RET_OK or data.empty:
-            continue
-
-        close = data["close"].values.astype(float)
-        if pname == "2小时":
-            close = close[::2]  # 简单取样
-        elif pname == "4小时":
-            close = close[::4]
-
-        action, score, sources = detect_signals(close, config["indicators"], weights)
-        if action:
-            signals_summary[pname] = (action, score, sources)
-            used_periods.append(pname)
-            all_sources.extend(sources)
-
-    if not signals_summary:
-        return None
-
-    # === 多周期确认 ===
-    buy_count = sum(1 for a, _, _ in signals_summary.values() if a == "买入")
-    sell_count = sum(1 for a, _, _ in signals_summary.values() if a == "卖出")
-
-    if buy_count > sell_count:
-        final_action = "买入"
-    elif sell_count > buy_count:
-        final_action = "卖出"
-
-    if not final_action:
-        return None
-
-    # 计算总分
-    final_score = sum(score for a, score, _ in signals_summary.values() if a == final_action)
-
-    # === 持仓判断 ===
-    if code in holdings:
-        if final_action != "卖出":
-            return None
-    else:
-        if final_action != "买入":
-            return None
-
-    # === 冷却控制 ===
-    if not cooldown_checker(code, "多周期", final_action, config["signal"]["cooldown_minutes"]):
-        return None
-
-    # === 返回格式 ===
-    color = "🔴" if final_action == "买入" else "🟢"
-    sources_str = ",".join(set(all_sources))
-    periods_str = ",".join(used_periods)
-
-    return f"【{code}】 多周期一致 {final_action} {color} 强度: {final_score}\n来源: {sources_str}\n周期: {periods_str}"
->>>>>>> 9bb94dd4d8f2ce286f91219188f2e78c9646b30c
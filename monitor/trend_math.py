@@ -1,14 +1,144 @@
 import numpy as np
 import pywt
-from scipy.fft import fft, ifft
-from sklearn.linear_model import LinearRegression
+from scipy.fft import rfft, irfft
 
-def fft_signal(close, keep=5, label="fft"):
+from .metrics import stage
+
+# ---------- 平滑曲线共享 ----------
+
+_FFT_MASKS = {}   # (n, keep) -> rfft 频点权重，同长度序列复用
+
+def _fft_mask(n, keep):
+    """
+    复数 FFT 里 F[keep:-keep] = 0 等价的 rfft 权重：
+    0..keep-1 全保留；第 keep 个频点只保留了负频率一侧，实部贡献减半
+    """
+    key = (n, keep)
+    mask = _FFT_MASKS.get(key)
+    if mask is None:
+        mask = np.zeros(n // 2 + 1)
+        mask[:keep] = 1.0
+        mask[keep] = 0.5
+        _FFT_MASKS[key] = mask
+    return mask
+
+def fft_lowpass(x, keep=5, axis=-1, workers=None):
+    """保留最低 keep 个频率的 FFT 低通（实数输入走 rfft），可按行批量"""
+    x = np.asarray(x, dtype=float)
+    n = x.shape[axis]
+    mask = _fft_mask(n, keep)
+    if x.ndim > 1:
+        shape = [1] * x.ndim
+        shape[axis] = len(mask)
+        mask = mask.reshape(shape)
+    # scipy.fft 按长度缓存变换计划，同长度序列之间自动复用
+    return irfft(rfft(x, axis=axis, workers=workers) * mask, n, axis=axis, workers=workers)
+
+def wavelet_lowpass(x, wavelet="db4", level=2, axis=-1):
+    """小波分解后只保留近似系数再重构"""
+    coeffs = pywt.wavedec(x, wavelet, level=level, axis=axis)
+    coeffs[1:] = [np.zeros_like(c) for c in coeffs[1:]]
+    smooth = pywt.waverec(coeffs, wavelet, axis=axis)
+    return np.take(smooth, np.arange(np.shape(x)[axis]), axis=axis)
+
+class SmoothingContext:
+    """
+    同一条 close 上的平滑曲线缓存：FFT、小波、FFT+小波 每组参数只算一次，
+    fft_signal / wavelet_signal / hybrid_fft_wavelet_signal 共享
+    """
+
+    def __init__(self, close, workers=None):
+        self.close = np.asarray(close, dtype=float)
+        self.workers = workers
+        self._cache = {}
+
+    def fft_smooth(self, keep=5):
+        key = ("fft", keep)
+        if key not in self._cache:
+            with stage("smooth.fft"):
+                self._cache[key] = fft_lowpass(self.close, keep, workers=self.workers)
+        return self._cache[key]
+
+    def wavelet_smooth(self, wavelet="db4", level=2):
+        key = ("wavelet", wavelet, level)
+        if key not in self._cache:
+            with stage("smooth.wavelet"):
+                self._cache[key] = wavelet_lowpass(self.close, wavelet, level)
+        return self._cache[key]
+
+    def hybrid_smooth(self, keep=5, wavelet="db4", level=2):
+        key = ("hybrid", keep, wavelet, level)
+        if key not in self._cache:
+            fft = self.fft_smooth(keep)
+            with stage("smooth.hybrid"):
+                self._cache[key] = wavelet_lowpass(fft, wavelet, level)
+        return self._cache[key]
+
+_TAIL_ROWS = {}   # (n, 平滑键) -> 平滑算子最后两行
+
+def smooth_tail_rows(n, key):
+    """
+    线性平滑算子 S 的最后两行 S[-2:, :]，key 同 SmoothingContext 的缓存键
+    （("fft", keep) / ("wavelet", wavelet, level) / ("hybrid", keep, wavelet, level)）
+    对单位阵逐行平滑：第 j 行得到 S e_j，即 S 的第 j 列；同长度只算一次
+    """
+    rows = _TAIL_ROWS.get((n, key))
+    if rows is None:
+        eye = np.eye(n)
+        if key[0] == "fft":
+            cols = fft_lowpass(eye, key[1], axis=1)
+        elif key[0] == "wavelet":
+            cols = wavelet_lowpass(eye, key[1], key[2], axis=1)
+        else:
+            cols = wavelet_lowpass(fft_lowpass(eye, key[1], axis=1), key[2], key[3], axis=1)
+        rows = _TAIL_ROWS[(n, key)] = np.ascontiguousarray(cols[:, -2:].T)
+    return rows
+
+class PrefixSmoothing:
+    """
+    固定前缀 + 可变末根的平滑：FFT / 小波 / FFT+小波 都是线性的，
+    smooth[-2:] = S[-2:, :-1] @ prefix + S[-2:, -1] * 末根
+    前缀部分每组参数算一次；之后末根（形成中的K线）怎么变，最后两点都是 O(1)
+    与整段重算只差浮点舍入（~1e-13），平滑值不是按价位取整的，不会恰好与收盘价相等
+    """
+
+    def __init__(self, prefix):
+        self.prefix = np.asarray(prefix, dtype=float)
+        self._parts = {}
+
+    def tail(self, key, last):
+        part = self._parts.get(key)
+        if part is None:
+            with stage(f"smooth.{key[0]}"):
+                rows = smooth_tail_rows(len(self.prefix) + 1, key)
+                part = self._parts[key] = (rows[:, :-1] @ self.prefix, rows[:, -1].copy())
+        pre, col = part
+        return pre + col * last
+
+    def context(self, close):
+        """close = prefix + [末根] 上的 SmoothingContext，平滑曲线只给最后两点（信号函数只看 [-2]、[-1]）"""
+        return _TailSmoothingContext(close, self)
+
+class _TailSmoothingContext(SmoothingContext):
+    def __init__(self, close, prefix):
+        super().__init__(close)
+        self._prefix = prefix
+
+    def fft_smooth(self, keep=5):
+        return self._prefix.tail(("fft", keep), self.close[-1])
+
+    def wavelet_smooth(self, wavelet="db4", level=2):
+        return self._prefix.tail(("wavelet", wavelet, level), self.close[-1])
+
+    def hybrid_smooth(self, keep=5, wavelet="db4", level=2):
+        return self._prefix.tail(("hybrid", keep, wavelet, level), self.close[-1])
+
+# ---------- 信号 ----------
+
+def fft_signal(close, keep=5, label="fft", ctx=None):
     if len(close) < keep * 4:
         return None
-    F = fft(close)
-    F[keep:-keep] = 0
-    smooth = ifft(F).real
+    smooth = (ctx or SmoothingContext(close)).fft_smooth(keep)
 
     sig = None
     if close[-1] > smooth[-1] and close[-2] <= smooth[-2]:
@@ -22,7 +152,8 @@ def fft_signal(close, keep=5, label="fft"):
 
 def derivative_signal(close):
     if len(close) < 5: return None
-    d1 = np.gradient(close)
+    # 只用到最后两点的一阶/二阶差分，取末 5 根与整段 np.gradient 逐位相同
+    d1 = np.gradient(close[-5:])
     d2 = np.gradient(d1)
     if d1[-2] < 0 and d1[-1] > 0 and d2[-1] > 0:
         return "买入"
@@ -30,51 +161,61 @@ def derivative_signal(close):
         return "卖出"
     return None
 
-def wavelet_signal(close, wavelet="db4", level=2):
+def wavelet_signal(close, wavelet="db4", level=2, ctx=None):
     if len(close) < 32: return None
-    coeffs = pywt.wavedec(close, wavelet, level=level)
-    coeffs[1:] = [np.zeros_like(c) for c in coeffs[1:]]
-    smooth = pywt.waverec(coeffs, wavelet)
-    smooth = smooth[:len(close)]
+    smooth = (ctx or SmoothingContext(close)).wavelet_smooth(wavelet, level)
     if close[-1] > smooth[-1] and close[-2] <= smooth[-2]:
         return "买入"
     if close[-1] < smooth[-1] and close[-2] >= smooth[-2]:
         return "卖出"
     return None
 
+def rolling_slope(y, window=20):
+    """
+    滚动最小二乘斜率（x = 0..window-1），累计和闭式解，O(n)
+    沿最后一维计算（二维输入按行各自求，供批量引擎用）；返回与 y 同形，前 window-1 个为 NaN
+    """
+    y = np.asarray(y, dtype=float)
+    n = y.shape[-1]
+    out = np.full(y.shape, np.nan)
+    if n < window:
+        return out
+    y = y - y.mean(axis=-1, keepdims=True)   # 斜率与平移无关，先去均值减小累计和量级
+    k = np.arange(n, dtype=float)
+    zero = np.zeros(y.shape[:-1] + (1,))
+    cs_y = np.concatenate((zero, np.cumsum(y, axis=-1)), axis=-1)
+    cs_ky = np.concatenate((zero, np.cumsum(k * y, axis=-1)), axis=-1)
+    start = np.arange(n - window + 1)
+    s_y = cs_y[..., start + window] - cs_y[..., start]
+    s_xy = (cs_ky[..., start + window] - cs_ky[..., start]) - start * s_y   # 窗口内局部 x 的 Σx·y
+    x_mean = (window - 1) / 2.0
+    s_xx = window * (window * window - 1) / 12.0
+    out[..., window - 1:] = (s_xy - x_mean * s_y) / s_xx
+    return out
+
 def rolling_regression_signal(close, window=20):
     if len(close) < window + 1: return None
-    X = np.arange(window).reshape(-1,1)
-    y_now = close[-window:]
-    y_prev = close[-window-1:-1]
-    slope_now = LinearRegression().fit(X, y_now).coef_[0]
-    slope_prev = LinearRegression().fit(X, y_prev).coef_[0]
+    slopes = rolling_slope(close[-window-1:], window)
+    slope_prev, slope_now = slopes[-2], slopes[-1]
     if slope_prev <= 0 and slope_now > 0:
         return "买入"
     if slope_prev >= 0 and slope_now < 0:
         return "卖出"
     return None
 
-def hybrid_fft_wavelet_signal(close, keep=5, wavelet="db4", level=2):
+def hybrid_fft_wavelet_signal(close, keep=5, wavelet="db4", level=2, ctx=None):
     """
     混合 FFT + 小波检测
     1. FFT 平滑去噪
     2. 小波提取趋势
     3. 检测拐点
+    ctx: 共享的 SmoothingContext，FFT 平滑与 fft_signal 共用一次计算
     """
     if len(close) < max(32, keep * 4):
         return None
 
-    # Step1: FFT 平滑
-    F = fft(close)
-    F[keep:-keep] = 0
-    smooth_fft = ifft(F).real
-
-    # Step2: 小波低频趋势
-    coeffs = pywt.wavedec(smooth_fft, wavelet, level=level)
-    coeffs[1:] = [np.zeros_like(c) for c in coeffs[1:]]
-    smooth = pywt.waverec(coeffs, wavelet)
-    smooth = smooth[:len(close)]
+    # Step1 + Step2: FFT 平滑后取小波低频趋势
+    smooth = (ctx or SmoothingContext(close)).hybrid_smooth(keep, wavelet, level)
 
     # Step3: 信号判断
     if close[-1] > smooth[-1] and close[-2] <= smooth[-2]:
@@ -0,0 +1,146 @@
+# monitor/universe.py
+"""
+全市场模式（config["mode"] = "UNIVERSE"）：拉K线之前先用快照粗筛
+  1. get_stock_basicinfo 取各市场的股票列表（按 list_ttl_minutes 缓存，一天通常只拉一次）
+  2. get_market_snapshot 按 batch_size（OpenD 上限 400）分批取快照，按配额（默认 30 秒 60 次）排队发出
+  3. 用快照的最新价 / 当日成交额套 filters.min_price / min_turnover，剔除停牌
+  4. 幸存者按成交额降序，最多 max_codes 只，再走正常的K线拉取 + 指标投票
+当日成交额不小于当日任何一根K线的成交额，但K线过滤看的是各周期参与计算的最后一根：
+开盘后第一根K线收盘前（或休市日、或 memo.closed_bars_only 下日K/2h/4h 当日还没收盘的一根），
+最后一根是前一交易日的，成交额可能大于当日快照。这段时间该市场不按成交额粗筛（价格/停牌照常），
+只有各周期最后一根都是当日K线之后才按成交额剔除，此时粗筛不会漏掉K线过滤能过的标的
+（max_codes 截断除外）。
+推送模式（stream）的订阅列表是固定的，仍只用 watchlist。
+"""
+
+import logging
+import time
+
+import pandas as pd
+from futu import *
+
+from dateutil import tz
+
+from .trading_calendar import get_calendar
+from .utils import MARKET_TZ, RateLimiter, bar_ends, local_now, market_of
+
+_MARKETS = {"HK": Market.HK, "US": Market.US, "SH": Market.SH, "SZ": Market.SZ}
+
+
+class Universe:
+    def __init__(self, cfg, clock=time.monotonic, sleep=time.sleep, now=local_now):
+        ucfg = cfg.get("universe", {})
+        self.markets = ucfg.get("markets", ["HK", "US"])
+        self.batch_size = min(int(ucfg.get("batch_size", 400)), 400)
+        quota = ucfg.get("snapshot_quota", {"count": 60, "seconds": 30})
+        self.pacer = RateLimiter(quota["count"], quota["seconds"])
+        self.list_ttl = float(ucfg.get("list_ttl_minutes", 1440)) * 60
+        self.max_codes = ucfg.get("max_codes")
+        self.include_watchlist = ucfg.get("include_watchlist", True)
+        self.min_price = cfg["filters"]["min_price"]
+        self.min_turnover = cfg["filters"]["min_turnover"]
+        self.periods = list(cfg.get("periods", []))
+        self.closed_only = cfg.get("memo", {}).get("closed_bars_only", False)
+        self.calendar = get_calendar(cfg)
+        self.now = now
+        self.clock = clock
+        self.sleep = sleep
+        self._lists = {}        # market -> (拉取时间, [code, ...])
+        self.requests = 0       # 快照请求次数
+        self.waited = 0.0       # 为配额等待的秒数
+        self.last_counts = {}   # 最近一次筛选：{"listed", "snapshot", "passed"}
+
+    # ---------- 列表 ----------
+
+    def codes(self, quote_ctx, market):
+        cached = self._lists.get(market)
+        if cached is not None and self.clock() - cached[0] < self.list_ttl:
+            return cached[1]
+        ret, data = quote_ctx.get_stock_basicinfo(_MARKETS.get(market, market), SecurityType.STOCK)
+        if ret != RET_OK:
+            logging.warning(f"[全市场] {market} 股票列表拉取失败: {data}")
+            return cached[1] if cached is not None else []
+        if "delisting" in data.columns:
+            data = data[~data["delisting"].astype(bool)]
+        codes = data["code"].tolist()
+        self._lists[market] = (self.clock(), codes)
+        return codes
+
+    # ---------- 快照 ----------
+
+    def snapshots(self, quote_ctx, codes):
+        """分批拉快照，失败的批次跳过；返回合并后的 DataFrame"""
+        frames = []
+        for start in range(0, len(codes), self.batch_size):
+            batch = codes[start:start + self.batch_size]
+            self.waited += self.pacer.acquire(self.clock, self.sleep)
+            self.requests += 1
+            ret, data = quote_ctx.get_market_snapshot(batch)
+            if ret != RET_OK:
+                logging.warning(f"[全市场] 快照失败（{batch[0]} 起 {len(batch)} 只）: {data}")
+                continue
+            frames.append(data)
+        if not frames:
+            return pd.DataFrame(columns=["code", "last_price", "turnover"])
+        return pd.concat(frames, ignore_index=True)
+
+    def turnover_ready(self, market, now=None):
+        """
+        market 当日各周期参与计算的最后一根K线是否都已是当日的（之后才能用当日快照成交额粗筛）
+        常规：当日第一根 60m 收盘后；closed_bars_only：各周期当日第一个收盘点之后（日K要到收盘）
+        """
+        from .tick_scheduler import period_close_minutes
+
+        local = (now or self.now()).astimezone(tz.gettz(MARKET_TZ.get(market, "Asia/Shanghai")))
+        if not self.calendar.day_sessions(market, local.date()):
+            return False
+        code = f"{market}.X"
+        if self.closed_only and self.periods:
+            ready = max(period_close_minutes(code, p)[0] for p in self.periods)
+        else:
+            ready = bar_ends(code, 60)[0]
+        return local.hour * 60 + local.minute >= ready
+
+    def prefilter(self, snap, now=None):
+        """按最新价/成交额/停牌筛选，成交额降序；成交额只在 turnover_ready 的市场上用"""
+        now = now or self.now()
+        markets = snap["code"].map(market_of)
+        ready = {m: self.turnover_ready(m, now) for m in markets.unique()}
+        turnover_ok = (snap["turnover"] >= self.min_turnover) | ~markets.map(ready).astype(bool)
+        mask = (snap["last_price"] >= self.min_price) & turnover_ok
+        if "suspension" in snap.columns:
+            mask &= ~snap["suspension"].astype(bool)
+        out = snap[mask].sort_values("turnover", ascending=False, kind="stable")
+        if self.max_codes:
+            out = out.head(int(self.max_codes))
+        return out["code"].tolist()
+
+    def select(self, quote_ctx, watchlist=(), always=(), markets=None):
+        """
+        本轮要算的标的：快照幸存者 + always（持仓，必须能出卖出信号）+ watchlist（include_watchlist 时）
+        顺序：always、watchlist、幸存者，去重；markets 给定时只拉这些市场的列表（休市的市场不取快照）
+        """
+        listed = []
+        for market in self.markets:
+            if markets is not None and market not in markets:
+                continue
+            listed.extend(self.codes(quote_ctx, market))
+        snap = self.snapshots(quote_ctx, listed)
+        passed = self.prefilter(snap) if len(snap) else []
+        self.last_counts = {"listed": len(listed), "snapshot": len(snap), "passed": len(passed)}
+
+        extra = list(always) + (list(watchlist) if self.include_watchlist else [])
+        selected = list(dict.fromkeys(extra + passed))
+        logging.info(
+            f"[全市场] 列表 {len(listed)} 只，快照 {len(snap)} 只（{self.requests} 次请求，"
+            f"配额等待 {self.waited:.1f}s），过滤后 {len(passed)} 只，本轮计算 {len(selected)} 只"
+        )
+        return selected
+
+
+def scan_codes(quote_ctx, cfg, runtime, holdings, markets=None):
+    """按 cfg["mode"] 决定本轮的标的列表；markets 给定时只取这些市场的全市场列表"""
+    watchlist = cfg.get("watchlist", [])
+    if cfg.get("mode", "WATCHLIST").upper() != "UNIVERSE":
+        return watchlist
+    return runtime.universe.select(quote_ctx, watchlist, always=holdings, markets=markets)
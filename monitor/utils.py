@@ -1,55 +1,108 @@
-import csv
-import os
-import time
 import logging
+import time
+from collections import deque
 from datetime import datetime
 from dateutil import tz
 
+from .metrics import stage
+from .signal_store import get_store
+
 SIGNAL_FILE_DEFAULT = "data/signals.csv"
 
-def ensure_signal_csv(path):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    if not os.path.exists(path):
-        with open(path, "w", newline="", encoding="utf-8") as f:
-            csv.writer(f).writerow(["code", "period", "action", "ts"])
+# 各市场交易时段（交易所当地时间），K线 time_key 即当地时间
+MARKET_SESSIONS = {
+    "HK": [("09:30", "12:00"), ("13:00", "16:00")],
+    "US": [("09:30", "16:00")],
+    "SH": [("09:30", "11:30"), ("13:00", "15:00")],
+    "SZ": [("09:30", "11:30"), ("13:00", "15:00")],
+}
+
+# 各市场交易所时区
+MARKET_TZ = {
+    "HK": "Asia/Hong_Kong",
+    "US": "America/New_York",
+    "SH": "Asia/Shanghai",
+    "SZ": "Asia/Shanghai",
+}
+
+def market_of(code):
+    """"HK.00700" → "HK"；无前缀返回空串"""
+    return code.split(".", 1)[0].upper() if code and "." in code else ""
+
+def session_minutes(code):
+    """标的所属市场的交易时段，换算成当日分钟数 [(开, 收), ...]；未知市场按全天"""
+    sessions = MARKET_SESSIONS.get(market_of(code))
+    if not sessions:
+        return [(0, 24 * 60)]
+    out = []
+    for start, end in sessions:
+        h1, m1 = map(int, start.split(":"))
+        h2, m2 = map(int, end.split(":"))
+        out.append((h1 * 60 + m1, h2 * 60 + m2))
+    return out
+
+def bar_ends(code, minutes):
+    """一个交易日内各根 minutes 分钟K线的结束时间（当日分钟数）：每个时段内整段结束 + 时段收盘那一根"""
+    ends = []
+    for start, end in session_minutes(code):
+        ends.extend(range(start + minutes, end, minutes))
+        ends.append(end)
+    return ends
 
 def cooldown_checker(code, period, action, cooldown_minutes, path=SIGNAL_FILE_DEFAULT):
-    ensure_signal_csv(path)
-    now = int(time.time())
-    cool = cooldown_minutes * 60
-
-    with open(path, "r", encoding="utf-8") as f:
-        rows = list(csv.DictReader(f))
-        for r in rows:
-            if r["code"] == code and r["period"] == period and r["action"] == action:
-                if now - int(r["ts"]) < cool:
-                    logging.info(f"[冷却中] 跳过 {code}-{period}-{action}")
-                    return False
-
-    with open(path, "a", newline="", encoding="utf-8") as f:
-        csv.writer(f).writerow([code, period, action, now])
+    """
+    冷却判断：同一 (code, period, action) 在 cooldown_minutes 内只放行一次。
+    历史记在 SignalStore（path 为旧 CSV 时用同名 .db，并导入一次旧记录），判断走内存索引
+    """
+    with stage("cooldown"):
+        allowed = get_store(path).check_and_record(code, period, action, cooldown_minutes)
+    if not allowed:
+        logging.info(f"[冷却中] 跳过 {code}-{period}-{action}")
+        return False
     return True
 
+class RateLimiter:
+    """滑动窗口：任意 seconds 秒内最多 count 次"""
+
+    def __init__(self, count, seconds):
+        self.count = int(count)
+        self.seconds = float(seconds)
+        self._hits = deque()
+
+    def delay(self, now):
+        """还需等待的秒数，0 表示可以发"""
+        while self._hits and now - self._hits[0] >= self.seconds:
+            self._hits.popleft()
+        if len(self._hits) < self.count:
+            return 0.0
+        return self._hits[0] + self.seconds - now
+
+    def hit(self, now):
+        self._hits.append(now)
+
+    def acquire(self, clock=time.monotonic, sleep=time.sleep):
+        """阻塞到窗口内有余量再记一次，返回等待的秒数（OpenD 请求配额等）"""
+        waited = 0.0
+        while True:
+            now = clock()
+            wait = self.delay(now)
+            if wait <= 0:
+                self.hit(now)
+                return waited
+            sleep(wait)
+            waited += wait
+
 def local_now(tzname="Asia/Shanghai"):
     return datetime.now(tz.gettz(tzname))
 
-def is_market_open(now=None):
+def is_market_open(now=None, market=None, calendar=None):
     """
-    简易开盘判断：工作日 + 典型时段（港股/美股）。如需精准节假日，建议接入交易日历API。
-    港股: 09:30-12:00, 13:00-16:00 HKT
-    美股: 09:30-16:00 ET
+    开盘判断（按交易日历，含节假日与半日市，见 monitor/trading_calendar.py）
+    market 为空时：港股或美股任一在交易即为 True；按市场过滤标的请用 TradingCalendar.filter_codes
     """
+    from .trading_calendar import get_calendar
+    calendar = calendar or get_calendar()
     now = now or local_now()
-    wd = now.weekday()  # 0=Mon ... 6=Sun
-    if wd >= 5:
-        return False
-
-    # HKT
-    hkt = now.astimezone(tz.gettz("Asia/Hong_Kong"))
-    hkt_ok = ((hkt.hour > 9 or (hkt.hour == 9 and hkt.minute >= 30)) and (hkt.hour < 12)) or \
-             ((hkt.hour >= 13) and (hkt.hour < 16))
-    # ET
-    et = now.astimezone(tz.gettz("America/New_York"))
-    et_ok = ((et.hour > 9 or (et.hour == 9 and et.minute >= 30)) and (et.hour < 16))
-
-    return hkt_ok or et_ok
+    if market:
+        return calendar.is_open(market, now)
+    return bool(calendar.open_markets(now, ("HK", "US")))
@@ -0,0 +1,21 @@
+import copy
+import json
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def cfg(tmp_path):
+    """基于 config.json 的测试配置：关闭通知与消息总线，信号文件、K线归档与增量指标存档写到临时目录"""
+    with open(os.path.join(ROOT, "config.json"), "r", encoding="utf-8") as f:
+        c = json.load(f)
+    c = copy.deepcopy(c)
+    c["notify"]["enabled"] = False
+    c["bus"]["enabled"] = False
+    c["paths"]["signal_csv"] = str(tmp_path / "signals.csv")
+    c["archive"]["path"] = str(tmp_path / "bars")
+    c["schedule"]["stream"]["checkpoint"] = str(tmp_path / "banks.json")
+    return c
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+from futu import *
+
+from monitor.backtest import PreparedPeriod, prepare, run
+from monitor.fake_opend import make_kline_frame
+from monitor.kline_fetch import KlineFetcher
+from monitor.trend import check_trend_single_period
+
+
+def _bars(codes, n_hour=600, n_day=200):
+    return {
+        code: {
+            KLType.K_60M: make_kline_frame(code, n_hour, KLType.K_60M),
+            KLType.K_DAY: make_kline_frame(code, n_day, KLType.K_DAY, start="2024-01-02 00:00:00"),
+        }
+        for code in codes
+    }
+
+
+@pytest.mark.parametrize("period", ["1h", "2h", "4h"])
+def test_prepared_results_match_live_path(cfg, period):
+    cfg["kline_num"] = 120
+    df = make_kline_frame("HK.00700", 400, KLType.K_60M)
+    df.loc[200, "close"] = np.nan
+    times = pd.to_datetime(df["time_key"]).to_numpy()
+    pp = PreparedPeriod(df["close"].to_numpy(dtype=float), df["turnover"].to_numpy(dtype=float), period, 120,
+                        times=times, code="HK.00700")
+    got = pp.results(cfg)
+    for i in range(len(got)):
+        window = df.iloc[i:i + 120].reset_index(drop=True)
+        fetcher = KlineFetcher(None, 120)
+        fetcher.put("HK.00700", KLType.K_60M, window)
+        assert got[i] == check_trend_single_period(None, "HK.00700", period, cfg, fetcher=fetcher)
+
+
+def test_daily_results_use_previous_day_only(cfg):
+    cfg["kline_num"] = 60
+    bars = {"HK.00700": {
+        KLType.K_60M: make_kline_frame("HK.00700", 400, KLType.K_60M, start="2024-02-20 10:30:00"),
+        KLType.K_DAY: make_kline_frame("HK.00700", 100, KLType.K_DAY, start="2024-01-02 00:00:00"),
+    }}
+    pc = prepare(bars, cfg)["HK.00700"]
+    idx = pc.step_index("1d")
+    assert (idx >= 0).any() and (idx == -1).any()
+    day_times = pc.kl_times[KLType.K_DAY].astype("datetime64[D]")
+    for s in np.flatnonzero(idx >= 0):
+        bar_day = day_times[idx[s] + cfg["kline_num"] - 1]
+        today = pc.times[s].astype("datetime64[D]")
+        # 上一个交易日（周一取上周五）
+        assert bar_day == day_times[day_times < today][-1]
+
+
+def test_short_daily_history_gives_no_daily_results(cfg):
+    cfg["kline_num"] = 60
+    pc = prepare(_bars(["HK.00700"], n_hour=400, n_day=40), cfg)["HK.00700"]
+    assert "1d" not in pc.prepared
+    assert (pc.step_index("1d") == -1).all()
+
+
+def test_run_produces_signals_and_stats(cfg):
+    cfg["kline_num"] = 100
+    cfg["filters"]["min_turnover"] = 0
+    cfg["signal"]["priority_high_score"] = 0
+    prepared = prepare(_bars(["HK.00700", "US.AAPL"]), cfg)
+    result = run(prepared, cfg, horizons=(1, 5))
+
+    assert len(result.signals) > 0
+    assert set(result.signals["action"]) <= {"买入", "卖出"}
+    assert result.signals["time"].is_monotonic_increasing
+    assert {"ret_1", "ret_5"} <= set(result.signals.columns)
+    assert result.stats["signals"] == len(result.signals)
+    assert result.stats["trades"] == len(result.trades) > 0
+    assert 0.0 <= result.stats["win_rate"] <= 1.0
+    assert result.stats["by_source"]
+
+    # 每个标的的买卖交替：有仓只卖、无仓只买
+    for code, sub in result.signals[result.signals["priority"].isin(["高", "风控"])].groupby("code"):
+        actions = sub["action"].tolist()
+        assert actions[0] == "买入"
+        assert all(a != b for a, b in zip(actions, actions[1:]))
+
+    # 同一份 prepare 可反复 run
+    again = run(prepared, cfg, horizons=(1, 5))
+    pd.testing.assert_frame_equal(result.signals, again.signals)
+
+
+def test_cooldown_suppresses_repeats(cfg):
+    cfg["kline_num"] = 100
+    cfg["filters"]["min_turnover"] = 0
+    prepared = prepare(_bars(["HK.00700"]), cfg)
+    cfg["signal"]["cooldown_minutes"] = 0
+    loose = run(prepared, cfg)
+    cfg["signal"]["cooldown_minutes"] = 60 * 24 * 365
+    strict = run(prepared, cfg)
+    assert len(strict.signals) <= 2 <= len(loose.signals)
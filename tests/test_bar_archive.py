@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pytest
+from futu import *
+
+from monitor.backtest import load_bars_archive, prepare, run
+from monitor.bar_archive import BarArchive, COLUMNS
+from monitor.fake_opend import FakeQuoteContext, make_kline_frame
+from monitor.schedule_runner import ScanRuntime, _scan_once
+from web.history import ArchiveHistorySource, FutuHistorySource, KlineHistory
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return BarArchive(str(tmp_path / "bars"))
+
+
+def test_append_dedupes_and_overwrites_forming_bar(archive):
+    df = make_kline_frame("HK.00700", 300, KLType.K_60M)
+    assert archive.append("HK.00700", KLType.K_60M, df.iloc[:200]) == 200
+    # 重叠部分忽略，最后一根（同 time_key）覆盖
+    tail = df.iloc[150:250].copy()
+    tail.loc[tail.index[49], "close"] = 1.0   # time_key 与已归档的最后一根相同
+    assert archive.append("HK.00700", KLType.K_60M, tail) == 50
+    assert archive.count("HK.00700", KLType.K_60M) == 250
+    got = archive.frame("HK.00700", KLType.K_60M)
+    assert got["time_key"].tolist() == df["time_key"].iloc[:250].tolist()
+    assert got["close"].iloc[199] == 1.0
+    np.testing.assert_array_equal(got["close"].iloc[200:], df["close"].iloc[200:250])
+
+
+def test_range_read_is_memmapped_slice(archive):
+    df = make_kline_frame("HK.00700", 1000, KLType.K_60M)
+    archive.append("HK.00700", KLType.K_60M, df)
+    cols = archive.read("HK.00700", KLType.K_60M, start=df["time_key"][100], end=df["time_key"][199])
+    assert isinstance(cols["close"], np.memmap) and isinstance(cols["time"], np.memmap)
+    assert len(cols["time"]) == 100
+    np.testing.assert_array_equal(cols["close"], df["close"].iloc[100:200])
+    assert archive.read("HK.00700", KLType.K_DAY) is None
+    assert len(archive.tail("HK.00700", KLType.K_60M, 7)["close"]) == 7
+
+
+def test_truncated_column_is_repaired(archive):
+    df = make_kline_frame("HK.00700", 50, KLType.K_60M)
+    archive.append("HK.00700", KLType.K_60M, df.iloc[:40])
+    # 模拟写一半中断：某个数据列多写了 3 根
+    with open(os.path.join(archive._dir("HK.00700", KLType.K_60M), "close.f8"), "ab") as f:
+        f.write(np.zeros(3).tobytes())
+    assert archive.count("HK.00700", KLType.K_60M) == 40
+    assert archive.append("HK.00700", KLType.K_60M, df) == 10
+    got = archive.frame("HK.00700", KLType.K_60M)
+    np.testing.assert_array_equal(got["close"], df["close"])
+    for c in COLUMNS:
+        assert os.path.getsize(os.path.join(archive._dir("HK.00700", KLType.K_60M), f"{c}.f8")) == 50 * 8
+
+
+def test_scan_appends_each_kltype_once(cfg):
+    cfg["watchlist"] = ["HK.00700", "US.AAPL"]
+    runtime = ScanRuntime(cfg)
+    ctx = FakeQuoteContext(history=500)
+    try:
+        _scan_once(ctx, cfg, runtime)
+        _scan_once(ctx, cfg, runtime)
+    finally:
+        runtime.close()
+    for code in cfg["watchlist"]:
+        assert runtime.archive.count(code, KLType.K_60M) == cfg["kline_num"]
+        assert runtime.archive.count(code, KLType.K_DAY) == cfg["kline_num"]
+    assert runtime.archive.appended == 4 * cfg["kline_num"]
+
+
+def test_backtest_and_history_read_from_archive(cfg, archive):
+    cfg["kline_num"] = 100
+    cfg["filters"]["min_turnover"] = 0
+    bars = {"HK.00700": {
+        KLType.K_60M: make_kline_frame("HK.00700", 500, KLType.K_60M),
+        KLType.K_DAY: make_kline_frame("HK.00700", 150, KLType.K_DAY, start="2024-01-02 00:00:00"),
+    }}
+    for kl, df in bars["HK.00700"].items():
+        archive.append("HK.00700", kl, df)
+    from_archive = run(prepare(load_bars_archive(archive), cfg), cfg)
+    from_frames = run(prepare(bars, cfg), cfg)
+    assert from_archive.signals.equals(from_frames.signals)
+
+    hist = KlineHistory(ArchiveHistorySource(archive))
+    out = hist.query("HK.00700", "1h", width=5000)
+    assert out["total"] == 500 and out["data"]["close"] == bars["HK.00700"][KLType.K_60M]["close"].tolist()
+
+
+def test_archive_source_fills_range_before_archive_from_fallback(archive):
+    ctx = FakeQuoteContext(history=300)
+    full = ctx._frame("HK.00700", KLType.K_60M)
+    archive.append("HK.00700", KLType.K_60M, full.iloc[200:])    # 扫描开始之后才有归档
+    hist = KlineHistory(ArchiveHistorySource(archive, FutuHistorySource(quote_ctx=ctx)))
+    start = full["time_key"].iloc[150]
+    out = hist.query("HK.00700", "1h", start=start, width=5000)
+    assert out["data"]["time_key"] == full["time_key"].iloc[150:].tolist()
+    np.testing.assert_allclose(out["data"]["close"], full["close"].iloc[150:])
+    # 区间整段都在归档里：不碰 OpenD
+    ctx.calls.clear()
+    inside = hist.query("HK.00700", "1h", start=full["time_key"].iloc[250], width=5000)
+    assert inside["total"] == 50 and not ctx.calls
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from monitor.batch import batch_evaluate, batch_indicator_votes
+from monitor.trend import _indicator_votes, evaluate_period
+
+
+def _walks(n, m, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (n, m)), axis=1))
+
+
+@pytest.mark.parametrize("m", [20, 33, 60, 400])
+def test_batch_votes_match_per_symbol(cfg, m):
+    X = _walks(300, m, seed=m)
+    batch = batch_indicator_votes(X, cfg["indicators"], cfg["weights"])
+    for i, row in enumerate(X):
+        assert batch[i] == _indicator_votes(row.copy(), cfg["indicators"], cfg["weights"])
+
+
+def test_batch_respects_disabled_indicators(cfg):
+    ind = dict(cfg["indicators"], macd=False, wavelet=False)
+    X = _walks(50, 200, seed=1)
+    batch = batch_indicator_votes(X, ind, cfg["weights"])
+    for i, row in enumerate(X):
+        assert batch[i] == _indicator_votes(row.copy(), ind, cfg["weights"])
+        assert "MACD" not in batch[i][3] and "WAVELET" not in batch[i][3]
+
+
+def test_nan_rows_get_no_classic_votes(cfg):
+    X = _walks(4, 120, seed=2)
+    X[1, 50] = np.nan
+    batch = batch_indicator_votes(X, cfg["indicators"], cfg["weights"])
+    for name in ["MA", "MACD", "RSI", "BOLL"]:
+        assert batch[1][3][name] is None
+
+
+def test_batch_evaluate_ragged_lengths(cfg):
+    cfg["filters"]["min_turnover"] = 0
+    rng = np.random.default_rng(4)
+    series = []
+    for m in [120, 400, 120, 399, 400]:
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, m)))
+        series.append((close, rng.uniform(1e6, 5e6, m)))
+    got = batch_evaluate(series, "1h", cfg)
+    assert got == [evaluate_period(c, t, "1h", cfg) for c, t in series]
+
+
+def test_batch_matches_serial_on_tick_rounded_prices(cfg):
+    # 价格按 0.1 取整：均线、轨道常常正好相等，求和顺序不同就会翻转交叉判断
+    X = np.round(20 * np.exp(np.cumsum(np.random.default_rng(7).normal(0, 0.004, (3000, 60)), axis=1)), 1)
+    batch = batch_indicator_votes(X, cfg["indicators"], cfg["weights"])
+    for i, row in enumerate(X):
+        assert batch[i] == _indicator_votes(row.copy(), cfg["indicators"], cfg["weights"])
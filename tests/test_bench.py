@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from futu import KLType
+
+from monitor.bench import (
+    KINDS, BenchQuoteContext, bench_codes, compare, format_report, kind_of, load_baseline,
+    run_benchmarks, save_baseline, summarize, synthetic_ohlcv,
+)
+
+
+def test_synthetic_ohlcv_is_deterministic():
+    for kind in KINDS:
+        a = synthetic_ohlcv(kind, 300, code="US.AAPL", seed=3)
+        b = synthetic_ohlcv(kind, 300, code="US.AAPL", seed=3)
+        pd.testing.assert_frame_equal(a, b)
+        assert list(a.columns) == ["code", "time_key", "open", "close", "high", "low", "volume", "turnover"]
+        assert a["time_key"].is_monotonic_increasing
+    assert not synthetic_ohlcv("trend", 300, seed=4)["close"].equals(synthetic_ohlcv("trend", 300, seed=3)["close"])
+
+
+def test_synthetic_kinds_have_their_shape():
+    trend = synthetic_ohlcv("trend", 2000)["close"].to_numpy()
+    revert = synthetic_ohlcv("mean_revert", 2000)["close"].to_numpy()
+    assert trend[-1] > trend[0] * 2
+    assert abs(np.log(revert).mean() - np.log(100.0)) < 0.05
+    gappy = synthetic_ohlcv("gappy", 2000)
+    assert (np.abs(np.diff(np.log(gappy["close"]))) > 0.04).any() and (gappy["volume"] == 0).any()
+    nan = synthetic_ohlcv("nan", 2000)
+    assert nan["close"].isna().any() and nan["turnover"].isna().any()
+
+
+def test_bench_context_assigns_kind_by_code():
+    ctx = BenchQuoteContext(history=200)
+    codes = bench_codes(40)
+    assert {kind_of(c) for c in codes} == set(KINDS)
+    for code in codes[:8]:
+        _, df = ctx.get_cur_kline(code, 200, KLType.K_60M)
+        pd.testing.assert_frame_equal(df, synthetic_ohlcv(kind_of(code), 200, code, KLType.K_60M))
+
+
+def test_summarize_percentiles_and_throughput():
+    st = summarize([0.001] * 99 + [0.1], items=10)
+    assert st["n"] == 100 and st["p50_ms"] == 1.0
+    assert 1.0 < st["p99_ms"] <= 100.0
+    assert st["throughput"] == pytest.approx(10 * 100 / (0.099 + 0.1))
+
+
+def test_run_benchmarks_and_baseline_compare(cfg, tmp_path):
+    report = run_benchmarks(cfg, sizes=(4,), symbols=4, repeat=2, indicator_repeat=2)
+    assert {"symbol", "scan.4", "scan.4.cold", "indicator.MACD", "indicator.WAVELET"} <= set(report)
+    assert report["scan.4"]["n"] == 2 and report["symbol"]["n"] == 4
+
+    path = str(tmp_path / "baseline.json")
+    save_baseline(report, path)
+    baseline = load_baseline(path)
+    assert all(not slower for *_, slower in compare(report, baseline))
+
+    slow = {name: {**st, "p50_ms": st["p50_ms"] * 2} for name, st in report.items()}
+    rows = compare(slow, baseline, tolerance=1.5)
+    assert rows and all(slower for *_, slower in rows)
+    assert "变慢" in format_report(slow, rows)
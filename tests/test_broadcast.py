@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+import web.server as server
+from monitor.signal_store import SignalStore
+from web.broadcast import Broadcaster
+
+
+class FakeSocket:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.frames = []
+
+    async def send_text(self, text):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.frames.append(json.loads(text))
+
+
+def _state():
+    return {
+        "codes": {
+            "A": {"time_key": "t1", "close": 1.0, "prices": [1.0], "periods": {"1h": None, "1d": None}, "signal": None},
+            "B": {"time_key": "t1", "close": 2.0, "prices": [2.0], "periods": {}, "signal": None},
+        },
+        "signals": [{"code": "B", "action": "买入"}],
+    }
+
+
+def _batch(*msgs):
+    return [{"topic": t, "ts": 1.0, "data": d} for t, d in msgs]
+
+
+async def _settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def test_snapshot_then_filtered_deltas():
+    async def scenario():
+        b = Broadcaster(_state())
+        ws_all, ws_a = FakeSocket(), FakeSocket()
+        c_all = b.register(ws_all)
+        c_a = b.register(ws_a)
+        b.handle_message(c_a, json.dumps({"op": "subscribe", "codes": ["A"], "periods": ["1h"]}))
+        await _settle()
+        b.broadcast(_batch(
+            ("price", {"code": "A", "time_key": "t2", "close": 1.5}),
+            ("price", {"code": "B", "time_key": "t2", "close": 2.5}),
+            ("votes", {"code": "A", "periods": {"1h": {"action": "买入"}, "1d": None}}),
+        ))
+        await _settle()
+        await b.unregister(c_all)
+        await b.unregister(c_a)
+        return ws_all.frames, ws_a.frames
+
+    frames_all, frames_a = asyncio.run(scenario())
+    assert frames_all[0]["type"] == "snapshot" and set(frames_all[0]["codes"]) == {"A", "B"}
+    assert [e["code"] for e in frames_all[1]["events"]] == ["A", "B", "A"]
+
+    # 订阅后的快照只含 A，且周期裁剪到 1h；增量同样裁剪
+    snap = frames_a[-2]
+    assert snap["type"] == "snapshot" and set(snap["codes"]) == {"A"}
+    assert snap["codes"]["A"]["periods"] == {"1h": None} and snap["signals"] == []
+    delta = frames_a[-1]
+    assert delta["type"] == "delta"
+    assert delta["events"][0] == {"type": "bar", "code": "A", "time_key": "t2", "close": 1.5, "ts": 1.0}
+    assert delta["events"][1]["periods"] == {"1h": {"action": "买入"}}
+
+
+def test_slow_client_resyncs_without_blocking_others():
+    async def scenario():
+        b = Broadcaster(_state(), queue_size=4)
+        slow, fast = FakeSocket(delay=0.05), FakeSocket()
+        c_slow, c_fast = b.register(slow), b.register(fast)
+        await _settle()
+        for i in range(50):
+            b.broadcast(_batch(("price", {"code": "A", "time_key": f"t{i}", "close": float(i)})))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.5)
+        stats = b.stats()
+        await b.unregister(c_slow)
+        await b.unregister(c_fast)
+        return slow.frames, fast.frames, c_slow, stats
+
+    slow_frames, fast_frames, c_slow, stats = asyncio.run(scenario())
+    assert len(fast_frames) == 51
+    assert c_slow.resyncs > 0 and stats["resyncs"] == c_slow.resyncs
+    assert len(slow_frames) < 51
+    assert any(f["type"] == "snapshot" for f in slow_frames[1:])
+
+
+def test_websocket_endpoint_protocol(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "load_config", lambda path=None: {"bus": {"enabled": False}, "web": {}})
+    monkeypatch.setattr(server.app.state, "signal_store", SignalStore(str(tmp_path / "s.db")), raising=False)
+    server.latest_data["codes"]["HK.00700"] = {"time_key": "t", "close": 1.0, "prices": [1.0], "periods": {}, "signal": None}
+    try:
+        with TestClient(server.app) as client:
+            with client.websocket_connect("/ws") as ws:
+                assert ws.receive_json()["type"] == "snapshot"
+                ws.send_text(json.dumps({"op": "ping"}))
+                assert ws.receive_json() == {"type": "pong"}
+                ws.send_text(json.dumps({"op": "subscribe", "codes": ["US.AAPL"]}))
+                assert ws.receive_json() == {"type": "snapshot", "codes": {}, "signals": []}
+                ws.send_text("not json")
+                assert ws.receive_json()["type"] == "error"
+    finally:
+        server.latest_data["codes"].pop("HK.00700", None)
@@ -0,0 +1,121 @@
+import time
+
+import numpy as np
+
+from monitor.bus import BusPublisher, BusSubscriber, publish
+from monitor.fake_opend import FakeQuoteContext
+from monitor.schedule_runner import _scan_once
+
+import web.server as server
+
+
+def _subscriber():
+    return BusSubscriber("127.0.0.1", 0)
+
+
+def _drain(sub, want, timeout=3.0):
+    out = []
+    deadline = time.time() + timeout
+    while len(out) < want and time.time() < deadline:
+        out.extend(sub.poll(timeout=0.2))
+    return out
+
+
+def test_round_trip_and_numpy_payload():
+    sub = _subscriber()
+    pub = BusPublisher(*sub.address)
+    try:
+        assert pub.publish("price", {"code": "HK.00700", "close": np.float64(1.5), "n": np.int64(3)})
+        [msg] = _drain(sub, 1)
+        assert msg["topic"] == "price"
+        assert msg["data"] == {"code": "HK.00700", "close": 1.5, "n": 3}
+    finally:
+        pub.close()
+        sub.close()
+
+
+def test_publish_never_blocks_without_subscriber():
+    sub = _subscriber()
+    addr = sub.address
+    sub.close()
+    pub = BusPublisher(*addr)
+    t0 = time.perf_counter()
+    for i in range(5000):
+        pub.publish("price", {"code": "HK.00700", "close": float(i)})
+    assert time.perf_counter() - t0 < 2.0
+    assert pub.sent + pub.dropped == 5000
+    assert not pub.publish("votes", {"blob": "x" * 70000})
+    pub.close()
+
+
+def test_high_rate_batches_to_callback():
+    sub = _subscriber()
+    pub = BusPublisher(*sub.address)
+    batches = []
+    sub.start(batches.append, poll_seconds=0.05)
+    try:
+        for i in range(3000):
+            pub.publish("price", {"code": f"HK.{i % 50:05d}", "close": float(i)})
+            if i % 200 == 0:
+                time.sleep(0.001)
+        deadline = time.time() + 3
+        while sum(len(b) for b in batches) < pub.sent and time.time() < deadline:
+            time.sleep(0.02)
+        got = sum(len(b) for b in batches)
+        assert got == pub.sent > 0
+        assert len(batches) < got
+    finally:
+        pub.close()
+        sub.close()
+
+
+def test_topic_filter():
+    sub = BusSubscriber("127.0.0.1", 0, topics=["signal"])
+    pub = BusPublisher(*sub.address)
+    try:
+        pub.publish("price", {"code": "A"})
+        pub.publish("signal", {"code": "A", "action": "买入"})
+        msgs = _drain(sub, 1)
+        assert [m["topic"] for m in msgs] == ["signal"]
+    finally:
+        pub.close()
+        sub.close()
+
+
+def test_scan_publishes_prices_and_votes(cfg):
+    sub = _subscriber()
+    cfg["bus"] = {"enabled": True, "host": sub.address[0], "port": sub.address[1]}
+    cfg["watchlist"] = ["HK.00700", "US.AAPL"]
+    try:
+        _scan_once(FakeQuoteContext(), cfg)
+        msgs = _drain(sub, 4)
+    finally:
+        sub.close()
+    topics = {(m["topic"], m["data"].get("code")) for m in msgs}
+    assert {("price", "HK.00700"), ("votes", "HK.00700"), ("price", "US.AAPL"), ("votes", "US.AAPL")} <= topics
+    votes = next(m for m in msgs if m["topic"] == "votes")
+    assert set(votes["data"]["periods"]) == set(cfg["periods"])
+
+
+def test_disabled_bus_is_noop(cfg):
+    assert publish(cfg, "price", {"code": "A"}) is False
+
+
+def test_web_state_applies_bus_messages(monkeypatch):
+    monkeypatch.setattr(server, "latest_data", {"prices": [], "signal": None, "focus": None, "codes": {}, "signals": []})
+    touched = server.apply_bus_messages([
+        {"topic": "price", "data": {"code": "A", "time_key": "t1", "close": 1.0}},
+        {"topic": "price", "data": {"code": "A", "time_key": "t1", "close": 1.1}},
+        {"topic": "price", "data": {"code": "A", "time_key": "t2", "close": 1.2}},
+        {"topic": "price", "data": {"code": "B", "time_key": "t1", "close": 9.0}},
+        {"topic": "votes", "data": {"code": "B", "periods": {"1h": None}}},
+    ])
+    data = server.latest_data
+    assert touched == ["A", "B"]
+    assert data["codes"]["A"]["prices"] == [1.1, 1.2]
+    assert data["focus"] == "A" and data["prices"] == [1.1, 1.2]
+
+    server.apply_bus_messages([{"topic": "signal", "data": {"code": "B", "action": "买入"}}])
+    assert data["focus"] == "B" and data["signal"] == "买入"
+    assert data["prices"] == [9.0]
+    assert data["codes"]["B"]["periods"] == {"1h": None}
@@ -0,0 +1,55 @@
+import copy
+
+from monitor.fake_opend import FakeQuoteContext
+from monitor.schedule_runner import ScanRuntime, _evaluate_watchlist, _scan_once
+
+CODES = [f"HK.{i:05d}" for i in range(1, 13)] + ["US.AAPL", "US.TSLA"]
+
+
+def _cfg(cfg, mode, process_workers=0):
+    c = copy.deepcopy(cfg)
+    c["watchlist"] = CODES
+    c["filters"]["min_turnover"] = 0
+    c["schedule"]["concurrency"] = {"mode": mode, "max_workers": 4, "process_workers": process_workers}
+    return c
+
+
+def _evaluate(cfg):
+    runtime = ScanRuntime(cfg)
+    try:
+        evaluated, fetcher, timing = _evaluate_watchlist(FakeQuoteContext(), cfg, runtime, cfg["watchlist"])
+    finally:
+        runtime.close()
+    return evaluated, fetcher
+
+
+def test_thread_mode_matches_serial(cfg):
+    serial, _ = _evaluate(_cfg(cfg, "serial"))
+    threaded, fetcher = _evaluate(_cfg(cfg, "thread"))
+    assert threaded == serial
+    assert [code for code, _ in threaded] == CODES
+    assert any(res for _, res in serial)
+    assert fetcher.fetched == 2 * len(CODES)
+
+
+def test_process_pool_matches_serial(cfg):
+    serial, _ = _evaluate(_cfg(cfg, "serial"))
+    pooled, _ = _evaluate(_cfg(cfg, "thread", process_workers=2))
+    assert pooled == serial
+
+
+def test_notification_order_is_deterministic(cfg, tmp_path):
+    out = []
+    for i, mode in enumerate(["serial", "thread", "thread"]):
+        c = _cfg(cfg, mode)
+        c["paths"]["signal_csv"] = str(tmp_path / f"signals_{i}.csv")
+        c["signal"]["priority_high_score"] = 0
+        c["signal"]["priority_mid_score"] = 0
+        out.append(_scan_once(FakeQuoteContext(), c))
+    assert out[0] == out[1] == out[2]
+
+
+def test_batch_mode_matches_serial(cfg):
+    serial, _ = _evaluate(_cfg(cfg, "serial"))
+    batched, _ = _evaluate(_cfg(cfg, "batch"))
+    assert batched == serial
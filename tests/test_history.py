@@ -0,0 +1,182 @@
+
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from futu import *
+
+import web.server as server
+from monitor.fake_opend import FakeQuoteContext, make_kline_frame
+from monitor.signal_store import SignalStore
+from web.history import (FutuHistorySource, KlineHistory, TTLCache, downsample_ohlc, group_bars,
+                         lttb_indices, minmax_indices)
+
+
+def test_ohlc_buckets_preserve_extremes_and_totals():
+    df = make_kline_frame("HK.00700", 1000, KLType.K_60M)
+    out = downsample_ohlc(df, 37)
+    assert len(out) == 37
+    assert out["high"].max() == df["high"].max() and out["low"].min() == df["low"].min()
+    assert out["open"].iloc[0] == df["open"].iloc[0] and out["close"].iloc[-1] == df["close"].iloc[-1]
+    assert out["volume"].sum() == pytest.approx(df["volume"].sum())
+    assert downsample_ohlc(df.head(10), 37).equals(df.head(10))
+
+
+def test_group_bars_merges_by_session():
+    df = make_kline_frame("HK.00700", 9, KLType.K_60M)   # 一天 6 根 + 次日 3 根
+    out = group_bars(df, "4h")
+    # 港股 4h：09:30-14:00（含午休前后）、14:00-16:00，次日截到 12:00
+    assert out["time_key"].tolist() == df["time_key"].iloc[[3, 5, 8]].tolist()
+    assert out["high"].iloc[0] == df["high"].iloc[:4].max()
+    assert out["close"].iloc[1] == df["close"].iloc[5]
+    assert out["turnover"].iloc[2] == pytest.approx(df["turnover"].iloc[6:9].sum())
+    assert group_bars(df, "1h").equals(df)
+
+
+def test_lttb_keeps_endpoints_and_spike():
+    y = np.sin(np.linspace(0, 20, 5000))
+    y[2345] = 50.0
+    idx = lttb_indices(y, 200)
+    assert len(idx) == 200 and idx[0] == 0 and idx[-1] == 4999
+    assert np.all(np.diff(idx) > 0)
+    assert 2345 in idx
+    assert len(lttb_indices(y[:100], 200)) == 100
+
+
+def test_minmax_keeps_both_extremes_per_bucket():
+    y = np.random.default_rng(0).normal(size=10000)
+    idx = minmax_indices(y, 100)
+    assert np.all(np.diff(idx) > 0) and len(idx) <= 200
+    assert y.argmax() in idx and y.argmin() in idx
+
+
+def test_ttl_cache_expires_and_evicts():
+    c = TTLCache(maxsize=2, ttl=0.05)
+    c.put("a", 1); c.put("b", 2); c.put("c", 3)
+    assert c.get("a") is None and c.get("c") == 3
+    time.sleep(0.06)
+    assert c.get("c") is None
+
+
+def _count_rows(ctx):
+    """记录每次 request_history_kline 返回的行数"""
+    pulled = []
+    real = ctx.request_history_kline
+
+    def wrapped(*args, **kwargs):
+        ret, data, key = real(*args, **kwargs)
+        if ret == RET_OK:
+            pulled.append(len(data))
+        return ret, data, key
+    ctx.request_history_kline = wrapped
+    return pulled
+
+
+def test_history_pages_source_and_caches_views():
+    ctx = FakeQuoteContext(history=3000)
+    pulled = _count_rows(ctx)
+    hist = KlineHistory(FutuHistorySource(quote_ctx=ctx, page_size=500), max_bars=1000)
+    out = hist.query("HK.00700", "1h", width=100)
+    assert 1002 <= sum(pulled) < 3000                  # 只从最新往前取够一页，不拉整段
+    assert out["total"] == 1000 and out["points"] == 100 and out["more"]
+    full = ctx.frames[("HK.00700", KLType.K_60M)]
+    assert out["next_end"] == full["time_key"].iloc[1999]
+    assert out["data"]["close"][-1] == full["close"].iloc[-1]
+
+    calls = len(ctx.calls)
+    again = hist.query("HK.00700", "1h", width=100)
+    assert again is out and len(ctx.calls) == calls
+
+    four = hist.query("HK.00700", "4h", width=5000)
+    assert four["points"] == four["total"] == 1000      # 500 个交易日，每天 2 根
+
+
+def test_deep_paging_loads_one_page_per_request():
+    ctx = FakeQuoteContext(history=3000)
+    pulled = _count_rows(ctx)
+    hist = KlineHistory(FutuHistorySource(quote_ctx=ctx, page_size=500), max_bars=200)
+    seen, end, pages = [], None, 0
+    while True:
+        before = sum(pulled)
+        page = hist.query("HK.00700", "1h", end=end, width=5000)
+        # 每页取数量只和 max_bars 有关，与已经翻过多少页无关
+        assert sum(pulled) - before < 4 * 202
+        seen = page["data"]["time_key"] + seen
+        pages += 1
+        if not page["more"]:
+            break
+        end = page["next_end"]
+    assert pages == 15
+    assert seen == ctx.frames[("HK.00700", KLType.K_60M)]["time_key"].tolist()
+
+
+def test_history_time_range_filter():
+    ctx = FakeQuoteContext(history=500)
+    hist = KlineHistory(FutuHistorySource(quote_ctx=ctx))
+    out = hist.query("HK.00700", "1h", start="2024-01-03 00:00:00", end="2024-01-04 12:00:00", width=1000)
+    keys = out["data"]["time_key"]
+    assert keys[0] == "2024-01-03 10:30:00" and keys[-1] == "2024-01-04 12:00:00"
+    with pytest.raises(ValueError):
+        hist.query("HK.00700", "3h")
+    # 只给日期的 end 包含当天全部K线
+    day = hist.query("HK.00700", "1h", start="2024-01-04", end="2024-01-04", width=1000)["data"]["time_key"]
+    assert day[0] == "2024-01-04 10:30:00" and day[-1] == "2024-01-04 16:00:00" and len(day) == 6
+
+
+def test_history_pages_do_not_overlap():
+    ctx = FakeQuoteContext(history=300)
+    hist = KlineHistory(FutuHistorySource(quote_ctx=ctx), max_bars=100)
+    first = hist.query("HK.00700", "1h", width=1000)
+    second = hist.query("HK.00700", "1h", end=first["next_end"], width=1000)
+    a, b = first["data"]["time_key"], second["data"]["time_key"]
+    assert len(a) == len(b) == 100 and b[-1] == first["next_end"] and b[-1] < a[0]
+    full = ctx.frames[("HK.00700", KLType.K_60M)]["time_key"].tolist()
+    assert b + a == full[-200:]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "load_config", lambda path=None: {"bus": {"enabled": False}, "web": {}})
+    store = SignalStore(str(tmp_path / "signals.db"))
+    for ts in range(100, 110):
+        store.record("HK.00700", "多周期", "买入", ts)
+    store.record("US.AAPL", "多周期", "卖出", 105)
+    for code in ("HK.00001", "HK.00002", "HK.00003"):
+        store.record(code, "多周期", "买入", 200)
+    monkeypatch.setattr(server.app.state, "signal_store", store, raising=False)
+    monkeypatch.setattr(server.app.state, "history",
+                        KlineHistory(FutuHistorySource(quote_ctx=FakeQuoteContext(history=5000))), raising=False)
+    with TestClient(server.app) as c:
+        yield c
+
+
+def test_kline_endpoint_downsamples_and_gzips(client):
+    r = client.get("/api/kline", params={"code": "HK.00700", "period": "1h", "width": 300, "mode": "lttb"},
+                   headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200 and r.headers["content-encoding"] == "gzip"
+    body = r.json()
+    assert body["total"] == 5000 and body["points"] == 300 and len(body["data"]["close"]) == 300
+    assert client.get("/api/kline", params={"code": "HK.00700", "mode": "bad"}).status_code == 400
+
+
+def test_signals_endpoint_paginates(client):
+    first = client.get("/api/signals", params={"code": "HK.00700", "limit": 4}).json()
+    assert [r["ts"] for r in first["data"]] == [106, 107, 108, 109] and first["next_end"] == 106
+    second = client.get("/api/signals", params={"code": "HK.00700", "limit": 4, "end": first["next_end"],
+                                                "before_id": first["next_id"]}).json()
+    assert [r["ts"] for r in second["data"]] == [102, 103, 104, 105]
+    everyone = client.get("/api/signals", params={"start": 105, "end": 110}).json()
+    assert everyone["count"] == 6 and everyone["next_end"] is None
+
+
+def test_signals_cursor_keeps_same_second_rows(client):
+    """同一秒出的多条信号分在两页时一条不丢"""
+    seen, params = [], {"start": 200, "limit": 2}
+    while True:
+        page = client.get("/api/signals", params=params).json()
+        seen = page["data"] + seen
+        if page["next_end"] is None:
+            break
+        params = {"start": 200, "limit": 2, "end": page["next_end"], "before_id": page["next_id"]}
+    assert sorted(r["code"] for r in seen) == ["HK.00001", "HK.00002", "HK.00003"]
@@ -0,0 +1,104 @@
+import numpy as np
+import talib
+
+from monitor.incremental import (
+    MACD, EMA, IndicatorBank, RollingBBands, RollingSMA, WilderRSI, load_checkpoint, save_checkpoint,
+)
+from monitor.trend import _classic_signals, _indicator_votes, _indicator_votes_incremental
+
+
+def _walk(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+
+
+def _feed(ind, xs):
+    return np.array([np.nan if v is None else v for v in (ind.update(x) for x in xs)], dtype=float)
+
+
+def test_sma_ema_rsi_match_talib():
+    x = _walk(500)
+    np.testing.assert_allclose(_feed(RollingSMA(20), x), talib.SMA(x, 20), rtol=1e-10, equal_nan=True)
+    np.testing.assert_allclose(_feed(EMA(12), x), talib.EMA(x, 12), rtol=1e-10, equal_nan=True)
+    np.testing.assert_allclose(_feed(WilderRSI(14), x), talib.RSI(x, 14), rtol=1e-9, equal_nan=True)
+
+
+def test_macd_and_bbands_match_talib():
+    x = _walk(500, seed=1)
+    m = MACD()
+    out = np.array([m.update(v) for v in x])
+    macd, sig, _ = talib.MACD(x, 12, 26, 9)
+    np.testing.assert_allclose(out[33:, 0], macd[33:], rtol=1e-9, atol=1e-10)
+    np.testing.assert_allclose(out[33:, 1], sig[33:], rtol=1e-9, atol=1e-10)
+
+    b = RollingBBands(20, 2.0)
+    out = np.array([b.update(v) for v in x])
+    up, mid, low = talib.BBANDS(x, 20, 2, 2)
+    np.testing.assert_allclose(out[19:], np.stack([up, mid, low], axis=1)[19:], rtol=1e-9)
+
+
+def test_bank_signals_match_full_recompute(cfg):
+    x = _walk(400, seed=2)
+    bank = IndicatorBank()
+    hits = 0
+    for i in range(len(x)):
+        bank.update(x[i])
+        if i >= 1:
+            expect = _classic_signals(x[:i + 1].copy(), cfg["indicators"])
+            assert bank.signals(cfg["indicators"]) == expect
+            hits += sum(v is not None for v in expect.values())
+    assert hits > 0
+    assert _indicator_votes_incremental(bank, x, cfg["indicators"], cfg["weights"]) == \
+        _indicator_votes(x.copy(), cfg["indicators"], cfg["weights"])
+
+
+def test_replace_forming_bar():
+    x = _walk(100, seed=3)
+    a, b = IndicatorBank(), IndicatorBank()
+    for v in x[:-1]:
+        a.update(v)
+        b.update(v)
+    a.update(x[-1] * 1.03)                    # 形成中的一根
+    a.update(x[-1] * 0.98, replace_last=True)
+    a.update(x[-1], replace_last=True)
+    b.update(x[-1])
+    assert a.to_dict() == b.to_dict()
+
+
+def test_checkpoint_roundtrip(tmp_path):
+    x = _walk(200, seed=4)
+    bank = IndicatorBank()
+    for v in x[:150]:
+        bank.update(v)
+    path = str(tmp_path / "ckpt" / "banks.json")
+    save_checkpoint(path, {("HK.00700", "1h"): bank})
+    restored = load_checkpoint(path)[("HK.00700", "1h")]
+    for v in x[150:]:
+        bank.update(v)
+        restored.update(v)
+    assert restored.last == bank.last and restored.prev == bank.prev
+
+
+def test_sync_feeds_only_new_bars_and_refeeds_forming_last():
+    import pandas as pd
+
+    x = _walk(300, seed=5)
+    keys = pd.Series([f"k{i:04d}" for i in range(len(x))])
+    ref = IndicatorBank()
+    for v in x:
+        ref.update(v)
+
+    bank = IndicatorBank()
+    bank.sync(keys[:200], x[:200])
+    # 最后一根先以形成中的价格喂入，之后被收盘价替换
+    forming = x[:201].copy()
+    forming[-1] *= 1.05
+    bank.sync(keys[:201], forming)
+    bank.sync(keys[:201], x[:201])
+    bank.sync(keys[:300], x[:300])
+    assert bank.count == ref.count == 300
+    assert bank.last == ref.last and bank.prev == ref.prev and bank.last_key == "k0299"
+
+    # 上次的那根已滑出窗口：整段重喂
+    bank.sync(keys[250:260].reset_index(drop=True), x[250:260])
+    assert bank.count == 10
@@ -0,0 +1,81 @@
+from futu import KLType
+
+from monitor.fake_opend import FakeQuoteContext, make_kline_frame
+from monitor.kline_fetch import KlineCache, KlineFetcher
+
+CODE = "HK.00700"
+KL = KLType.K_60M
+
+
+def _ctx_with(full, upto):
+    ctx = FakeQuoteContext()
+    ctx.set_frame(CODE, KL, full.iloc[:upto])
+    return ctx
+
+
+def test_seed_then_incremental_matches_full_fetch():
+    full = make_kline_frame(CODE, 600, KL)
+    ctx = _ctx_with(full, 500)
+    cache = KlineCache(400, tail_num=5)
+
+    _, df = cache.fetch(ctx, CODE, KL)
+    assert len(df) == 400
+
+    # 收盘两根新K线，末根仍在形成中
+    ctx.set_frame(CODE, KL, full.iloc[:502])
+    _, df = cache.fetch(ctx, CODE, KL)
+    assert ctx.calls[-1][1] == 5
+    _, expect = ctx.get_cur_kline(CODE, 400, ktype=KL)
+    assert df.equals(expect)
+    assert cache.stats()["full"] == 1 and cache.stats()["incremental"] == 1
+
+
+def test_forming_bar_is_replaced():
+    full = make_kline_frame(CODE, 600, KL)
+    ctx = _ctx_with(full, 500)
+    cache = KlineCache(400)
+    cache.fetch(ctx, CODE, KL)
+
+    forming = full.iloc[:500].copy()
+    forming.loc[499, "close"] = forming.loc[499, "close"] * 1.05
+    ctx.set_frame(CODE, KL, forming)
+    _, df = cache.fetch(ctx, CODE, KL)
+    assert len(df) == 400
+    assert df["close"].iloc[-1] == forming["close"].iloc[-1]
+    assert cache.invalidations == 0
+
+
+def test_gap_triggers_full_refetch():
+    full = make_kline_frame(CODE, 600, KL)
+    ctx = _ctx_with(full, 500)
+    cache = KlineCache(400, tail_num=5)
+    cache.fetch(ctx, CODE, KL)
+
+    ctx.set_frame(CODE, KL, full.iloc[:520])
+    _, df = cache.fetch(ctx, CODE, KL)
+    assert cache.invalidations == 1
+    assert df["time_key"].iloc[-1] == full["time_key"].iloc[519]
+    assert len(df) == 400
+
+
+def test_price_adjustment_triggers_full_refetch():
+    full = make_kline_frame(CODE, 600, KL)
+    ctx = _ctx_with(full, 500)
+    cache = KlineCache(400)
+    cache.fetch(ctx, CODE, KL)
+
+    adjusted = full.iloc[:501].copy()
+    adjusted[["open", "high", "low", "close"]] *= 0.5   # 拆股后的前复权
+    ctx.set_frame(CODE, KL, adjusted)
+    _, df = cache.fetch(ctx, CODE, KL)
+    assert cache.invalidations == 1
+    assert df["close"].iloc[0] == adjusted["close"].iloc[101]
+
+
+def test_fetcher_uses_cache_across_scans():
+    ctx = FakeQuoteContext()
+    cache = KlineCache(400)
+    for _ in range(3):
+        fetcher = KlineFetcher(ctx, 400, cache=cache)
+        fetcher.prefetch([CODE], ["1h", "1d"])
+    assert [c[1] for c in ctx.calls] == [400, 400, 5, 5, 5, 5]
@@ -0,0 +1,42 @@
+from futu import KLType
+
+from monitor.fake_opend import FakeQuoteContext
+from monitor.kline_fetch import KlineFetcher
+from monitor.schedule_runner import _scan_once
+from monitor.trend import check_trend_single_period
+
+
+def test_fetcher_dedupes_per_kltype():
+    ctx = FakeQuoteContext()
+    fetcher = KlineFetcher(ctx, 400)
+    for p in ["1h", "2h", "4h", "1d"]:
+        ret, df = fetcher.get_period("HK.00700", p)
+        assert len(df) == 400
+    assert fetcher.stats() == {"requested": 4, "fetched": 2, "saved": 2}
+    assert sorted(c[2] for c in ctx.calls) == sorted([KLType.K_60M, KLType.K_DAY])
+
+
+def test_prefetch_then_periods_hit_buffer():
+    ctx = FakeQuoteContext()
+    fetcher = KlineFetcher(ctx, 400)
+    assert fetcher.prefetch(["HK.00700", "US.AAPL"], ["1h", "2h", "4h", "1d"]) == 4
+    for code in ["HK.00700", "US.AAPL"]:
+        for p in ["1h", "2h", "4h"]:
+            fetcher.get_period(code, p)
+    assert len(ctx.calls) == 4
+    assert fetcher.saved == 2
+
+
+def test_shared_fetch_matches_direct_fetch(cfg):
+    ctx = FakeQuoteContext()
+    fetcher = KlineFetcher(ctx, cfg["kline_num"])
+    for p in cfg["periods"]:
+        shared = check_trend_single_period(ctx, "US.AAPL", p, cfg, fetcher=fetcher)
+        direct = check_trend_single_period(ctx, "US.AAPL", p, cfg)
+        assert shared == direct
+
+
+def test_scan_once_fetches_each_kltype_once(cfg):
+    ctx = FakeQuoteContext()
+    _scan_once(ctx, cfg)
+    assert len(ctx.calls) == 2 * len(cfg["watchlist"])
@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta
+
+from dateutil import tz
+from futu import KLType
+
+from monitor import trend
+from monitor.fake_opend import FakeQuoteContext, make_kline_frame
+from monitor.memo import PeriodMemo, bar_fingerprint, closed_bars, config_hash
+from monitor.schedule_runner import ScanRuntime, _evaluate_watchlist
+
+HKT = tz.gettz("Asia/Hong_Kong")
+
+
+def test_lru_eviction_and_stats():
+    memo = PeriodMemo(max_entries=2)
+    memo.put("a", 1)
+    memo.put("b", None)
+    assert memo.get("a") == (True, 1)
+    memo.put("c", 3)                       # 淘汰最久未用的 b
+    assert memo.get("b") == (False, None)
+    assert memo.get("c") == (True, 3)
+    st = memo.stats()
+    assert st["entries"] == 2 and st["evictions"] == 1
+    assert (st["hits"], st["misses"]) == (2, 1) and abs(st["hit_rate"] - 2 / 3) < 1e-9
+
+
+def test_config_hash_tracks_result_affecting_keys(cfg):
+    base = config_hash(cfg)
+    cfg["notify"]["enabled"] = not cfg["notify"]["enabled"]
+    assert config_hash(cfg) == base
+    assert "macd" in cfg["weights"]
+    cfg["weights"] = {**cfg["weights"], "macd": cfg["weights"]["macd"] + 1}
+    assert config_hash(cfg) != base
+
+
+def test_closed_bars_drop_forming_bars():
+    df = make_kline_frame("HK.00700", 20, start="2024-02-26 10:30:00")
+    last = df["time_key"].iloc[-1]
+    now = datetime.strptime(last, "%Y-%m-%d %H:%M:%S").replace(tzinfo=HKT)
+    assert len(closed_bars(df, KLType.K_60M, "HK.00700", now)) == 20
+    # 最后一根结束时间未到：形成中
+    early = now - timedelta(minutes=10)
+    assert closed_bars(df, KLType.K_60M, "HK.00700", early)["time_key"].iloc[-1] < last
+
+    day = make_kline_frame("HK.00700", 5, kl_type=KLType.K_DAY, start="2024-02-26 00:00:00")
+    today = day["time_key"].iloc[-1][:10]
+    midday = datetime.strptime(today + " 12:00:00", "%Y-%m-%d %H:%M:%S").replace(tzinfo=HKT)
+    after = datetime.strptime(today + " 16:30:00", "%Y-%m-%d %H:%M:%S").replace(tzinfo=HKT)
+    assert len(closed_bars(day, KLType.K_DAY, "HK.00700", midday)) == 4
+    assert len(closed_bars(day, KLType.K_DAY, "HK.00700", after)) == 5
+
+
+def _counting(monkeypatch):
+    calls = []
+    real = trend.evaluate_period
+
+    def wrapped(close, turnover, period, cfg, **kwargs):
+        calls.append(period)
+        return real(close, turnover, period, cfg, **kwargs)
+
+    monkeypatch.setattr(trend, "evaluate_period", wrapped)
+    return calls
+
+
+def _results(cfg, runtime, ctx):
+    evaluated, _, _ = _evaluate_watchlist(ctx, cfg, runtime, cfg["watchlist"])
+    return evaluated
+
+
+def test_unchanged_bars_hit_memo_with_identical_results(cfg, monkeypatch):
+    calls = _counting(monkeypatch)
+    ctx = FakeQuoteContext()
+    runtime = ScanRuntime(cfg)
+    try:
+        first = _results(cfg, runtime, ctx)
+        computed = len(calls)
+        assert computed > 0
+        second = _results(cfg, runtime, ctx)
+        assert len(calls) == computed           # 第二轮全部命中
+        assert second == first
+        st = runtime.memo.stats()
+        assert st["hits"] == st["misses"] == len(cfg["watchlist"]) * len(cfg["periods"])
+    finally:
+        runtime.close()
+
+    cfg["memo"]["enabled"] = False
+    plain = ScanRuntime(cfg)
+    try:
+        assert plain.memo is None
+        assert _results(cfg, plain, FakeQuoteContext()) == first
+    finally:
+        plain.close()
+
+
+def test_new_bar_or_config_change_misses(cfg, monkeypatch):
+    ctx = FakeQuoteContext()
+    runtime = ScanRuntime(cfg)
+    code = cfg["watchlist"][0]
+    try:
+        _results(cfg, runtime, ctx)
+        calls = _counting(monkeypatch)
+
+        ctx.push_new_bar(code, KLType.K_60M)
+        _results(cfg, runtime, ctx)
+        assert calls and all(p != "1d" for p in calls)   # 只有用 60m 的周期重算
+
+        calls.clear()
+        cfg["signal"] = {**cfg["signal"], "min_score": cfg["signal"].get("min_score", 0) + 1}
+        _results(cfg, runtime, ctx)
+        assert len(calls) == len(cfg["watchlist"]) * len(cfg["periods"])
+    finally:
+        runtime.close()
+
+
+def test_fingerprint_changes_with_last_bar():
+    df = make_kline_frame("HK.00700", 30)
+    fp = bar_fingerprint(df)
+    moved = df.copy()
+    moved.loc[moved.index[-1], "close"] += 1
+    assert bar_fingerprint(moved) != fp
+    assert bar_fingerprint(df.iloc[:-1]) != fp
+
+
+def test_forming_bar_ticks_reuse_closed_prefix(cfg):
+    cfg["filters"]["min_turnover"] = 0
+    ctx = FakeQuoteContext()
+    code = cfg["watchlist"][0]
+    runtime = ScanRuntime(cfg)
+    try:
+        _results(cfg, runtime, ctx)
+        last = float(ctx.frames[(code, KLType.K_60M)]["close"].iloc[-1])
+        for step in (1.004, 0.991, 1.013, 0.97):
+            ctx.push_forming(code, KLType.K_60M, round(last * step, 1))   # 盘中价格每个 tick 都在变
+            before = runtime.memo.stats()
+            got = _results(cfg, runtime, ctx)
+            st = runtime.memo.stats()
+            assert st["misses"] == before["misses"]                      # 已收盘前缀没变：全部命中
+            assert st["hits"] - before["hits"] == len(cfg["watchlist"]) * len(cfg["periods"])
+
+            plain_cfg = {**cfg, "memo": {**cfg["memo"], "enabled": False}}
+            plain = ScanRuntime(plain_cfg)
+            try:
+                assert got == _results(plain_cfg, plain, ctx)            # 与整段重算一致
+            finally:
+                plain.close()
+    finally:
+        runtime.close()
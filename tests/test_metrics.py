@@ -0,0 +1,95 @@
+import glob
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from monitor import metrics
+from monitor.fake_opend import FakeQuoteContext
+from monitor.schedule_runner import ScanRuntime, _scan_once
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    metrics.REGISTRY.reset()
+    metrics.REGISTRY.enabled = True
+    yield
+    metrics.REGISTRY.reset()
+    metrics.REGISTRY.enabled = True
+
+
+def _hists(snapshot):
+    return {(name, label): (counts, total, count) for name, label, counts, total, count in snapshot["h"]}
+
+
+def test_histogram_buckets_and_render():
+    for v in (0.00003, 0.002, 0.002, 100.0):
+        metrics.observe(metrics.STAGE, v, "fetch")
+    metrics.inc("monitor_ticks_total")
+    snap = metrics.REGISTRY.snapshot()
+    counts, total, count = _hists(snap)[(metrics.STAGE, "fetch")]
+    assert count == 4 and sum(counts) == 4 and counts[0] == 1 and counts[-1] == 1
+    assert total == pytest.approx(100.00403)
+
+    text = metrics.render(snap)
+    assert "# TYPE monitor_stage_seconds histogram" in text
+    assert 'monitor_stage_seconds_bucket{stage="fetch",le="0.0025"} 3' in text
+    assert 'monitor_stage_seconds_bucket{stage="fetch",le="+Inf"} 4' in text
+    assert 'monitor_stage_seconds_count{stage="fetch"} 4' in text
+    assert "monitor_ticks_total 1" in text
+
+
+def test_disabled_registry_records_nothing():
+    metrics.REGISTRY.enabled = False
+    with metrics.stage("fetch"):
+        pass
+    metrics.observe_symbol(0.1)
+    assert metrics.REGISTRY.snapshot() == {"h": [], "c": {}}
+
+
+def test_scan_records_every_stage(cfg):
+    cfg["notify"]["routes"] = [{"priority": ["高", "中"], "sinks": ["log"]}]
+    runtime = ScanRuntime(cfg)
+    try:
+        _scan_once(FakeQuoteContext(), cfg, runtime)
+    finally:
+        runtime.close()
+    hists = _hists(metrics.REGISTRY.snapshot())
+    stages = {label for name, label in hists if name == metrics.STAGE}
+    assert {"fetch", "resample", "aggregate", "notify", "tick", "smooth.fft", "smooth.wavelet"} <= stages
+    assert {f"indicator.{n}" for n in ("MA", "MACD", "RSI", "BOLL", "FFT", "DERIV", "WAVELET", "HYBRID", "REG")} <= stages
+    n = len(cfg["watchlist"])
+    assert hists[(metrics.SYMBOL, "")][2] == n
+    # 过不了成交额/价格过滤的周期不投票
+    assert 0 < hists[(metrics.STAGE, "indicator.MACD")][2] <= n * len(cfg["periods"])
+    counters = metrics.REGISTRY.snapshot()["c"]
+    assert counters["monitor_ticks_total"] == 1 and counters["monitor_symbols_total"] == n
+    # 首轮结果缓存全部未命中
+    assert "monitor_memo_hits_total" not in counters and counters["monitor_memo_misses_total"] > 0
+
+
+def test_profile_dump_per_tick(cfg, tmp_path):
+    cfg["metrics"]["profile"] = {"enabled": True, "every": 2, "dir": str(tmp_path / "prof"), "keep": 1}
+    runtime = ScanRuntime(cfg)
+    try:
+        for _ in range(5):
+            _scan_once(FakeQuoteContext(), cfg, runtime)
+    finally:
+        runtime.close()
+    files = glob.glob(os.path.join(tmp_path, "prof", "tick-*.prof"))
+    assert len(files) == 1 and files[0].endswith("-4.prof")
+
+
+def test_metrics_route_serves_bus_snapshot(monkeypatch, tmp_path):
+    import web.server as server
+    from monitor.signal_store import SignalStore
+
+    monkeypatch.setattr(server, "latest_metrics", {})
+    monkeypatch.setattr(server, "load_config", lambda path=None: {"bus": {"enabled": False}, "web": {}})
+    monkeypatch.setattr(server.app.state, "signal_store", SignalStore(str(tmp_path / "s.db")), raising=False)
+    metrics.observe(metrics.SYMBOL, 0.02)
+    server.apply_bus_messages([{"topic": "metrics", "data": metrics.REGISTRY.snapshot()}])
+    with TestClient(server.app) as client:
+        resp = client.get("/metrics")
+    assert resp.status_code == 200 and resp.headers["content-type"].startswith("text/plain")
+    assert "monitor_symbol_seconds_count 1" in resp.text
@@ -0,0 +1,198 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from monitor.notify import (NotifyDispatcher, Outbox, RateLimiter, coalesce, notify_signals, resolve_routes,
+                            resolve_sinks, route)
+
+
+class StubServer:
+    """本地假企业微信：记录收到的消息；replies 里的 (HTTP 状态码, errcode) 依次使用，用完后一律成功"""
+
+    def __init__(self, replies=(), delay=0.0):
+        self.replies = list(replies)
+        self.delay = delay
+        self.received = []          # [(monotonic 时间, content)]
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(stub.delay)
+                status, errcode = stub.replies.pop(0) if stub.replies else (200, 0)
+                if status == 200 and errcode == 0:
+                    stub.received.append((time.monotonic(), body["text"]["content"]))
+                payload = json.dumps({"errcode": errcode, "errmsg": "stub"}).encode()
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/send"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def stub():
+    s = StubServer()
+    yield s
+    s.close()
+
+
+def _notify_cfg(url, outbox=None, **dispatch):
+    d = {"coalesce_seconds": 0.1, "backoff_base": 0.05, "max_attempts": 3, "outbox": outbox}
+    d.update(dispatch)
+    return {"enabled": True, "channel": "wecom", "wecom": {"webhook": url}, "dispatch": d}
+
+
+def test_coalesce_dedupes_and_splits():
+    assert coalesce(["a", "b", "a", ""]) == ["a\nb"]
+    assert coalesce(["aaaa", "bbbb", "cc"], max_chars=9) == ["aaaa\nbbbb", "cc"]
+    assert coalesce(["x" * 10], max_chars=4) == ["xxxx", "xxxx", "xx"]
+
+
+def test_rate_limiter_sliding_window():
+    rl = RateLimiter(2, 10)
+    rl.hit(0.0)
+    rl.hit(1.0)
+    assert rl.delay(5.0) == pytest.approx(5.0)
+    assert rl.delay(10.0) == 0.0
+
+
+def test_burst_is_coalesced_into_one_post(stub):
+    disp = NotifyDispatcher(_notify_cfg(stub.url)).start()
+    t0 = time.monotonic()
+    for i in range(5):
+        disp.submit([f"信号 {i}", "重复行"])
+    assert time.monotonic() - t0 < 0.05          # 不等网络
+    assert disp.flush(5)
+    disp.close()
+    assert len(stub.received) == 1
+    assert stub.received[0][1].split("\n") == ["信号 0", "重复行", "信号 1", "信号 2", "信号 3", "信号 4"]
+    assert disp.stats()["sent"] == 1
+
+
+def test_failures_are_retried_with_backoff(stub):
+    stub.replies = [(500, 0), (200, 45009)]      # HTTP 错误、企业微信限频
+    disp = NotifyDispatcher(_notify_cfg(stub.url)).start()
+    disp.submit(["hello"])
+    assert disp.flush(5)
+    disp.close()
+    assert [text for _, text in stub.received] == ["hello"]
+    st = disp.stats()
+    assert st["failed"] == 2 and st["sent"] == 1 and st["dead"] == 0
+
+
+def test_gives_up_after_max_attempts(stub):
+    stub.replies = [(500, 0)] * 3
+    disp = NotifyDispatcher(_notify_cfg(stub.url)).start()
+    disp.submit(["lost"])
+    assert disp.flush(5)
+    assert disp.stats()["dead"] == 1 and disp.outbox.count("dead") == 1
+    disp.close()
+    assert stub.received == []
+
+
+def test_rate_limit_defers_instead_of_failing(stub):
+    cfg = _notify_cfg(stub.url, max_chars=5, rate_limit={"wecom": {"count": 2, "seconds": 0.5}})
+    disp = NotifyDispatcher(cfg).start()
+    disp.submit(["aaaa", "bbbb", "cccc"])
+    assert disp.flush(5)
+    disp.close()
+    times = [t for t, _ in stub.received]
+    assert [text for _, text in stub.received] == ["aaaa", "bbbb", "cccc"]
+    assert times[2] - times[0] >= 0.45
+    assert disp.stats()["failed"] == 0
+
+
+def test_outbox_survives_restart(tmp_path, stub):
+    path = str(tmp_path / "outbox.db")
+    down = StubServer()
+    down_url = down.url
+    down.close()                                 # 连接被拒绝
+    disp = NotifyDispatcher(_notify_cfg(down_url, outbox=path, backoff_base=60)).start()
+    disp.submit(["kept"])
+    deadline = time.monotonic() + 5
+    while disp.stats()["failed"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    disp.close()
+    assert Outbox(path).count() == 1
+
+    # 重启后用可用的地址（配置已修好），到期重试时发出
+    disp = NotifyDispatcher(_notify_cfg(stub.url, outbox=path))
+    disp.outbox.reschedule(1, 0.0)
+    disp.start()
+    assert disp.flush(5)
+    disp.close()
+    assert [text for _, text in stub.received] == ["kept"]
+
+
+def test_legacy_channel_config_maps_to_sinks_and_routes():
+    ncfg = {"channel": "wecom", "wecom": {"webhook": "http://x"}}
+    assert resolve_sinks(ncfg) == {"log": {"type": "log", "name": "log"},
+                                   "wecom": {"type": "wecom", "webhook": "http://x", "name": "wecom"}}
+    by_sink = route([("HK.00700", "高", "a"), ("US.AAPL", "中", "b"), ("US.TSLA", "低", "c")], resolve_routes(ncfg))
+    assert by_sink == {"wecom": ["a"], "log": ["b"]}
+
+
+def test_routes_fan_out_by_priority_and_market():
+    routes = [
+        {"priority": ["高"], "market": ["HK"], "sinks": ["hk", "file"]},
+        {"priority": ["高"], "market": ["US"], "sinks": ["us", "file"]},
+        {"codes": ["US.AAPL"], "sinks": ["file"]},
+        {"priority": ["中"], "sinks": ["log"]},
+    ]
+    signals = [("HK.00700", "高", "a"), ("US.AAPL", "高", "b"), ("US.AAPL", "中", "c"), ("SH.600000", "低", "d")]
+    assert route(signals, routes) == {"hk": ["a"], "file": ["a", "b", "c"], "us": ["b"], "log": ["c"]}
+
+
+def test_slow_sink_does_not_delay_others(tmp_path, stub):
+    slow = StubServer(delay=1.0)
+    ncfg = {
+        "enabled": True,
+        "sinks": {
+            "slow": {"type": "wecom", "webhook": slow.url},
+            "fast": {"type": "wecom", "webhook": stub.url},
+            "file": {"type": "file", "path": str(tmp_path / "notify.log")},
+        },
+        "routes": [{"priority": ["高"], "sinks": ["slow", "fast", "file"]}],
+        "dispatch": {"coalesce_seconds": 0.05},
+    }
+    disp = NotifyDispatcher(ncfg).start()
+    t0 = time.monotonic()
+    disp.submit_routed(route([("HK.00700", "高", "first"), ("HK.00700", "高", "second")], ncfg["routes"]))
+    deadline = t0 + 5
+    while not stub.received and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert stub.received and stub.received[0][0] - t0 < 0.5
+    assert disp.flush(5)
+    disp.close()
+    slow.close()
+    st = disp.stats()["sinks"]
+    assert st["slow"]["sent"] == st["fast"]["sent"] == st["file"]["sent"] == 1
+    assert st["slow"]["p50_ms"] >= 900 > st["fast"]["p50_ms"]
+    assert "first\nsecond" in (tmp_path / "notify.log").read_text(encoding="utf-8")
+
+
+def test_local_sinks_still_log_when_notify_disabled(caplog, tmp_path):
+    cfg = {"notify": {
+        "enabled": False,
+        "sinks": {"log": {"type": "log"}, "file": {"type": "file", "path": str(tmp_path / "n.log")}},
+        "routes": [{"priority": ["中"], "sinks": ["log"]}, {"priority": ["高"], "sinks": ["file"]}],
+    }}
+    with caplog.at_level("INFO"):
+        counts = notify_signals([("HK.00700", "中", "mid"), ("HK.00700", "高", "high")], cfg)
+    assert counts == {"log": 1}
+    assert "mid" in caplog.text and "[通知] 已关闭" in caplog.text
+    assert not (tmp_path / "n.log").exists()
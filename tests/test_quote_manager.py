@@ -0,0 +1,188 @@
+import threading
+import time
+
+import pytest
+from futu import KLType, SubType, RET_OK
+
+from monitor import schedule_runner
+from monitor.fake_opend import FakeQuoteContext
+from monitor.quote_manager import ManagedQuoteContext, QuotaScheduler, TokenBucket, HIGH, NORMAL
+from monitor.schedule_runner import ScanRuntime, run_once
+
+
+class FakeClock:
+    def __init__(self):
+        self.t = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.t += seconds
+
+
+def test_token_bucket_never_exceeds_window_limit():
+    clock = FakeClock()
+    bucket = TokenBucket(60, 30, clock=clock)
+    taken = []
+    while clock.t < 120:
+        wait = bucket.try_take()
+        if wait:
+            clock.t += wait
+        else:
+            taken.append(clock.t)
+    for i, t in enumerate(taken):
+        in_window = sum(1 for u in taken[i:] if u < t + 30)
+        assert in_window <= 60
+    assert len(taken) >= 60 * 120 / 30 / 2
+
+
+def test_scheduler_serves_high_priority_first():
+    sched = QuotaScheduler({"get_cur_kline": {"count": 2, "seconds": 0.5, "burst": 1}})
+    sched.acquire("get_cur_kline")   # 用掉唯一的突发令牌，后面都要排队
+    order = []
+
+    def worker(name, priority):
+        sched.acquire("get_cur_kline", priority)
+        order.append(name)
+
+    threads = []
+    for i in range(3):
+        threads.append(threading.Thread(target=worker, args=(f"low{i}", NORMAL)))
+        threads[-1].start()
+    while sched.waiting("get_cur_kline") < 3:
+        time.sleep(0.005)
+    threads.append(threading.Thread(target=worker, args=("high", HIGH)))
+    threads[-1].start()
+    for t in threads:
+        t.join(timeout=10)
+    assert order[0] == "high" and sorted(order[1:]) == ["low0", "low1", "low2"]
+    assert sched.waited > 0
+
+
+def test_throttled_calls_back_off_and_retry():
+    clock = FakeClock()
+    fake = FakeQuoteContext(rate_limits={"get_cur_kline": (2, 2)}, clock=clock)
+    mgr = ManagedQuoteContext(lambda: fake, limits={"get_cur_kline": {"count": 1000, "seconds": 1}},
+                              backoff=1.0, sleep=clock.sleep)
+    for _ in range(3):
+        ret, df = mgr.get_cur_kline("HK.00700", 10, KLType.K_60M)
+        assert ret == RET_OK and len(df) == 10
+    st = mgr.stats()
+    assert st["throttled"] == 2 and st["retried"] == 2 and clock.sleeps == [1.0, 2.0]
+    assert st["calls"]["get_cur_kline"] == 5 and fake.rejected == 2
+
+
+def test_paced_scan_stays_under_opend_limit(cfg):
+    fake = FakeQuoteContext(rate_limits={"get_cur_kline": (4, 1)})
+    mgr = ManagedQuoteContext(lambda: fake, limits={"get_cur_kline": {"count": 4, "seconds": 1}})
+    cfg["kline_cache"]["enabled"] = False
+    runtime = ScanRuntime(cfg)
+    try:
+        schedule_runner._scan_once(mgr, cfg, runtime)
+    finally:
+        runtime.close()
+    kline_calls = [c for c in fake.calls if len(c) == 3]
+    assert len(kline_calls) == 2 * len(cfg["watchlist"])
+    assert fake.rejected == 0 and mgr.stats()["throttled"] == 0
+
+
+def test_reconnect_restores_handler_and_subscriptions():
+    created = []
+
+    def factory():
+        created.append(FakeQuoteContext())
+        return created[-1]
+
+    mgr = ManagedQuoteContext(factory)
+    handler = object()
+    mgr.set_handler(handler)
+    assert mgr.subscribe(["HK.00700"], [SubType.K_60M, SubType.K_DAY])[0] == RET_OK
+
+    created[0].disconnect()
+    ret, _ = mgr.get_cur_kline("HK.00700", 5, KLType.K_60M)
+    assert ret == RET_OK and len(created) == 2 and created[0].closed
+    assert created[1].handler is handler
+    restored = {(c, s) for codes, subs in created[1].subscriptions for c in codes for s in subs}
+    assert restored == {("HK.00700", SubType.K_60M), ("HK.00700", SubType.K_DAY)}
+    assert mgr.stats()["reconnects"] == 1
+
+
+def test_concurrent_disconnects_reconnect_once():
+    n = 8
+    barrier = threading.Barrier(n)
+
+    class Dropped(FakeQuoteContext):
+        def get_cur_kline(self, *args, **kwargs):
+            if not self.connected:
+                barrier.wait(timeout=5)   # 所有线程都先看到断线
+            return super().get_cur_kline(*args, **kwargs)
+
+    created = []
+
+    def factory():
+        created.append(Dropped())
+        return created[-1]
+
+    mgr = ManagedQuoteContext(factory)
+    mgr.ctx().disconnect()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(mgr.get_cur_kline("HK.00700", 5, KLType.K_60M)[0]))
+               for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [RET_OK] * n
+    assert len(created) == 2 and mgr.stats()["reconnects"] == 1
+
+
+def test_programming_errors_are_not_treated_as_disconnects():
+    class Broken(FakeQuoteContext):
+        def get_cur_kline(self, *args, **kwargs):
+            raise TypeError("bad argument")
+
+    created = []
+
+    def factory():
+        created.append(Broken())
+        return created[-1]
+
+    mgr = ManagedQuoteContext(factory)
+    with pytest.raises(TypeError):
+        mgr.get_cur_kline("HK.00700", 5, KLType.K_60M)
+    assert len(created) == 1 and mgr.stats()["reconnects"] == 0
+
+
+def test_subscription_slots_prefer_priority_codes():
+    fake = FakeQuoteContext(sub_quota=3)
+    mgr = ManagedQuoteContext(lambda: fake, sub_quota=3)
+    mgr.set_priority_codes(["US.AAPL"])
+    ret, _ = mgr.subscribe(["HK.00700", "US.AAPL"], [SubType.K_60M, SubType.K_DAY])
+    assert ret == RET_OK
+    assert set(mgr.subscribed) == {("US.AAPL", SubType.K_60M), ("US.AAPL", SubType.K_DAY),
+                                   ("HK.00700", SubType.K_60M)}
+    # 已订阅的不重复占额度
+    assert mgr.subscribe(["US.AAPL"], [SubType.K_60M]) == (RET_OK, None)
+    mgr.unsubscribe(["HK.00700"], [SubType.K_60M])
+    assert mgr.stats()["subscribed"] == 2
+
+
+def test_run_once_reuses_runtime_connection(cfg, monkeypatch):
+    created = []
+
+    def fake_manager(c):
+        created.append(FakeQuoteContext())
+        return ManagedQuoteContext(lambda: created[-1])
+
+    monkeypatch.setattr(schedule_runner, "quote_manager", fake_manager)
+    runtime = ScanRuntime(cfg)
+    try:
+        run_once(cfg, runtime)
+        run_once(cfg, runtime)
+        assert len(created) == 1 and not created[0].closed
+    finally:
+        runtime.close()
+    assert created[0].closed
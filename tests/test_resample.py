@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+from futu import KLType
+
+from monitor.fake_opend import make_kline_frame
+from monitor.resample import Resampler, bucket_keys, group_starts, resample_frame
+
+
+def _keys(code, times):
+    return bucket_keys(pd.to_datetime(pd.Series(times)).to_numpy(), code, 120)
+
+
+def test_buckets_follow_sessions_not_clock():
+    hk = ["2024-01-02 10:30:00", "2024-01-02 11:30:00", "2024-01-02 12:00:00",
+          "2024-01-02 14:00:00", "2024-01-02 15:00:00", "2024-01-02 16:00:00", "2024-01-03 10:30:00"]
+    # 港股 2h：[10:30, 11:30] [12:00, 14:00]（跨午休）[15:00, 16:00]，次日另起
+    assert group_starts(_keys("HK.00700", hk)).tolist() == [0, 2, 4, 6]
+    us = ["2024-01-02 10:30:00", "2024-01-02 11:30:00", "2024-01-02 12:30:00",
+          "2024-01-02 13:30:00", "2024-01-02 14:30:00", "2024-01-02 15:30:00", "2024-01-02 16:00:00"]
+    assert group_starts(_keys("US.AAPL", us)).tolist() == [0, 2, 4, 6]
+
+
+def test_resample_frame_aggregates_ohlc_and_turnover():
+    df = make_kline_frame("HK.00700", 12, KLType.K_60M)
+    out = resample_frame(df, 120)
+    assert len(out) == 6
+    assert out["time_key"].tolist() == df["time_key"].iloc[[1, 3, 5, 7, 9, 11]].tolist()
+    assert out["open"].iloc[1] == df["open"].iloc[2] and out["close"].iloc[1] == df["close"].iloc[3]
+    assert out["high"].iloc[1] == df["high"].iloc[2:4].max() and out["low"].iloc[1] == df["low"].iloc[2:4].min()
+    assert out["turnover"].sum() == pytest.approx(df["turnover"].sum())
+    assert resample_frame(df, 120, drop_first=True).equals(out.iloc[1:].reset_index(drop=True))
+
+
+@pytest.mark.parametrize("minutes", [120, 240, 180])
+def test_cached_resampler_matches_full_recompute(minutes):
+    full = make_kline_frame("HK.00700", 700, KLType.K_60M)
+    rs = Resampler()
+    for end in range(300, 700, 7):
+        window = full.iloc[end - 300:end].reset_index(drop=True)
+        expect = resample_frame(window, minutes, drop_first=True)
+        pd.testing.assert_frame_equal(rs.resample(window, minutes), expect)
+    assert rs.rebuilds == 1 and rs.incremental > 50
+
+
+def test_resampler_rebuilds_when_history_is_restated():
+    full = make_kline_frame("HK.00700", 400, KLType.K_60M)
+    rs = Resampler()
+    rs.resample(full.iloc[:300], 240)
+    restated = full.iloc[1:301].copy()
+    restated["close"] *= 0.5
+    pd.testing.assert_frame_equal(rs.resample(restated, 240), resample_frame(restated, 240, drop_first=True))
+    assert rs.rebuilds == 2
@@ -0,0 +1,69 @@
+import csv
+import threading
+
+from monitor.signal_store import SignalStore, db_path_for, get_store
+from monitor.utils import cooldown_checker
+
+
+def test_cooldown_is_per_key(tmp_path):
+    store = SignalStore(str(tmp_path / "s.db"))
+    assert store.check_and_record("HK.00700", "多周期", "买入", 30, now=1000)
+    assert not store.check_and_record("HK.00700", "多周期", "买入", 30, now=1000 + 29 * 60)
+    assert store.check_and_record("HK.00700", "多周期", "卖出", 30, now=1000 + 60)
+    assert store.check_and_record("US.AAPL", "多周期", "买入", 30, now=1000 + 60)
+    assert store.check_and_record("HK.00700", "多周期", "买入", 30, now=1000 + 30 * 60)
+    assert store.last("HK.00700", "多周期", "买入") == 1000 + 30 * 60
+
+
+def test_index_reloaded_from_disk(tmp_path):
+    path = str(tmp_path / "s.db")
+    store = SignalStore(path)
+    store.record("HK.00700", "多周期", "买入", ts=500)
+    store.record("HK.00700", "多周期", "买入", ts=300)
+    store.close()
+
+    again = SignalStore(path)
+    assert again.last("HK.00700", "多周期", "买入") == 500
+    assert [r["ts"] for r in again.history(code="HK.00700")] == [300, 500]
+    assert again.history(since=400) == [{"id": 1, "code": "HK.00700", "period": "多周期", "action": "买入", "ts": 500}]
+
+
+def test_legacy_csv_imported_once(tmp_path):
+    csv_path = tmp_path / "signals.csv"
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["code", "period", "action", "ts"])
+        w.writerow(["HK.00700", "多周期", "买入", 100])
+        w.writerow(["HK.00700", "多周期", "买入", 200])
+        w.writerow(["US.AAPL", "多周期", "卖出", "bad"])
+
+    store = SignalStore(db_path_for(str(csv_path)))
+    assert store.import_csv(str(csv_path)) == 2
+    assert store.import_csv(str(csv_path)) == 0
+    assert store.last("HK.00700", "多周期", "买入") == 200
+    assert len(store.history()) == 2
+
+
+def test_cooldown_checker_keeps_signature(tmp_path):
+    path = str(tmp_path / "signals.csv")
+    assert cooldown_checker("HK.00700", "多周期", "买入", 30, path)
+    assert not cooldown_checker("HK.00700", "多周期", "买入", 30, path)
+    assert cooldown_checker("HK.00700", "多周期", "卖出", 30, path)
+    assert get_store(path).path == str(tmp_path / "signals.db")
+
+
+def test_concurrent_check_and_record_lets_one_through(tmp_path):
+    store = SignalStore(str(tmp_path / "s.db"))
+    barrier = threading.Barrier(8)
+    allowed = []
+
+    def worker():
+        barrier.wait()
+        allowed.append(store.check_and_record("HK.00700", "多周期", "买入", 30, now=1000))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert allowed.count(True) == 1 and len(store.history()) == 1
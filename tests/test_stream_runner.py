@@ -0,0 +1,98 @@
+from futu import KLType, SubType
+
+from monitor.fake_opend import FakeQuoteContext
+from monitor.kline_fetch import KlineFetcher
+from monitor.stream_runner import StreamRunner
+from monitor.trend import check_trend_single_period
+
+CODE = "HK.00700"
+
+
+def _runner(cfg):
+    cfg["watchlist"] = [CODE, "US.AAPL"]
+    ctx = FakeQuoteContext()
+    runner = StreamRunner(ctx, cfg)
+    runner.start()
+    return ctx, runner
+
+
+def test_start_subscribes_and_seeds(cfg):
+    ctx, runner = _runner(cfg)
+    assert ctx.subscriptions == [([CODE, "US.AAPL"], [SubType.K_60M, SubType.K_DAY])]
+    assert set(runner.period_results[CODE]) == set(cfg["periods"])
+    assert len(ctx.calls) == 4
+
+
+def test_forming_updates_do_not_trigger_evaluation(cfg):
+    ctx, runner = _runner(cfg)
+    ctx.push_forming(CODE, KLType.K_60M, 321.0)
+    assert runner.process_pending() == 0
+    assert runner.evaluations == 0
+    assert runner.cache.peek(CODE, KLType.K_60M)["close"].iloc[-1] == 321.0
+
+
+def test_bar_close_reevaluates_only_affected_periods(cfg):
+    ctx, runner = _runner(cfg)
+    calls_before = len(ctx.calls)
+    day_result = runner.period_results[CODE]["1d"]
+
+    ctx.push_new_bar(CODE, KLType.K_60M)
+    assert runner.process_pending() == 1
+    assert runner.evaluations == 3          # 1h / 2h / 4h
+    assert len(ctx.calls) == calls_before   # 不再向 OpenD 拉K线
+    assert runner.period_results[CODE]["1d"] is day_result
+
+    # 与直接在已收盘K线上计算的结果一致
+    closed = ctx.frames[(CODE, KLType.K_60M)].iloc[:-1].tail(cfg["kline_num"] - 1).reset_index(drop=True)
+    fetcher = KlineFetcher(ctx, cfg["kline_num"])
+    fetcher.put(CODE, KLType.K_60M, closed)
+    for p in ["1h", "2h", "4h"]:
+        assert runner.period_results[CODE][p] == check_trend_single_period(ctx, CODE, p, cfg, fetcher=fetcher)
+
+
+def test_buffer_tracks_pushes(cfg):
+    ctx, runner = _runner(cfg)
+    for i in range(3):
+        ctx.push_new_bar(CODE, KLType.K_DAY, close=100.0 + i)
+        ctx.push_forming(CODE, KLType.K_DAY, 101.5 + i)
+    assert runner.process_pending() == 3
+    buf = runner.cache.peek(CODE, KLType.K_DAY)
+    expect = ctx.frames[(CODE, KLType.K_DAY)].tail(cfg["kline_num"]).reset_index(drop=True)
+    assert list(buf["time_key"]) == list(expect["time_key"])
+    assert list(buf["close"]) == list(expect["close"])
+
+
+def test_incremental_banks_skip_classic_recompute(cfg, monkeypatch):
+    from monitor import trend
+
+    ctx, runner = _runner(cfg)
+    assert runner.incremental and (CODE, "1h") in runner.banks
+
+    def boom(*args, **kwargs):
+        raise AssertionError("推送模式不应整段重算传统指标")
+
+    monkeypatch.setattr(trend, "_classic_signals", boom)
+    ctx.push_new_bar(CODE, KLType.K_60M)
+    assert runner.process_pending() == 1
+    closed = ctx.frames[(CODE, KLType.K_60M)]["time_key"].iloc[-2]
+    assert runner.banks[(CODE, "1h")].last_key == closed
+
+
+def test_banks_checkpoint_across_restart(cfg, monkeypatch):
+    from monitor.incremental import IndicatorBank
+
+    ctx, runner = _runner(cfg)
+    ctx.push_new_bar(CODE, KLType.K_60M)
+    runner.process_pending()
+    runner.stop()
+    saved = runner.banks[(CODE, "1h")].to_dict()
+
+    resets = []
+    real_reset = IndicatorBank.reset
+    again = StreamRunner(ctx, cfg)
+    assert again.banks[(CODE, "1h")].to_dict() == saved
+    monkeypatch.setattr(IndicatorBank, "reset", lambda self: (resets.append(self), real_reset(self)))
+    again.start()
+    # 恢复的状态与缓冲对得上，只回滚重喂最后一根、再接上形成中的一根，不整段重喂
+    assert not [b for b in resets if b is again.banks[(CODE, "1h")]]
+    assert again.banks[(CODE, "1h")].count == runner.banks[(CODE, "1h")].count + 1
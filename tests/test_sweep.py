@@ -0,0 +1,92 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from futu import *
+
+from monitor.backtest import PreparedCode, prepare, run
+from monitor.fake_opend import make_kline_frame
+import monitor.sweep as sweep_mod
+from monitor.sweep import _attach_shared, _pack_shared, apply_params, grid, random_search, sweep
+
+SPACE = {
+    "weights.macd": [1, 3],
+    "signal.priority_high_score": [0, 20, 60],
+}
+
+
+@pytest.fixture
+def prepared(cfg):
+    cfg["kline_num"] = 100
+    cfg["filters"]["min_turnover"] = 0
+    bars = {
+        code: {
+            KLType.K_60M: make_kline_frame(code, 500, KLType.K_60M),
+            KLType.K_DAY: make_kline_frame(code, 150, KLType.K_DAY, start="2024-01-02 00:00:00"),
+        }
+        for code in ["HK.00700", "US.AAPL"]
+    }
+    return prepare(bars, cfg)
+
+
+def test_apply_params_does_not_touch_original(cfg):
+    out = apply_params(cfg, {"weights.macd": 9, "signal.priority_high_score": 1})
+    assert out["weights"]["macd"] == 9 and out["signal"]["priority_high_score"] == 1
+    assert cfg["weights"]["macd"] == 2
+
+
+def test_grid_and_random_search():
+    assert len(list(grid(SPACE))) == 6
+    trials = list(random_search({"a": {"min": 1, "max": 3}, "b": {"min": 0.5, "max": 1.0}, "c": [7]}, 20, seed=1))
+    assert trials == list(random_search({"a": {"min": 1, "max": 3}, "b": {"min": 0.5, "max": 1.0}, "c": [7]}, 20, seed=1))
+    assert all(t["a"] in (1, 2, 3) and 0.5 <= t["b"] <= 1.0 and t["c"] == 7 for t in trials)
+
+
+def test_shared_memory_round_trip(cfg, prepared):
+    shm, index, metas = _pack_shared(prepared)
+    try:
+        attached = _attach_shared(shm, index, metas)
+        for code, pc in prepared.items():
+            assert isinstance(attached[code], PreparedCode)
+            for key, arr in pc.arrays().items():
+                np.testing.assert_array_equal(attached[code].arrays()[key], arr)
+        a = run(attached, cfg).signals
+        b = run(prepared, cfg).signals
+        assert a.equals(b)
+        del attached, a
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_sweep_ranks_and_matches_process_pool(cfg, prepared):
+    serial = sweep(prepared, cfg, grid(SPACE), objective="total_return")
+    assert len(serial) == 6
+    values = serial["objective"].dropna().tolist()
+    assert values == sorted(values, reverse=True)
+
+    pooled = sweep(prepared, cfg, grid(SPACE), objective="total_return", workers=2)
+    pd.testing.assert_frame_equal(pooled, serial)
+
+
+def test_checkpoint_resume_and_early_stop(cfg, prepared, tmp_path, monkeypatch):
+    ckpt = str(tmp_path / "trials.jsonl")
+    first = sweep(prepared, cfg, list(grid(SPACE))[:2], checkpoint=ckpt)
+    assert len(first) == 2
+
+    # 续跑：前两组从检查点读出，不再重算
+    evaluated = []
+    original = sweep_mod.evaluate_params
+    monkeypatch.setattr(sweep_mod, "evaluate_params", lambda *a: evaluated.append(a[2]) or original(*a))
+    full = sweep(prepared, cfg, grid(SPACE), checkpoint=ckpt)
+    assert len(evaluated) == 4
+    assert len(full) == 6
+    with open(ckpt, encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 6
+
+    # patience=1：第一组之后没有提升就停
+    stopped = sweep(prepared, cfg, [{"weights.macd": m} for m in (1, 2, 3)],
+                    patience=1, min_trades=10 ** 6)
+    assert len(stopped) == 1
+    assert math.isnan(stopped["objective"][0])
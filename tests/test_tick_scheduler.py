@@ -0,0 +1,127 @@
+from datetime import datetime
+
+import pytest
+from dateutil import tz
+
+from monitor import tick_scheduler
+from monitor.fake_opend import FakeQuoteContext, make_kline_frame
+from monitor.kline_fetch import PERIOD_KLTYPE
+from monitor.resample import resample_frame
+from monitor.tick_scheduler import AlignedRunner, BarCloseSchedule, period_close_minutes
+
+HKT = tz.gettz("Asia/Hong_Kong")
+
+
+def _hk(s):
+    return datetime.strptime(s, "%Y-%m-%d %H:%M:%S").replace(tzinfo=HKT)
+
+
+def _hhmm(minutes):
+    return [f"{m // 60}:{m % 60:02d}" for m in minutes]
+
+
+@pytest.mark.parametrize("code", ["HK.00700", "US.AAPL"])
+@pytest.mark.parametrize("period,minutes", [("2h", 120), ("4h", 240)])
+def test_close_minutes_match_resampled_bars(code, period, minutes):
+    out = resample_frame(make_kline_frame(code, 300), minutes, code=code)
+    days = out["time_key"].str[:10]
+    complete = out[days != days.iloc[-1]]   # 最后一天可能截断
+    assert sorted(set(complete["time_key"].str[11:16])) == sorted(_hhmm(period_close_minutes(code, period)))
+
+
+def test_last_and_next_close_respect_settle_and_weekends():
+    sched = BarCloseSchedule(settle_seconds=10)
+    assert sched.last_close("HK", "1h", _hk("2024-02-27 10:30:05")) == datetime(2024, 2, 26, 16, 0)
+    assert sched.last_close("HK", "1h", _hk("2024-02-27 10:30:20")) == datetime(2024, 2, 27, 10, 30)
+    assert sched.last_close("HK", "1d", _hk("2024-02-26 09:00:00")) == datetime(2024, 2, 23, 16, 0)
+    nxt = sched.next_close("HK", "1h", _hk("2024-03-01 16:30:00"))
+    assert nxt == _hk("2024-03-04 10:30:10")
+    # 美股按纽约时间
+    assert sched.last_close("US", "1d", _hk("2024-02-27 10:31:00")) == datetime(2024, 2, 26, 16, 0)
+
+
+class Recorder:
+    """替换 check_trend_single_period：记录每次计算用到的最后一根K线"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, quote_ctx, code, period, cfg, fetcher=None, evaluator=None):
+        df = fetcher.peek(code, PERIOD_KLTYPE[period])
+        self.calls.append((code, period, df["time_key"].iloc[-1]))
+        return None
+
+
+@pytest.fixture
+def runner(cfg, monkeypatch):
+    rec = Recorder()
+    holdings = []
+    monkeypatch.setattr(tick_scheduler, "check_trend_single_period", rec)
+    monkeypatch.setattr(tick_scheduler, "get_holdings", lambda: list(holdings))
+    cfg["watchlist"] = ["HK.00700", "US.AAPL"]
+    r = AlignedRunner(cfg)
+    r.rec, r.holdings_list = rec, holdings
+    yield r
+    r.runtime.close()
+
+
+def test_only_closed_periods_are_reevaluated(runner):
+    ctx = FakeQuoteContext(history=300)
+    assert runner.tick(ctx, _hk("2024-02-27 10:31:00")) == 8
+    assert runner.tick(ctx, _hk("2024-02-27 10:50:00")) == 0
+
+    runner.rec.calls.clear()
+    assert runner.tick(ctx, _hk("2024-02-27 11:31:00")) == 2
+    assert sorted(runner.rec.calls) == [("HK.00700", "1h", "2024-02-27 11:30:00"),
+                                        ("HK.00700", "2h", "2024-02-27 11:30:00")]
+
+
+def test_evaluation_never_sees_forming_bars(runner):
+    ctx = FakeQuoteContext(history=300)
+    runner.tick(ctx, _hk("2024-02-27 10:31:00"))
+    seen = {(code, p): last for code, p, last in runner.rec.calls}
+    assert seen[("HK.00700", "1h")] == "2024-02-27 10:30:00"
+    assert seen[("HK.00700", "4h")] == "2024-02-26 16:00:00"
+    assert seen[("HK.00700", "1d")] == "2024-02-26 00:00:00"
+    assert seen[("US.AAPL", "1h")] == "2024-02-26 16:00:00"
+
+
+def test_missed_closes_merge_into_one_evaluation(runner):
+    ctx = FakeQuoteContext(history=300)
+    runner.tick(ctx, _hk("2024-02-27 10:31:00"))
+    runner.rec.calls.clear()
+    runner.tick(ctx, _hk("2024-02-27 15:01:00"))
+    assert sorted(runner.rec.calls) == [("HK.00700", "1h", "2024-02-27 15:00:00"),
+                                        ("HK.00700", "2h", "2024-02-27 14:00:00"),
+                                        ("HK.00700", "4h", "2024-02-27 14:00:00")]
+
+
+def test_holdings_first_and_over_budget_codes_deferred(runner):
+    ctx = FakeQuoteContext(history=300)
+    runner.holdings_list.append("US.AAPL")
+    now = _hk("2024-02-27 10:31:00")
+    assert [code for code, _ in runner.plan(runner.codes, ["US.AAPL"], now)] == ["US.AAPL", "HK.00700"]
+
+    runner.code_cost = 3600.0
+    runner.tick(ctx, now)
+    assert {code for code, _, _ in runner.rec.calls} == {"US.AAPL"} and runner.deferred == 1
+    assert runner.next_wakeup(now) == now
+
+    runner.code_cost = None
+    runner.rec.calls.clear()
+    runner.tick(ctx, now)
+    assert {code for code, _, _ in runner.rec.calls} == {"HK.00700"} and runner.deferred == 0
+    assert runner.next_wakeup(now) == _hk("2024-02-27 11:30:10")
+
+
+def test_prefetch_batches_codes_with_same_due_kltypes(runner, monkeypatch):
+    calls = []
+    real = tick_scheduler.KlineFetcher.prefetch
+
+    def spy(self, codes, periods, executor=None):
+        calls.append((list(codes), sorted(periods)))
+        return real(self, codes, periods, executor=executor)
+
+    monkeypatch.setattr(tick_scheduler.KlineFetcher, "prefetch", spy)
+    runner.tick(FakeQuoteContext(history=300), _hk("2024-02-27 10:31:00"))
+    assert calls == [(["HK.00700", "US.AAPL"], ["1d", "1h", "2h", "4h"])]
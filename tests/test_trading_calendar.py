@@ -0,0 +1,95 @@
+from datetime import datetime
+
+import pytest
+from dateutil import tz
+
+from monitor import schedule_runner
+from monitor.fake_opend import FakeQuoteContext
+from monitor.schedule_runner import ScanRuntime, _scan_once
+from monitor.tick_scheduler import BarCloseSchedule
+from monitor.trading_calendar import TradingCalendar, get_calendar
+from monitor.utils import is_market_open
+
+HKT = tz.gettz("Asia/Hong_Kong")
+ET = tz.gettz("America/New_York")
+UTC = tz.gettz("UTC")
+
+
+def _at(s, zone):
+    return datetime.strptime(s, "%Y-%m-%d %H:%M").replace(tzinfo=zone)
+
+
+@pytest.fixture
+def cal(cfg):
+    return get_calendar(cfg)
+
+
+def test_sessions_holidays_and_half_days(cal):
+    assert cal.is_open("HK", _at("2024-02-27 10:00", HKT))
+    assert not cal.is_open("HK", _at("2024-02-27 12:30", HKT))        # 午休
+    assert not cal.is_open("HK", _at("2024-02-12 10:00", HKT))        # 农历新年
+    assert cal.is_open("HK", _at("2024-02-09 11:00", HKT))
+    assert not cal.is_open("HK", _at("2024-02-09 13:30", HKT))        # 除夕半日市
+    assert not cal.is_open("US", _at("2024-07-04 10:00", ET))
+    assert cal.is_open("US", _at("2024-07-03 12:00", ET))
+    assert not cal.is_open("US", _at("2024-07-03 13:30", ET))
+    assert not cal.is_open("US", _at("2024-02-24 10:00", ET))         # 周六
+
+
+def test_next_open_and_close(cal):
+    assert cal.next_open("HK", _at("2024-02-09 13:00", HKT)) == _at("2024-02-14 09:30", HKT)
+    now = _at("2024-02-27 10:00", HKT)
+    assert cal.next_open("HK", now) == now
+    assert cal.next_close("HK", now) == _at("2024-02-27 12:00", HKT)
+    # 美股开盘跟着夏令时走：3/11 已是 EDT，09:30 ET = 13:30 UTC
+    assert not cal.is_open("US", _at("2024-03-11 13:25", UTC))
+    assert cal.is_open("US", _at("2024-03-11 13:35", UTC))
+    assert cal.next_open("US", _at("2024-12-31 20:00", ET)) == _at("2025-01-02 09:30", ET)
+
+
+def test_table_extends_beyond_loaded_years():
+    cal = TradingCalendar()
+    assert cal.is_open("HK", _at("2031-03-04 10:00", HKT))
+    assert not cal.is_open("HK", _at("2031-03-08 10:00", HKT))        # 周六
+    assert cal.is_open("HK", _at("2024-02-12 10:00", HKT))            # 没有节假日文件：只按工作日
+
+
+def test_filter_codes_and_is_market_open(cal):
+    hk_hours = _at("2024-02-27 10:00", HKT)
+    assert cal.filter_codes(["HK.00700", "US.AAPL", "00700"], hk_hours) == ["HK.00700", "00700"]
+    assert cal.open_markets(hk_hours, ("HK", "US")) == {"HK"}
+    assert is_market_open(hk_hours, calendar=cal)
+    assert not is_market_open(hk_hours, market="US", calendar=cal)
+    assert not is_market_open(_at("2024-02-12 10:00", HKT), calendar=cal)
+
+
+def test_bar_close_schedule_follows_calendar(cal):
+    sched = BarCloseSchedule(settle_seconds=10, calendar=cal)
+    # 2/12、2/13 休市，上一个日K收盘是 2/9 半日市的 12:00
+    assert sched.last_close("HK", "1d", _at("2024-02-14 09:00", HKT)) == datetime(2024, 2, 9, 12, 0)
+    assert sched.last_close("HK", "1h", _at("2024-02-09 13:00", HKT)) == datetime(2024, 2, 9, 12, 0)
+    assert sched.next_close("HK", "1h", _at("2024-02-09 12:30", HKT)) == _at("2024-02-14 10:30", HKT).replace(second=10)
+
+
+def test_poll_scan_skips_closed_markets(cfg, monkeypatch):
+    monkeypatch.setattr(schedule_runner, "local_now", lambda: _at("2024-02-27 10:00", HKT))
+    runtime = ScanRuntime(cfg)
+    runtime.market_filter = True
+    ctx = FakeQuoteContext()
+    try:
+        _scan_once(ctx, cfg, runtime)
+    finally:
+        runtime.close()
+    assert {code for code, _, _ in ctx.calls} == {"HK.00700"}
+
+
+def test_warns_once_past_holiday_coverage(cal, caplog):
+    assert cal.covered == {"HK": 2026, "US": 2026}
+    cal._warned.clear()
+    with caplog.at_level("WARNING"):
+        cal.is_open("HK", _at("2026-12-01 10:00", HKT))
+        assert not caplog.records
+        cal.is_open("HK", _at("2027-01-04 10:00", HKT))
+        cal.is_open("HK", _at("2027-01-05 10:00", HKT))
+    warned = [r.getMessage() for r in caplog.records if "节假日数据只到 2026" in r.getMessage()]
+    assert len(warned) == 1 and "HK" in warned[0]
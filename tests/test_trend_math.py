@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from scipy.fft import fft, ifft
+
+from monitor.trend_math import (
+    SmoothingContext,
+    derivative_signal,
+    fft_lowpass,
+    fft_signal,
+    hybrid_fft_wavelet_signal,
+    rolling_regression_signal,
+    rolling_slope,
+    wavelet_signal,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _walk(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+
+
+def test_rolling_slope_matches_polyfit():
+    y = _walk(300)
+    slopes = rolling_slope(y, 20)
+    assert np.isnan(slopes[:19]).all()
+    for i in range(19, len(y)):
+        expect = np.polyfit(np.arange(20), y[i - 19:i + 1], 1)[0]
+        assert slopes[i] == pytest.approx(expect, rel=1e-9, abs=1e-10)
+
+
+def test_rolling_slope_short_series():
+    assert np.isnan(rolling_slope(np.arange(5.0), 20)).all()
+    np.testing.assert_allclose(rolling_slope(np.arange(30.0) * 2 + 7, 10)[9:], 2.0)
+
+
+def test_regression_signal_turning_points():
+    assert rolling_regression_signal(np.concatenate([np.full(10, 10.0), np.linspace(10, 10, 20), [11.0]])) == "买入"
+    assert rolling_regression_signal(np.concatenate([np.full(10, 10.0), np.linspace(10, 10, 20), [9.0]])) == "卖出"
+    assert rolling_regression_signal(np.arange(15.0)) is None
+
+
+def test_regression_signal_uses_window_slopes():
+    y = _walk(200, seed=1)
+    for end in range(21, len(y)):
+        s = rolling_slope(y[:end], 20)
+        prev, now = s[-2], s[-1]
+        expect = "买入" if prev <= 0 < now else ("卖出" if prev >= 0 > now else None)
+        assert rolling_regression_signal(y[:end]) == expect
+
+
+def test_derivative_signal_valley():
+    x = np.array([5.0, 4.5, 4.0, 3.0, 2.0, 2.1])
+    assert derivative_signal(x) == "买入"
+    assert derivative_signal(-x) == "卖出"
+
+
+def test_trend_math_does_not_import_sklearn():
+    code = "import sys, monitor.trend_math; print(any(m.startswith('sklearn') for m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT, check=True)
+    assert out.stdout.strip() == "False"
+
+
+@pytest.mark.parametrize("n", [20, 21, 128, 399, 400])
+def test_fft_lowpass_matches_complex_fft(n):
+    x = _walk(n, seed=n)
+    F = fft(x)
+    F[5:-5] = 0
+    np.testing.assert_allclose(fft_lowpass(x, 5), ifft(F).real, rtol=0, atol=1e-10)
+
+
+def test_fft_lowpass_rows_match_single():
+    X = np.stack([_walk(200, seed=s) for s in range(6)])
+    rows = fft_lowpass(X, 5, axis=1)
+    for i in range(len(X)):
+        np.testing.assert_array_equal(rows[i], fft_lowpass(X[i], 5))
+
+
+def test_smoothing_context_computes_each_curve_once():
+    ctx = SmoothingContext(_walk(300))
+    assert ctx.fft_smooth(5) is ctx.fft_smooth(5)
+    assert ctx.wavelet_smooth() is ctx.wavelet_smooth()
+    hybrid = ctx.hybrid_smooth(5)
+    assert hybrid is ctx.hybrid_smooth(5)
+    assert len(hybrid) == 300
+
+
+def test_signals_with_shared_context_match_standalone():
+    for seed in range(200):
+        x = _walk(int(np.random.default_rng(seed).integers(20, 400)), seed=seed)
+        ctx = SmoothingContext(x)
+        assert fft_signal(x, ctx=ctx) == fft_signal(x)
+        assert wavelet_signal(x, ctx=ctx) == wavelet_signal(x)
+        assert hybrid_fft_wavelet_signal(x, ctx=ctx) == hybrid_fft_wavelet_signal(x)
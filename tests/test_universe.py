@@ -0,0 +1,99 @@
+from datetime import datetime
+
+from dateutil import tz
+from futu import KLType
+
+from monitor.fake_opend import FakeQuoteContext
+from monitor.schedule_runner import ScanRuntime, _scan_once
+from monitor.universe import Universe
+
+
+class FakeClock:
+    def __init__(self):
+        self.t = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.t += seconds
+
+
+HKT = tz.gettz("Asia/Hong_Kong")
+
+
+def _hk(s):
+    return datetime.strptime(s, "%Y-%m-%d %H:%M").replace(tzinfo=HKT)
+
+
+def _universe_cfg(cfg, **ucfg):
+    cfg["mode"] = "UNIVERSE"
+    cfg["universe"] = {"markets": ["HK"], "batch_size": 400, "snapshot_quota": {"count": 60, "seconds": 30},
+                       "max_codes": None, "include_watchlist": True, **ucfg}
+    return cfg
+
+
+def test_prefilter_applies_price_turnover_and_suspension(cfg):
+    ctx = FakeQuoteContext()
+    uni = Universe(_universe_cfg(cfg))
+    snap = uni.snapshots(ctx, uni.codes(ctx, "HK"))
+    passed = uni.prefilter(snap, now=_hk("2024-02-27 11:00"))
+    rows = snap.set_index("code").loc[passed]
+    assert len(passed) and (rows["last_price"] >= cfg["filters"]["min_price"]).all()
+    assert (rows["turnover"] >= cfg["filters"]["min_turnover"]).all() and not rows["suspension"].any()
+    assert rows["turnover"].is_monotonic_decreasing
+    rejected = snap[~snap["code"].isin(passed)]
+    assert ((rejected["last_price"] < cfg["filters"]["min_price"])
+            | (rejected["turnover"] < cfg["filters"]["min_turnover"]) | rejected["suspension"]).all()
+
+
+def test_snapshots_are_batched_and_paced(cfg):
+    ctx = FakeQuoteContext(universe={"HK": [f"HK.{i:05d}" for i in range(1000)]})
+    clock = FakeClock()
+    uni = Universe(_universe_cfg(cfg, snapshot_quota={"count": 2, "seconds": 30}), clock=clock, sleep=clock.sleep)
+    uni.select(ctx)
+    assert [c for c in ctx.calls if c[0] == "snapshot"] == [("snapshot", 400), ("snapshot", 400), ("snapshot", 200)]
+    assert clock.sleeps == [30.0] and uni.waited == 30.0
+
+    # 列表在 TTL 内复用，只重拉快照
+    uni.select(ctx)
+    assert sum(1 for c in ctx.calls if c[0] == "basicinfo") == 1
+    assert uni.requests == 6
+
+
+def test_universe_scan_fetches_klines_only_for_survivors(cfg):
+    ctx = FakeQuoteContext(universe={"HK": [f"HK.{i:05d}" for i in range(1, 41)]})
+    cfg = _universe_cfg(cfg, max_codes=5)
+    cfg["watchlist"] = ["HK.00700"]
+    runtime = ScanRuntime(cfg)
+    try:
+        _scan_once(ctx, cfg, runtime)
+        expect = ["HK.00700"] + runtime.universe.prefilter(runtime.universe.snapshots(ctx, ctx.universe["HK"]))
+    finally:
+        runtime.close()
+    fetched = {c[0] for c in ctx.calls if len(c) == 3 and c[2] in (KLType.K_60M, KLType.K_DAY)}
+    assert fetched == set(expect) and len(expect) == 6
+    assert runtime.universe.last_counts["listed"] == 40
+
+
+def test_turnover_prefilter_waits_for_todays_bars(cfg):
+    ctx = FakeQuoteContext()
+    uni = Universe(_universe_cfg(cfg))
+    snap = uni.snapshots(ctx, uni.codes(ctx, "HK"))
+    priced = snap[(snap["last_price"] >= cfg["filters"]["min_price"]) & ~snap["suspension"]]
+    low = priced[priced["turnover"] < cfg["filters"]["min_turnover"]]
+    assert len(low)
+    # 第一根 60m（10:30）收盘前最后一根是昨日K线：不按成交额剔除
+    assert uni.turnover_ready("HK", _hk("2024-02-27 10:29")) is False
+    assert set(low["code"]) <= set(uni.prefilter(snap, now=_hk("2024-02-27 10:00")))
+    assert not set(low["code"]) & set(uni.prefilter(snap, now=_hk("2024-02-27 10:31")))
+    # 休市日（农历新年）同样不按成交额剔除
+    assert uni.turnover_ready("HK", _hk("2024-02-12 14:00")) is False
+
+    # 只用已收盘K线且含日K：当日收盘之后才按成交额粗筛
+    cfg["memo"]["closed_bars_only"] = True
+    closed = Universe(cfg)
+    assert closed.turnover_ready("HK", _hk("2024-02-27 15:00")) is False
+    assert closed.turnover_ready("HK", _hk("2024-02-27 16:01")) is True
@@ -0,0 +1,175 @@
+# web/broadcast.py
+"""
+WebSocket 推送：数据一变就推给所有订阅了该标的的客户端
+  - 连接后先收一份快照（只含订阅范围），之后只收增量：
+      bar    {code, time_key, close}       新K线追加 / 同 time_key 覆盖最后一个点
+      votes  {code, periods}               各周期投票（按订阅的周期裁剪）
+      signal {code, action, score, ...}    最终信号
+    同一批总线消息合并成一帧 {"type": "delta", "events": [...]}
+  - 客户端消息：
+      {"op": "subscribe", "codes": [...], "periods": [...]}   省略/null 表示全部，回一份新快照
+      {"op": "ping"} → {"type": "pong"}
+  - 背压：每个客户端一个有界发送队列；满了就清空并改发一次最新快照（resync），
+    慢客户端只会少收中间帧，不会拖住其他客户端，也不会无限占内存
+"""
+
+import asyncio
+import json
+import logging
+
+_RESYNC = object()
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class Client:
+    def __init__(self, websocket, queue_size):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.codes = None       # None 表示全部
+        self.periods = None
+        self.sent = 0
+        self.resyncs = 0
+        self.task = None
+
+    def wants(self, code):
+        return self.codes is None or code in self.codes
+
+    def filter_periods(self, periods):
+        if self.periods is None or not isinstance(periods, dict):
+            return periods
+        return {p: v for p, v in periods.items() if p in self.periods}
+
+    def offer(self, frame):
+        """非阻塞入队；队列满时丢掉积压，改为下一次发送最新快照"""
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_RESYNC)
+            self.resyncs += 1
+
+
+class Broadcaster:
+    """
+    state: web.server 里的 latest_data（只读），快照从这里裁剪
+    """
+
+    def __init__(self, state, queue_size=256):
+        self.state = state
+        self.queue_size = queue_size
+        self.clients = set()
+
+    # ---------- 连接管理 ----------
+
+    def register(self, websocket):
+        client = Client(websocket, self.queue_size)
+        client.task = asyncio.get_running_loop().create_task(self._sender(client))
+        self.clients.add(client)
+        client.offer(_RESYNC)
+        return client
+
+    async def unregister(self, client):
+        self.clients.discard(client)
+        if client.task is not None:
+            client.task.cancel()
+            try:
+                await client.task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def _sender(self, client):
+        try:
+            while True:
+                frame = await client.queue.get()
+                if frame is _RESYNC:
+                    frame = _dumps(self.snapshot(client))
+                await client.websocket.send_text(frame)
+                client.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 连接已断：停止发送，等接收端清理
+            logging.info(f"[WS] 客户端发送结束: {e}")
+
+    def handle_message(self, client, text):
+        """处理客户端发来的一条消息"""
+        try:
+            msg = json.loads(text)
+        except json.JSONDecodeError:
+            client.offer(_dumps({"type": "error", "error": "invalid json"}))
+            return
+        op = msg.get("op") if isinstance(msg, dict) else None
+        if op == "subscribe":
+            codes, periods = msg.get("codes"), msg.get("periods")
+            client.codes = set(codes) if codes is not None else None
+            client.periods = set(periods) if periods is not None else None
+            client.offer(_RESYNC)
+        elif op == "ping":
+            client.offer(_dumps({"type": "pong"}))
+        else:
+            client.offer(_dumps({"type": "error", "error": f"unknown op: {op}"}))
+
+    # ---------- 快照与增量 ----------
+
+    def snapshot(self, client):
+        codes = {}
+        for code, st in self.state.get("codes", {}).items():
+            if client.wants(code):
+                codes[code] = dict(st, periods=client.filter_periods(st.get("periods", {})))
+        signals = [s for s in self.state.get("signals", []) if client.wants(s.get("code"))]
+        return {"type": "snapshot", "codes": codes, "signals": signals}
+
+    @staticmethod
+    def events(batch):
+        """总线消息 → 增量事件（带上总线时间戳，便于客户端统计延迟）"""
+        out = []
+        for msg in batch:
+            data = msg.get("data") or {}
+            if not data.get("code"):
+                continue
+            topic = msg.get("topic")
+            if topic == "price":
+                ev = {"type": "bar", "code": data["code"], "time_key": data["time_key"], "close": data["close"]}
+            elif topic == "votes":
+                ev = {"type": "votes", "code": data["code"], "periods": data.get("periods", {})}
+            elif topic == "signal":
+                ev = dict(data, type="signal")
+            else:
+                continue
+            ev["ts"] = msg.get("ts")
+            out.append(ev)
+        return out
+
+    def broadcast(self, batch):
+        """在事件循环线程里调用；按客户端订阅裁剪，同一订阅范围的帧只编码一次"""
+        events = self.events(batch)
+        if not events or not self.clients:
+            return
+        encoded = {}
+        for client in self.clients:
+            key = (frozenset(client.codes) if client.codes is not None else None,
+                   frozenset(client.periods) if client.periods is not None else None)
+            frame = encoded.get(key)
+            if frame is None:
+                mine = []
+                for ev in events:
+                    if not client.wants(ev["code"]):
+                        continue
+                    if ev["type"] == "votes" and client.periods is not None:
+                        ev = dict(ev, periods=client.filter_periods(ev["periods"]))
+                    mine.append(ev)
+                frame = encoded[key] = _dumps({"type": "delta", "events": mine}) if mine else ""
+            if frame:
+                client.offer(frame)
+
+    def stats(self):
+        return {
+            "clients": len(self.clients),
+            "queued": sum(c.queue.qsize() for c in self.clients),
+            "sent": sum(c.sent for c in self.clients),
+            "resyncs": sum(c.resyncs for c in self.clients),
+        }
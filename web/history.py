@@ -0,0 +1,328 @@
+# web/history.py
+"""
+面板历史数据：K线/信号按时间范围取数，服务端按像素宽度降采样
+  - ohlc:   每个桶聚合成一根（开=首、高=最大、低=最小、收=末、量/额=求和），适合K线图
+  - lttb:   Largest-Triangle-Three-Buckets，只保留收盘价折线的形状
+  - minmax: 每个桶保留最低点和最高点（按时间先后），尖峰不丢
+K线来源：本地归档（ArchiveHistorySource）或 OpenD 分页拉取（FutuHistorySource）。
+来源只取 end 之前（含）最近 count 根，往前翻页每页的取数量与 max_bars 同级，与已翻过多少页无关。
+原始K线与降采样结果都进 TTL 缓存，同一视图重复请求不再取数/计算。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from futu import *
+
+from monitor.kline_fetch import PERIOD_KLTYPE
+from monitor.quote_manager import quote_manager
+from monitor.resample import PERIOD_MINUTES, resample_frame
+from monitor.utils import bar_ends
+
+OHLC_COLUMNS = ["time_key", "open", "high", "low", "close", "volume", "turnover"]
+HISTORY_FLOOR = "1990-01-01"   # 不给 start 时往前找数据的下限
+
+
+class TTLCache:
+    """线程安全的 LRU + 过期时间缓存"""
+
+    def __init__(self, maxsize=256, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# ---------- 降采样 ----------
+
+def _bucket_edges(n, buckets):
+    return np.linspace(0, n, buckets + 1).astype(int)
+
+def downsample_ohlc(df, buckets):
+    """按行数等分成 buckets 个桶聚合；行数不超过 buckets 时原样返回"""
+    n = len(df)
+    if n <= buckets or buckets <= 0:
+        return df.reset_index(drop=True)
+    starts = _bucket_edges(n, buckets)[:-1]
+    return _aggregate(df, starts)
+
+def group_bars(df, period, code=None):
+    """60m 按交易时段合并成 2h/4h（与扫描同一套分组）；首尾不完整的组也保留，便于看图"""
+    minutes = PERIOD_MINUTES.get(period)
+    if minutes is None or df.empty:
+        return df.reset_index(drop=True)
+    return resample_frame(df, minutes, code=code)
+
+def _aggregate(df, starts):
+    ends = np.append(starts[1:], len(df)) - 1
+    out = {
+        "time_key": df["time_key"].to_numpy()[starts],
+        "open": df["open"].to_numpy(dtype=float)[starts],
+        "high": np.maximum.reduceat(df["high"].to_numpy(dtype=float), starts),
+        "low": np.minimum.reduceat(df["low"].to_numpy(dtype=float), starts),
+        "close": df["close"].to_numpy(dtype=float)[ends],
+    }
+    for col in ("volume", "turnover"):
+        if col in df.columns:
+            out[col] = np.add.reduceat(df[col].to_numpy(dtype=float), starts)
+    return pd.DataFrame(out)
+
+def lttb_indices(y, threshold):
+    """LTTB：返回保留点的下标（含首尾），x 取等间距下标"""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    x = np.arange(n, dtype=float)
+    edges = _bucket_edges(n - 2, threshold - 2) + 1
+    keep = np.empty(threshold, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        if nlo >= nhi:
+            nlo, nhi = n - 1, n
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+def minmax_indices(y, buckets):
+    """每个桶的最低/最高点下标，按时间顺序"""
+    n = len(y)
+    if n <= buckets * 2 or buckets <= 0:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    edges = _bucket_edges(n, buckets)
+    idx = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        seg = y[lo:hi]
+        pair = sorted({lo + int(np.argmin(seg)), lo + int(np.argmax(seg))})
+        idx.extend(pair)
+    return np.array(idx, dtype=int)
+
+def downsample(df, width, mode="ohlc"):
+    """width: 目标点数（≈ 图表像素宽度）"""
+    if mode == "ohlc":
+        return downsample_ohlc(df, width)
+    if mode == "lttb":
+        return df.iloc[lttb_indices(df["close"].to_numpy(dtype=float), width)].reset_index(drop=True)
+    if mode == "minmax":
+        return df.iloc[minmax_indices(df["close"].to_numpy(dtype=float), max(width // 2, 1))].reset_index(drop=True)
+    raise ValueError(f"未知的降采样方式: {mode}")
+
+def to_columns(df):
+    """DataFrame → 列式 dict（比逐行的对象数组小得多）"""
+    out = {}
+    for col in OHLC_COLUMNS:
+        if col in df.columns:
+            values = df[col].tolist()
+            out[col] = [str(v) for v in values] if col == "time_key" else values
+    return out
+
+
+# ---------- K线来源 ----------
+
+def _end_bound(end):
+    """只给日期的 end 含当天全部K线"""
+    return end + " 23:59:59" if end and len(end) == 10 else end
+
+def _clip(df, start, end, count=None):
+    """按完整时间裁到 [start, end]（来源按日期取数），再只留最近 count 根"""
+    df = df.sort_values("time_key")
+    if start:
+        df = df[df["time_key"] >= start]
+    if end:
+        df = df[df["time_key"] <= _end_bound(end)]
+    if count is not None:
+        df = df.iloc[len(df) - count:] if len(df) > count else df
+    return df.reset_index(drop=True)
+
+class FutuHistorySource:
+    """
+    通过 request_history_kline 分页拉取历史K线；quote_ctx 可注入（测试用 FakeQuoteContext）
+    默认用 ManagedQuoteContext 长连接
+    """
+
+    def __init__(self, cfg=None, quote_ctx=None, page_size=1000):
+        self.cfg = cfg or {}
+        self._quote_ctx = quote_ctx
+        self.page_size = page_size
+        self._lock = threading.Lock()
+
+    def quote_ctx(self):
+        with self._lock:
+            if self._quote_ctx is None:
+                # 分页请求按 request_history_kline 的配额排队，限频时退避重试
+                self._quote_ctx = quote_manager(self.cfg)
+            return self._quote_ctx
+
+    def load(self, code, kl_type, start, end, count=None):
+        """
+        start/end: "YYYY-MM-DD[ HH:MM:SS]"，闭区间；返回按时间排序的 DataFrame，失败抛 RuntimeError
+        count: 只要 end 之前（含）最近的 count 根 —— 从 end 往前按估算的天数取一段，不够再往前接一段、
+               窗口翻倍，直到够数、到 start 或到 HISTORY_FLOOR；不从 start 整段拉
+        """
+        if count is None:
+            return _clip(self._fetch(code, kl_type, start, end), start, end)
+        # 不给 end 时首段不封顶（取到最新），从今天往前估算起点
+        hi = pd.Timestamp(end[:10]) if end else pd.Timestamp.now().normalize()
+        floor = pd.Timestamp((start or HISTORY_FLOOR)[:10])
+        # 首段自然日数：按每天根数估算，周末/节假日留 1.5 倍余量
+        per_day = len(bar_ends(code, 60)) if kl_type == KLType.K_60M else 1
+        span = int(count / per_day * 1.5) + 7
+        frames, got, upper = [], 0, end
+        while hi >= floor and got < count:
+            lo = max(hi - pd.Timedelta(days=span - 1), floor)
+            part = _clip(self._fetch(code, kl_type, lo.strftime("%Y-%m-%d"), upper), start, end)
+            frames.insert(0, part)
+            got += len(part)
+            hi, span = lo - pd.Timedelta(days=1), span * 2
+            upper = hi.strftime("%Y-%m-%d")
+        return _clip(pd.concat(frames, ignore_index=True), start, end, count)
+
+    def _fetch(self, code, kl_type, start, end):
+        """按日期区间分页拉取"""
+        ctx = self.quote_ctx()
+        frames, page_key = [], None
+        while True:
+            ret, data, page_key = ctx.request_history_kline(
+                code, start=start[:10] if start else None, end=end[:10] if end else None,
+                ktype=kl_type, max_count=self.page_size, page_req_key=page_key,
+            )
+            if ret != RET_OK:
+                raise RuntimeError(f"{code} 历史K线拉取失败: {data}")
+            frames.append(data)
+            if page_key is None:
+                break
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=OHLC_COLUMNS)
+        return df
+
+    def close(self):
+        if self._quote_ctx is not None:
+            self._quote_ctx.close()
+
+
+class ArchiveHistorySource:
+    """
+    优先读本地 BarArchive（memmap 区间切片）；归档只有扫描开始之后的K线，
+    区间起点早于归档最早一根时，更早的部分向 fallback（如 OpenD）要，再与归档拼起来
+    """
+
+    def __init__(self, archive, fallback=None):
+        self.archive = archive
+        self.fallback = fallback
+
+    def load(self, code, kl_type, start, end, count=None):
+        df = self.archive.frame(code, kl_type, start, end, count=count)
+        if self.fallback is None or (count is not None and len(df) >= count):
+            return df
+        first = self.archive.first_time(code, kl_type)
+        if first is not None and start and first <= start:
+            return df
+        if first is None or (end and end < first):
+            return self.fallback.load(code, kl_type, start, end, count=count)
+        # fallback 的 end 含 first 这一根（随后去掉），所以多要一根
+        need = None if count is None else count - len(df)
+        early = self.fallback.load(code, kl_type, start, first, count=None if need is None else need + 1)
+        early = _clip(early[early["time_key"] < first], None, None, need)
+        return pd.concat([early, df], ignore_index=True) if not early.empty else df
+
+
+class KlineHistory:
+    """取数 + 周期合并 + 降采样 + 缓存"""
+
+    def __init__(self, source, raw_ttl=60.0, view_ttl=30.0, max_bars=50000):
+        self.source = source
+        self.max_bars = max_bars
+        self.raw_cache = TTLCache(maxsize=64, ttl=raw_ttl)
+        self.view_cache = TTLCache(maxsize=512, ttl=view_ttl)
+
+    def _raw(self, code, kl_type, start, end, count=None):
+        key = (code, kl_type, start, end, count)
+        df = self.raw_cache.get(key)
+        if df is None:
+            end = _end_bound(end)
+            df = _clip(self.source.load(code, kl_type, start, end, count=count), start, end, count)
+            self.raw_cache.put(key, df)
+        return df
+
+    def query(self, code, period, start=None, end=None, width=1000, mode="ohlc"):
+        """
+        返回 {code, period, mode, total, points, more, next_end, data}
+        区间内超过 max_bars 根时只取最近的 max_bars 根，more=True，下一页用 end=next_end 往前翻
+        （next_end 是本页第一根之前那根的 time_key，end 含端点，两页不重叠）
+        """
+        if period not in PERIOD_KLTYPE:
+            raise ValueError(f"未知周期: {period}")
+        key = (code, period, start, end, width, mode)
+        cached = self.view_cache.get(key)
+        if cached is not None:
+            return cached
+
+        # 只取 end 之前够 max_bars+1 组的原始K线（2h/4h 每组最多 分钟数/60 根 60m），再多一组：
+        # 截断处最早的那组可能不完整，截断了就丢掉
+        per_group = PERIOD_MINUTES.get(period, 60) // 60
+        count = (self.max_bars + 2) * per_group
+        raw = self._raw(code, PERIOD_KLTYPE[period], start, end, count)
+        df = group_bars(raw, period, code=code)
+        if len(raw) >= count and per_group > 1:
+            df = df.iloc[1:].reset_index(drop=True)
+        more = len(df) > self.max_bars
+        next_end = None
+        if more:
+            next_end = str(df["time_key"].iloc[-self.max_bars - 1])
+            df = df.iloc[-self.max_bars:].reset_index(drop=True)
+        total = len(df)
+        view = downsample(df, width, mode)
+        out = {
+            "code": code, "period": period, "mode": mode,
+            "total": total, "points": len(view),
+            "more": more,
+            "next_end": next_end,
+            "data": to_columns(view),
+        }
+        self.view_cache.put(key, out)
+        return out
+
+
+def signal_page(store, code=None, start=None, end=None, limit=500, before_id=None):
+    """
+    信号历史分页：按 (ts, id) 倒序取 limit 条（返回仍为升序）
+    满页时 (next_end, next_id) 为本页最早一条，下一页用 end=next_end&before_id=next_id；
+    同一秒的多条信号（同一轮多个标的/周期）不会跨页丢失
+    """
+    rows = store.history(code=code, since=start, until=end, limit=limit, before_id=before_id)
+    full = rows and len(rows) >= limit
+    return {"code": code, "count": len(rows), "next_end": rows[0]["ts"] if full else None,
+            "next_id": rows[0]["id"] if full else None, "data": rows}
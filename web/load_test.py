@@ -0,0 +1,113 @@
+# web/load_test.py
+"""
+面板 WebSocket 压测：本机模拟大量客户端，同时往消息总线灌假行情
+  python -m web.load_test --clients 300 --rate 2000 --seconds 20
+需先启动 web 服务（python -m web.server，config.json 里 bus.enabled=true）。
+每个客户端随机订阅若干标的，统计收到的帧数、事件数、resync 快照数与端到端延迟（总线时间戳 → 客户端收到）。
+依赖 websockets（pip install websockets）。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from monitor.bus import BusPublisher
+
+
+class Stats:
+    def __init__(self):
+        self.frames = 0
+        self.events = 0
+        self.snapshots = 0
+        self.latencies = []
+        self.errors = 0
+
+
+async def client(url, codes, stats, stop):
+    try:
+        async with websockets.connect(url, max_queue=None) as ws:
+            await ws.send(json.dumps({"op": "subscribe", "codes": codes}))
+            while not stop.is_set():
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                now = time.time()
+                msg = json.loads(raw)
+                stats.frames += 1
+                if msg.get("type") == "snapshot":
+                    stats.snapshots += 1
+                elif msg.get("type") == "delta":
+                    stats.events += len(msg["events"])
+                    for ev in msg["events"]:
+                        if ev.get("ts"):
+                            stats.latencies.append(now - ev["ts"])
+    except Exception:
+        stats.errors += 1
+
+
+async def publisher(host, port, codes, rate, stop):
+    """按 rate 条/秒发 price 消息，每 50ms 发一批"""
+    pub = BusPublisher(host, port)
+    bar = {code: 0 for code in codes}
+    price = {code: 100.0 for code in codes}
+    per_tick = max(1, int(rate * 0.05))
+    while not stop.is_set():
+        for _ in range(per_tick):
+            code = random.choice(codes)
+            price[code] *= 1 + random.gauss(0, 0.001)
+            if random.random() < 0.05:
+                bar[code] += 1
+            pub.publish("price", {"code": code, "time_key": str(bar[code]), "close": price[code]})
+        await asyncio.sleep(0.05)
+    pub.close()
+    return pub.sent, pub.dropped
+
+
+async def main_async(args):
+    codes = [f"HK.{i:05d}" for i in range(args.codes)]
+    stats = Stats()
+    stop = asyncio.Event()
+    clients = [
+        asyncio.create_task(client(args.url, random.sample(codes, min(args.per_client, len(codes))), stats, stop))
+        for _ in range(args.clients)
+    ]
+    await asyncio.sleep(1.0)
+    pub_task = asyncio.create_task(publisher(args.bus_host, args.bus_port, codes, args.rate, stop))
+    await asyncio.sleep(args.seconds)
+    stop.set()
+    sent, dropped = await pub_task
+    await asyncio.gather(*clients)
+
+    lat = np.array(stats.latencies) * 1000 if stats.latencies else np.zeros(1)
+    print(f"客户端 {args.clients}，标的 {args.codes}，总线发送 {sent}（丢弃 {dropped}）")
+    print(f"收到帧 {stats.frames}，事件 {stats.events}，快照 {stats.snapshots}，连接错误 {stats.errors}")
+    print(f"延迟 ms：p50 {np.percentile(lat, 50):.1f}  p99 {np.percentile(lat, 99):.1f}  max {lat.max():.1f}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="面板 WebSocket 压测")
+    ap.add_argument("--url", default="ws://127.0.0.1:8000/ws")
+    ap.add_argument("--bus-host", default="127.0.0.1")
+    ap.add_argument("--bus-port", type=int, default=8765)
+    ap.add_argument("--clients", type=int, default=300)
+    ap.add_argument("--codes", type=int, default=200)
+    ap.add_argument("--per-client", type=int, default=10, help="每个客户端订阅的标的数")
+    ap.add_argument("--rate", type=int, default=2000, help="每秒总线消息数")
+    ap.add_argument("--seconds", type=float, default=20)
+    asyncio.run(main_async(ap.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
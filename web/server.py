@@ -1,27 +1,179 @@
-from fastapi import FastAPI, WebSocket
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+from starlette.middleware.gzip import GZipMiddleware
+from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 import json
+import os
+import sys
 
-app = FastAPI()
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    # 兼容 python web/server.py 直接运行
+    sys.path.insert(0, ROOT)
 
-# 存储最新行情和信号（全局变量，实际可用Redis/DB）
-latest_data = {"prices": [], "signal": None}
+from monitor.bus import BusSubscriber
+from monitor.metrics import render as render_metrics
+from monitor.signal_store import SignalStore, db_path_for
+from web.broadcast import Broadcaster
+from monitor.bar_archive import BarArchive
+from web.history import ArchiveHistorySource, FutuHistorySource, KlineHistory, signal_page
+
+CONFIG_PATH = os.environ.get("MONITOR_CONFIG", os.path.join(ROOT, "config.json"))
+MAX_PRICES = 500     # 每个标的保留的最近价格点数
+MAX_SIGNALS = 200    # 保留的最近信号条数
+
+# 存储最新行情和信号：扫描进程经消息总线推过来，在事件循环线程里更新
+#   prices/signal: 面板当前关注的标的（最近出信号的那个，没有则第一个收到的）
+#   codes: { code: {"time_key", "close", "prices", "periods", "signal"} }
+#   signals: 最近的最终信号
+latest_data = {"prices": [], "signal": None, "focus": None, "codes": {}, "signals": []}
+# 扫描进程每轮经总线发来的耗时统计（monitor.metrics 的累计快照），/metrics 输出
+latest_metrics = {}
+
+broadcaster = Broadcaster(latest_data)
+
+def load_config(path=CONFIG_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _code_state(code):
+    codes = latest_data["codes"]
+    if code not in codes:
+        codes[code] = {"time_key": None, "close": None, "prices": [], "periods": {}, "signal": None}
+        if latest_data["focus"] is None:
+            latest_data["focus"] = code
+    return codes[code]
+
+def apply_bus_messages(batch):
+    """把一批总线消息合并进 latest_data，返回受影响的标的列表"""
+    touched = []
+    for msg in batch:
+        data = msg.get("data") or {}
+        if msg.get("topic") == "metrics":
+            latest_metrics.clear()
+            latest_metrics.update(data)
+            continue
+        code = data.get("code")
+        if not code:
+            continue
+        st = _code_state(code)
+        topic = msg.get("topic")
+        if topic == "price":
+            # 同一根K线（形成中）覆盖最后一个点，新K线追加
+            if st["prices"] and st["time_key"] == data["time_key"]:
+                st["prices"][-1] = data["close"]
+            else:
+                st["prices"].append(data["close"])
+                del st["prices"][:-MAX_PRICES]
+            st["time_key"], st["close"] = data["time_key"], data["close"]
+        elif topic == "votes":
+            st["periods"] = data.get("periods", {})
+        elif topic == "signal":
+            st["signal"] = data
+            latest_data["signals"].append(data)
+            del latest_data["signals"][:-MAX_SIGNALS]
+            latest_data["focus"] = code
+            latest_data["signal"] = data.get("action")
+        else:
+            continue
+        if code not in touched:
+            touched.append(code)
+    focus = latest_data["focus"]
+    if focus is not None:
+        latest_data["prices"] = latest_data["codes"][focus]["prices"]
+    return touched
+
+def on_bus_batch(batch):
+    """事件循环线程：先更新状态，再把增量推给客户端"""
+    apply_bus_messages(batch)
+    broadcaster.broadcast(batch)
+
+@asynccontextmanager
+async def lifespan(app):
+    cfg = load_config()
+    broadcaster.queue_size = int(cfg.get("web", {}).get("ws_queue_size", broadcaster.queue_size))
+    bus_cfg = cfg.get("bus", {})
+    subscriber = None
+    if bus_cfg.get("enabled", False):
+        loop = asyncio.get_running_loop()
+        subscriber = BusSubscriber(bus_cfg.get("host", "127.0.0.1"), int(bus_cfg.get("port", 8765)))
+        # 订阅线程只收包，状态更新放回事件循环线程，避免与请求处理并发改 latest_data
+        subscriber.start(lambda batch: loop.call_soon_threadsafe(on_bus_batch, batch))
+    app.state.subscriber = subscriber
+
+    # 历史接口：K线优先读扫描进程写的本地归档，没有再从 OpenD 分页拉取（首次请求时才连接）；
+    # 信号读扫描进程写的 SQLite
+    web_cfg = cfg.get("web", {})
+    if getattr(app.state, "history", None) is None:
+        source = FutuHistorySource(cfg)
+        archive_cfg = cfg.get("archive", {})
+        if archive_cfg.get("enabled", False):
+            source = ArchiveHistorySource(BarArchive(os.path.join(ROOT, archive_cfg.get("path", "data/bars"))), source)
+        app.state.history = KlineHistory(
+            source,
+            view_ttl=float(web_cfg.get("history_cache_seconds", 30)),
+            max_bars=int(web_cfg.get("history_max_bars", 50000)),
+        )
+    if getattr(app.state, "signal_store", None) is None:
+        signal_csv = cfg.get("paths", {}).get("signal_csv", "data/signals.csv")
+        app.state.signal_store = SignalStore(db_path_for(os.path.join(ROOT, signal_csv)))
+    try:
+        yield
+    finally:
+        if subscriber is not None:
+            subscriber.close()
+
+app = FastAPI(lifespan=lifespan)
+# 历史接口的响应可能很大，超过 1KB 的按客户端 Accept-Encoding 压缩
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 @app.get("/")
 def index():
-    return FileResponse("web/static/index.html")
+    return FileResponse(os.path.join(ROOT, "web/static/index.html"))
 
 @app.get("/data")
 def get_data():
     return latest_data
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus 抓取：扫描进程的各阶段/单标的耗时直方图"""
+    return PlainTextResponse(render_metrics(latest_metrics), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/kline")
+def get_kline(code: str, period: str = "1h", start: str = None, end: str = None,
+              width: int = Query(1000, ge=10, le=20000), mode: str = "ohlc"):
+    """
+    K线历史：start/end 为 "YYYY-MM-DD[ HH:MM:SS]"，width 为目标点数（≈ 图表像素宽度）
+    mode: ohlc / lttb / minmax
+    """
+    try:
+        return app.state.history.query(code, period, start, end, width, mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+@app.get("/api/signals")
+def get_signals(code: str = None, start: int = None, end: int = None,
+                limit: int = Query(500, ge=1, le=5000), before_id: int = None):
+    """信号历史：start/end 为 Unix 秒；满页时用返回的 end=next_end&before_id=next_id 继续往前翻"""
+    return signal_page(app.state.signal_store, code, start, end, limit, before_id)
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    """连接后推快照，之后有变化就推增量；收到的消息只用于订阅/心跳，见 web/broadcast.py"""
     await websocket.accept()
-    while True:
-        await websocket.send_json(latest_data)
-        await websocket.receive_text()  # 保持连接心跳
+    client = broadcaster.register(websocket)
+    try:
+        while True:
+            broadcaster.handle_message(client, await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await broadcaster.unregister(client)
 
 def update_data(prices, signal):
     """在 main/trend 调用这个方法更新面板"""
@@ -29,4 +181,5 @@ def update_data(prices, signal):
     latest_data["signal"] = signal
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    web_cfg = load_config().get("web", {})
+    uvicorn.run(app, host=web_cfg.get("host", "0.0.0.0"), port=int(web_cfg.get("port", 8000)))